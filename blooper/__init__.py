@@ -1,6 +1,8 @@
 """
 A synthesizer/music generation tool
 """
+from blooper.asynchronous import render_async
+from blooper.caches import clear_caches
 from blooper.dynamics import AttackDecaySustainRelease, DynamicRange
 from blooper.instruments import Sampler, Synthesizer
 from blooper.keys import KEYS, Key
@@ -55,5 +57,7 @@ __all__ = (
     "Triplet",
     "Tuning",
     "Tuplet",
+    "clear_caches",
     "record",
+    "render_async",
 )
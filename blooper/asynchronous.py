@@ -0,0 +1,129 @@
+"""
+Render mixes from asyncio code without blocking the event loop
+"""
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import Executor
+from threading import Event, Lock
+from typing import Any, AsyncIterator, Iterator, Optional
+
+from blooper.mixers import Mixer
+from blooper.wavs import (
+    BITS_PER_SAMPLE,
+    CHUNK_SIZE,
+    SAMPLES_PER_SECOND,
+    _chunks,
+    _wav_chunks,
+)
+
+BUFFER_SIZE = 4  # chunks to render ahead of the consumer
+
+
+async def render_async(
+    mixer: Mixer,
+    sample_rate: int = SAMPLES_PER_SECOND,
+    *,
+    channels: int = 2,
+    bits_per_sample: int = BITS_PER_SAMPLE,
+    chunk_size: int = CHUNK_SIZE,
+    workers: Optional[int] = None,
+    header: bool = False,
+    buffer_size: int = BUFFER_SIZE,
+    executor: Optional[Executor] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Mix samples into little-endian PCM data, chunk_size frames at a
+    time, rendering in an executor so the event loop isn't blocked.
+
+    Rendering runs at most buffer_size chunks ahead of whatever is
+    consuming them, then waits. Closing the iterator early (or
+    cancelling the task consuming it) stops rendering once the chunk
+    currently being rendered is finished.
+
+    chunk_size: How many frames to produce at once
+    workers: If supplied, how many processes to render parts in (see
+        Mixer.blocks)
+    header: Start with a WAV header, so the chunks form a complete WAV
+        file (see wavs.stream)
+    buffer_size: How many chunks to render ahead
+    executor: Where to render. If not supplied, the event loop's
+        default executor is used.
+    """
+    if buffer_size < 1:
+        raise ValueError(f"Invalid buffer size: {buffer_size}")
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[Any] = asyncio.Queue(maxsize=buffer_size)
+    finished = object()
+
+    # chunks are only ever produced (or the generator closed) by one
+    # thread at a time
+    lock = Lock()
+    stopped = Event()
+    chunks: Optional[Iterator[bytes]] = None
+
+    def start() -> Iterator[bytes]:
+        if header:
+            _, wav_chunks = _wav_chunks(
+                mixer, channels, sample_rate, bits_per_sample, chunk_size, workers
+            )
+            return wav_chunks
+
+        return _chunks(
+            mixer, channels, sample_rate, bits_per_sample, chunk_size, workers
+        )
+
+    def step() -> Any:
+        nonlocal chunks
+
+        with lock:
+            if stopped.is_set():
+                return finished
+
+            if chunks is None:
+                chunks = start()
+
+            return next(chunks, finished)
+
+    def close():
+        with lock:
+            close_chunks = getattr(chunks, "close", None)
+
+            if close_chunks is not None:
+                close_chunks()
+
+    async def produce():
+        try:
+            while True:
+                chunk = await loop.run_in_executor(executor, step)
+                await queue.put(chunk)
+
+                if chunk is finished:
+                    return
+        except Exception as error:
+            # passed on to be raised by the consumer
+            await queue.put(error)
+
+    producer = asyncio.create_task(produce())
+
+    try:
+        while True:
+            chunk = await queue.get()
+
+            if chunk is finished:
+                break
+
+            if isinstance(chunk, Exception):
+                raise chunk
+
+            yield chunk
+    finally:
+        stopped.set()
+        producer.cancel()
+
+        # don't wait for the chunk being rendered to finish
+        loop.run_in_executor(executor, close)
+
+
+__all__ = ("render_async",)
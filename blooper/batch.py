@@ -0,0 +1,139 @@
+"""
+Render many sequences at once, spread across a pool of processes.
+
+A manifest is a JSON list of jobs (or an object with a "jobs" list),
+each of which looks like:
+
+    {"path": "a-b-c.wav", "args": ["--notes", "a3", "b3", "c4"]}
+
+where args are the sequencer's arguments (without the path). Jobs may
+also supply sample_rate, channels, and bits_per_sample. Relative
+paths are relative to the manifest.
+"""
+from __future__ import annotations
+
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from blooper.server import JobError, Renderer
+from blooper.wavs import BITS_PER_SAMPLE, HEADER_SIZE, SAMPLES_PER_SECOND, record
+
+# Each process keeps one renderer, so instruments, compiled parts, and
+# samples are reused by every job the process runs
+_RENDERER: Optional[Renderer] = None
+
+
+@dataclass(frozen=True)
+class BatchResult:
+    """
+    The outcome of a single job
+    """
+
+    index: int  # the job's position in the manifest
+    path: Optional[Path]
+    seconds: float
+    frames: Optional[int] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def load_manifest(path: Path) -> list[dict[str, Any]]:
+    """
+    Read the jobs from a manifest, resolving their paths relative to it
+    """
+    with path.open("r") as stream:
+        manifest = json.load(stream)
+
+    if isinstance(manifest, dict):
+        manifest = manifest.get("jobs")
+
+    if not isinstance(manifest, list):
+        raise ValueError(f"Manifest must contain a list of jobs: {path}")
+
+    jobs = []
+    for job in manifest:
+        if isinstance(job, dict) and isinstance(job.get("path"), str):
+            job = {**job, "path": str(path.parent / job["path"])}
+
+        jobs.append(job)
+
+    return jobs
+
+
+def run_batch(
+    jobs: list[dict[str, Any]], processes: Optional[int] = None
+) -> Iterator[BatchResult]:
+    """
+    Render each job, yielding results as jobs finish. Jobs that fail
+    don't stop the rest of the batch.
+
+    processes: How many processes to render in. If 1, jobs are rendered
+        in this process. If not supplied, one per CPU.
+    """
+    if processes == 1:
+        for index, job in enumerate(jobs):
+            yield render_job(index, job)
+
+        return
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [
+            pool.submit(render_job, index, job) for index, job in enumerate(jobs)
+        ]
+
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def render_job(index: int, job: Any) -> BatchResult:
+    """
+    Render a single job, capturing any error
+    """
+    global _RENDERER
+
+    if _RENDERER is None:
+        _RENDERER = Renderer()
+
+    start = time.perf_counter()
+    path = None
+
+    try:
+        if not isinstance(job, dict):
+            raise JobError("Jobs must be JSON objects")
+
+        if not isinstance(job.get("path"), str):
+            raise JobError("Jobs must supply a path")
+
+        path = Path(job["path"])
+        channels = int(job.get("channels", 2))
+        bits_per_sample = int(job.get("bits_per_sample", BITS_PER_SAMPLE))
+
+        record(
+            path,
+            _RENDERER.mixer(job.get("args")),
+            channels=channels,
+            sample_rate=int(job.get("sample_rate", SAMPLES_PER_SECOND)),
+            bits_per_sample=bits_per_sample,
+        )
+
+        size = path.stat().st_size - HEADER_SIZE
+        frames = size // (channels * bits_per_sample // 8)
+    except Exception as error:
+        return BatchResult(
+            index,
+            path,
+            time.perf_counter() - start,
+            error=f"{error.__class__.__name__}: {error}",
+        )
+
+    return BatchResult(index, path, time.perf_counter() - start, frames)
+
+
+__all__ = ("BatchResult", "load_manifest", "render_job", "run_batch")
@@ -0,0 +1,576 @@
+"""
+Benchmark each stage of the render pipeline.
+
+    python -m blooper.bench --measures 8 32 --concurrence 1 4
+
+Every combination of the supplied score lengths, chord sizes, part
+counts, sample rates, channels, and bit depths is timed, and each
+stage reports how many frames it got through a second and how much
+faster than real time that is. Results are written as JSON, and can be
+compared against an earlier run (see benchmarks/README.md).
+"""
+from __future__ import annotations
+
+import json
+import platform
+import sys
+import time
+from argparse import ArgumentParser
+from dataclasses import asdict, dataclass
+from fractions import Fraction
+from itertools import product
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Callable, Optional, Sequence
+
+from blooper.caches import SAMPLE_CACHE
+from blooper.dynamics import AttackDecaySustainRelease, DynamicRange
+from blooper.filetypes import UsageMetadata
+from blooper.instruments import Synthesizer
+from blooper.mixers import Mixer
+from blooper.notes import Note, Notes, Rest, Tone
+from blooper.parts import Measure, Part
+from blooper.pitch import A440, Chord, Pitch
+from blooper.version import __version__
+from blooper.waveforms import Waveform
+from blooper.wavs import SAMPLE_TYPECODES, WavSample, record
+
+# How much slower (as a fraction of the baseline's frames per second) a
+# stage can get before it's considered a regression
+TOLERANCE = 0.1
+
+PITCH_CLASSES = "CDEFGAB"
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """
+    The score and output format to benchmark with
+    """
+
+    measures: int  # how long each part is
+    concurrence: int  # how many pitches each note plays at once
+    parts: int
+    sample_rate: int
+    channels: int
+    bits_per_sample: int
+
+
+@dataclass(frozen=True)
+class Result:
+    """
+    The fastest of several runs of a stage
+    """
+
+    stage: str
+    scenario: dict[str, Optional[int]]  # parameters the stage doesn't use are None
+    frames: int  # frames of audio the stage handled
+    seconds: float
+
+    @property
+    def frames_per_second(self) -> float:
+        return self.frames / self.seconds
+
+    @property
+    def real_time_factor(self) -> float:
+        """
+        How many seconds of audio are handled each second
+        """
+        sample_rate = self.scenario["sample_rate"]
+        assert sample_rate is not None
+
+        return self.frames / sample_rate / self.seconds
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            **asdict(self),
+            "frames_per_second": self.frames_per_second,
+            "real_time_factor": self.real_time_factor,
+        }
+
+
+@dataclass(frozen=True)
+class Comparison:
+    """
+    How a result compares to the same stage & scenario in a baseline
+    """
+
+    result: Result
+    baseline_frames_per_second: float
+
+    @property
+    def ratio(self) -> float:
+        """
+        How many times as fast the stage is now (below 1 is slower)
+        """
+        return self.result.frames_per_second / self.baseline_frames_per_second
+
+    def regressed(self, tolerance: float = TOLERANCE) -> bool:
+        return self.ratio < 1 - tolerance
+
+
+# Each stage takes a scenario and a scratch directory, does any set up
+# that shouldn't be timed, and returns a function that runs the stage
+# once and how many frames that function handles
+Stage = Callable[[Scenario, Path], tuple[Callable[[], Any], int]]
+
+
+def score(scenario: Scenario) -> list[Part]:
+    """
+    Write a score for a scenario: each part walks up the scale in
+    quarter notes, playing chords stacked in thirds
+    """
+    parts = []
+
+    for part_index in range(scenario.parts):
+        measures: list[Measure | list[Note | Rest | Notes]] = []
+
+        for measure_index in range(scenario.measures):
+            notes: list[Note | Rest | Notes] = []
+
+            for beat in range(4):
+                root = (measure_index * 4 + beat) % len(PITCH_CLASSES)
+                pitches = []
+
+                for step in range(scenario.concurrence):
+                    degree = root + step * 2
+                    pitches.append(
+                        Pitch(
+                            3 + part_index % 3 + degree // len(PITCH_CLASSES),
+                            PITCH_CLASSES[degree % len(PITCH_CLASSES)],
+                        )
+                    )
+
+                pitch: Pitch | Chord = pitches[0]
+                if len(pitches) > 1:
+                    pitch = Chord(*pitches)
+
+                notes.append(Note.new(Fraction(1, 4), pitch))
+
+            measures.append(notes)
+
+        parts.append(Part(measures))
+
+    return parts
+
+
+def build_mixer(scenario: Scenario) -> Mixer:
+    """
+    A mix of the scenario's score that renders every note from scratch
+    """
+    return Mixer.even(
+        *[(Synthesizer("saw", note_cache=None), part) for part in score(scenario)]
+    )
+
+
+def _tones(scenario: Scenario) -> list[tuple[int, Tone]]:
+    return [
+        (duration, tone)
+        for part in score(scenario)
+        for _, duration, tone in part.tones(scenario.sample_rate)
+    ]
+
+
+def _frame_count(mixer: Mixer, sample_rate: int) -> int:
+    frames = mixer.frame_count(sample_rate)
+    assert frames is not None
+
+    return frames
+
+
+def bench_tones(scenario: Scenario, directory: Path) -> tuple[Callable[[], Any], int]:
+    parts = score(scenario)
+    sample_rate = scenario.sample_rate
+
+    def run():
+        for part in parts:
+            for _ in part.tones(sample_rate):
+                pass
+
+    return run, _frame_count(build_mixer(scenario), sample_rate)
+
+
+def bench_waveform(
+    scenario: Scenario, directory: Path
+) -> tuple[Callable[[], Any], int]:
+    sample_rate = scenario.sample_rate
+    tones = [
+        (duration, [A440.pitch_to_frequency(pitch) for pitch in tone.pitches])
+        for duration, tone in _tones(scenario)
+    ]
+
+    def run():
+        for duration, frequencies in tones:
+            for frequency in frequencies:
+                Waveform(frequency, sample_rate, wave="saw").samples(duration)
+
+    # one wave for every pitch of every tone
+    return run, sum(duration * len(frequencies) for duration, frequencies in tones)
+
+
+def bench_envelope(
+    scenario: Scenario, directory: Path
+) -> tuple[Callable[[], Any], int]:
+    sample_rate = scenario.sample_rate
+    envelope = AttackDecaySustainRelease(DynamicRange())
+    tones = _tones(scenario)
+
+    def run():
+        for duration, tone in tones:
+            for _ in envelope.volumes(tone, duration, sample_rate):
+                pass
+
+    # every tone's envelope, release included
+    return run, sum(
+        envelope.length(tone, duration, sample_rate) for duration, tone in tones
+    )
+
+
+def bench_mix(scenario: Scenario, directory: Path) -> tuple[Callable[[], Any], int]:
+    mixer = build_mixer(scenario)
+    max_value = 2 ** (scenario.bits_per_sample - 1) - 1
+
+    def run():
+        for _ in mixer.mix(scenario.sample_rate, scenario.channels, max_value):
+            pass
+
+    return run, _frame_count(mixer, scenario.sample_rate)
+
+
+def bench_load(scenario: Scenario, directory: Path) -> tuple[Callable[[], Any], int]:
+    path = directory / "sample.wav"
+    mixer = build_mixer(scenario)
+    frames = _frame_count(mixer, scenario.sample_rate)
+
+    record(
+        path,
+        mixer,
+        channels=scenario.channels,
+        sample_rate=scenario.sample_rate,
+        bits_per_sample=scenario.bits_per_sample,
+    )
+
+    sample = WavSample(path, UsageMetadata(A440.pitch_to_frequency(Pitch(4, "A"))))
+    volumes = [1.0] * frames
+
+    def run():
+        # time decoding the file, not reading it back out of the cache
+        SAMPLE_CACHE.clear()
+
+        for _ in sample.load(scenario.sample_rate, volumes):
+            pass
+
+    return run, frames
+
+
+def bench_record(scenario: Scenario, directory: Path) -> tuple[Callable[[], Any], int]:
+    path = directory / "record.wav"
+    mixer = build_mixer(scenario)
+
+    def run():
+        record(
+            path,
+            mixer,
+            channels=scenario.channels,
+            sample_rate=scenario.sample_rate,
+            bits_per_sample=scenario.bits_per_sample,
+        )
+
+    return run, _frame_count(mixer, scenario.sample_rate)
+
+
+# Each stage along with the scenario parameters it depends on. Stages
+# are only run once for scenarios that differ by parameters they don't
+# use.
+STAGES: dict[str, tuple[Stage, tuple[str, ...]]] = {
+    "Part.tones": (bench_tones, ("measures", "concurrence", "parts", "sample_rate")),
+    "Waveform.samples": (
+        bench_waveform,
+        ("measures", "concurrence", "parts", "sample_rate"),
+    ),
+    "AttackDecaySustainRelease.volumes": (
+        bench_envelope,
+        ("measures", "concurrence", "parts", "sample_rate"),
+    ),
+    "Mixer.mix": (
+        bench_mix,
+        (
+            "measures",
+            "concurrence",
+            "parts",
+            "sample_rate",
+            "channels",
+            "bits_per_sample",
+        ),
+    ),
+    "WavSample.load": (
+        bench_load,
+        (
+            "measures",
+            "concurrence",
+            "parts",
+            "sample_rate",
+            "channels",
+            "bits_per_sample",
+        ),
+    ),
+    "wavs.record": (
+        bench_record,
+        (
+            "measures",
+            "concurrence",
+            "parts",
+            "sample_rate",
+            "channels",
+            "bits_per_sample",
+        ),
+    ),
+}
+
+
+def run_benchmarks(
+    scenarios: Sequence[Scenario],
+    stages: Optional[Sequence[str]] = None,
+    *,
+    repeat: int = 3,
+) -> list[Result]:
+    """
+    Time each stage for each scenario, keeping the fastest of repeat
+    runs
+
+    stages: If supplied, only run these stages (see STAGES)
+    repeat: How many times to run each stage
+    """
+    if stages is None:
+        stages = list(STAGES)
+
+    for stage in stages:
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage: {stage}")
+
+    if repeat < 1:
+        raise ValueError(f"Must repeat at least once: {repeat}")
+
+    results = []
+    seen = set()
+
+    with TemporaryDirectory() as directory_name:
+        directory = Path(directory_name)
+
+        for scenario in scenarios:
+            for stage in stages:
+                bench, parameters = STAGES[stage]
+                used = {
+                    name: (value if name in parameters else None)
+                    for name, value in asdict(scenario).items()
+                }
+
+                key = (stage, tuple(used.items()))
+                if key in seen:
+                    continue
+                seen.add(key)
+
+                run, frames = bench(scenario, directory)
+                best = None
+
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    run()
+                    seconds = time.perf_counter() - start
+
+                    if best is None or seconds < best:
+                        best = seconds
+
+                assert best is not None
+                results.append(Result(stage, used, frames, best))
+
+    return results
+
+
+def to_json(results: Sequence[Result]) -> dict[str, Any]:
+    """
+    A JSON-serializable report of a run
+    """
+    return {
+        "version": __version__,
+        "python": platform.python_version(),
+        "results": [result.to_json() for result in results],
+    }
+
+
+def compare(results: Sequence[Result], baseline: dict[str, Any]) -> list[Comparison]:
+    """
+    Match results against those in a report (see to_json). Results
+    without a match in the baseline are skipped.
+    """
+    previous = {
+        (entry["stage"], tuple(sorted(entry["scenario"].items()))): entry
+        for entry in baseline.get("results", [])
+    }
+
+    comparisons = []
+    for result in results:
+        entry = previous.get((result.stage, tuple(sorted(result.scenario.items()))))
+
+        if entry is not None:
+            comparisons.append(Comparison(result, entry["frames_per_second"]))
+
+    return comparisons
+
+
+def describe(result: Result) -> str:
+    parameters = ", ".join(
+        f"{name}={value}"
+        for name, value in result.scenario.items()
+        if value is not None
+    )
+
+    return f"{result.stage} ({parameters})"
+
+
+def main(input_args: Optional[list[str]] = None):
+    parser = ArgumentParser(
+        prog="python -m blooper.bench",
+        description="Benchmark each stage of the render pipeline",
+    )
+    parser.add_argument(
+        "--measures",
+        type=int,
+        nargs="+",
+        default=[8],
+        help="How many measures long each part is",
+    )
+    parser.add_argument(
+        "--concurrence",
+        type=int,
+        nargs="+",
+        default=[1, 3],
+        help="How many pitches each note plays",
+    )
+    parser.add_argument(
+        "--parts",
+        type=int,
+        nargs="+",
+        default=[1, 2],
+        help="How many parts to mix",
+    )
+    parser.add_argument(
+        "--sample-rate",
+        type=int,
+        nargs="+",
+        default=[44_100],
+        help="Samples per second",
+    )
+    parser.add_argument(
+        "--channels",
+        type=int,
+        nargs="+",
+        choices=(1, 2),
+        default=[2],
+        help="How many channels of audio to output",
+    )
+    parser.add_argument(
+        "--bits-per-sample",
+        type=int,
+        nargs="+",
+        choices=sorted(SAMPLE_TYPECODES),
+        default=[16],
+        help="The bit depth of the output",
+    )
+    parser.add_argument(
+        "--stage",
+        nargs="+",
+        choices=list(STAGES),
+        help="Only run these stages",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="How many times to run each stage (the fastest run is kept)",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="Where to write results (default: stdout)",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        help="Compare against the results of an earlier run",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=TOLERANCE,
+        help=(
+            "How much slower (as a fraction) than the baseline a stage can "
+            "be before failing"
+        ),
+    )
+
+    args = parser.parse_args(input_args)
+
+    scenarios = [
+        Scenario(*values)
+        for values in product(
+            args.measures,
+            args.concurrence,
+            args.parts,
+            args.sample_rate,
+            args.channels,
+            args.bits_per_sample,
+        )
+    ]
+
+    results = run_benchmarks(scenarios, args.stage, repeat=args.repeat)
+
+    for result in results:
+        print(
+            f"{describe(result)}: "
+            f"{result.frames_per_second:,.0f} frames/s, "
+            f"{result.real_time_factor:,.1f}x real time",
+            file=sys.stderr,
+        )
+
+    report = json.dumps(to_json(results), indent=2)
+
+    if args.output is None:
+        print(report)
+    else:
+        args.output.write_text(report + "\n")
+
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text())
+        comparisons = compare(results, baseline)
+        regressions = 0
+
+        for comparison in comparisons:
+            regressed = comparison.regressed(args.tolerance)
+            regressions += regressed
+
+            print(
+                f"{describe(comparison.result)}: {comparison.ratio:.2f}x baseline"
+                + (" (regression)" if regressed else ""),
+                file=sys.stderr,
+            )
+
+        if regressions:
+            print(f"{regressions} regression(s)", file=sys.stderr)
+            sys.exit(1)
+
+
+__all__ = (
+    "Comparison",
+    "Result",
+    "Scenario",
+    "STAGES",
+    "compare",
+    "run_benchmarks",
+    "score",
+    "to_json",
+)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,443 @@
+"""
+Caches shared across instruments so that expensive work (e.g.,
+decoding sample files, rendering notes) only needs to be done once per
+process.
+"""
+from __future__ import annotations
+
+import sys
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import wraps
+from threading import Lock
+from typing import Any, Callable, Hashable, NamedTuple, Optional, TypeVar, cast
+from weakref import WeakSet, ref
+
+from blooper.metrics import METRICS
+
+Function = TypeVar("Function", bound=Callable[..., Any])
+
+# How many bytes of decoded samples to hold on to by default
+SAMPLE_CACHE_BYTES = 256 * 1024 * 1024
+
+# How many bytes of rendered notes to hold on to by default
+NOTE_CACHE_BYTES = 64 * 1024 * 1024
+
+# How many bytes of wavetables to hold on to by default
+WAVETABLE_CACHE_BYTES = 16 * 1024 * 1024
+
+# How many results of each cached method to hold on to (per instance)
+# by default
+METHOD_CACHE_ENTRIES = 4_096
+
+
+def sizeof(value: Any) -> int:
+    """
+    Approximate how many bytes a cached value occupies. Arrays and
+    bytes are measured by their contents, tuples and lists by their
+    elements.
+    """
+    if isinstance(value, array):
+        return len(value) * value.itemsize
+
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(element) for element in value)
+
+    return sys.getsizeof(value)
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    """
+    A snapshot of how a cache has been used
+    """
+
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    size: int  # in bytes
+    max_size: int  # in bytes
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        The fraction of lookups that found a value (0 if there haven't
+        been any lookups)
+        """
+        lookups = self.hits + self.misses
+
+        return self.hits / lookups if lookups else 0.0
+
+
+class LRUCache:
+    """
+    A thread-safe mapping that holds on to values until their combined
+    size exceeds a byte budget, at which point the least-recently used
+    values are discarded.
+
+    Pickling a cache produces an empty cache with the same budget (so
+    objects holding caches can be sent to other processes).
+    """
+
+    def __init__(self, max_size: int, *, size: Callable[[Any], int] = sizeof):
+        """
+        max_size: How many bytes the cache may hold
+        size: A function that determines how many bytes a value uses
+        """
+        if max_size < 0:
+            raise ValueError(f"Invalid cache size: {max_size}")
+
+        self.max_size = max_size
+        self._size_of = size
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get a value from the cache, marking it as recently used
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None):
+        """
+        Add a value to the cache, evicting older values if necessary.
+        Values larger than the entire cache aren't stored.
+
+        size: How many bytes the value uses. If not supplied, it will be
+            calculated.
+        """
+        if size is None:
+            size = self._size_of(value)
+
+        with self._lock:
+            self._remove(key)
+
+            if size > self.max_size:
+                return
+
+            self._entries[key] = (value, size)
+            self._size += size
+            self._evict()
+
+    def get_or_put(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        """
+        Get a value from the cache, calculating (and storing) it if it
+        isn't already present.
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+
+        if value is sentinel:
+            value = function()
+            self.put(key, value)
+
+        return value
+
+    def resize(self, max_size: int):
+        """
+        Change how many bytes the cache may hold, evicting values if the
+        cache is now too full.
+        """
+        if max_size < 0:
+            raise ValueError(f"Invalid cache size: {max_size}")
+
+        with self._lock:
+            self.max_size = max_size
+            self._evict()
+
+    def clear(self):
+        """
+        Remove all values from the cache and reset its counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                self.hits,
+                self.misses,
+                self.evictions,
+                len(self._entries),
+                self._size,
+                self.max_size,
+            )
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+
+        if entry is not None:
+            self._size -= entry[1]
+
+    def _evict(self):
+        while self._size > self.max_size:
+            _, (_, size) = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"max_size": self.max_size, "size": self._size_of}
+
+    def __setstate__(self, state: dict[str, Any]):
+        self.__init__(state["max_size"], size=state["size"])  # type: ignore
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.max_size})"
+
+
+class CacheInfo(NamedTuple):
+    """
+    How a cached function is being used, in the same shape as
+    functools.cache's cache_info
+    """
+
+    hits: int
+    misses: int
+    maxsize: int  # per instance, for methods
+    currsize: int
+
+
+def _one_entry(value: Any) -> int:
+    """
+    Measure caches by how many values they hold rather than their size
+    """
+    return 1
+
+
+def _dropped() -> None:
+    return None
+
+
+class _ResultCache(LRUCache):
+    """
+    The results of a cached function (or of a cached method for a
+    single instance). Rather than becoming an empty cache when pickled
+    (or deep copied), these become None, so that whatever is unpickled
+    gets a new cache that clear_caches knows about.
+
+    Shallow copies share their original's attributes, so method caches
+    also remember which instance they belong to. A copy (which may then
+    be changed) starts a cache of its own the first time it's used.
+    """
+
+    owner: Optional[ref] = None
+
+    def __reduce__(self) -> tuple:
+        return (_dropped, ())
+
+
+class CachedCallable:
+    """
+    Keeps track of the caches of a function or method wrapped by
+    cached_function or cached_method, so they can be inspected, resized,
+    and cleared.
+    """
+
+    def __init__(self, max_entries: int):
+        if max_entries < 0:
+            raise ValueError(f"Invalid cache size: {max_entries}")
+
+        self.max_entries = max_entries
+        self._caches: WeakSet[LRUCache] = WeakSet()
+        self._lock = Lock()
+
+        _CACHED_CALLABLES.append(self)
+
+    def new_cache(self, owner: Any = None) -> _ResultCache:
+        """
+        Create a cache for another instance
+
+        owner: The instance the cache belongs to (if any)
+        """
+        with self._lock:
+            cache = _ResultCache(self.max_entries, size=_one_entry)
+            self._caches.add(cache)
+
+        if owner is not None:
+            cache.owner = ref(owner)
+
+        return cache
+
+    def cache_info(self) -> CacheInfo:
+        """
+        How the caches of every instance still in use have been used
+        """
+        with self._lock:
+            stats = [cache.stats() for cache in self._caches]
+
+        return CacheInfo(
+            sum(cache.hits for cache in stats),
+            sum(cache.misses for cache in stats),
+            self.max_entries,
+            sum(cache.entries for cache in stats),
+        )
+
+    def cache_resize(self, max_entries: int):
+        """
+        Change how many results each instance may hold on to, evicting
+        the least-recently used results of any over the limit
+        """
+        if max_entries < 0:
+            raise ValueError(f"Invalid cache size: {max_entries}")
+
+        with self._lock:
+            self.max_entries = max_entries
+
+            for cache in self._caches:
+                cache.resize(max_entries)
+
+    def cache_clear(self):
+        """
+        Discard every cached result
+        """
+        with self._lock:
+            for cache in self._caches:
+                cache.clear()
+
+    def wrap(self, wrapper: Function) -> Function:
+        """
+        Give a wrapped function functools.cache's methods
+        """
+        wrapper.cache_info = self.cache_info  # type: ignore[attr-defined]
+        wrapper.cache_clear = self.cache_clear  # type: ignore[attr-defined]
+        wrapper.cache_resize = self.cache_resize  # type: ignore[attr-defined]
+
+        return wrapper
+
+
+# Every cached function and method, for clear_caches
+_CACHED_CALLABLES: list[CachedCallable] = []
+
+
+def cached_method(
+    max_entries: int = METHOD_CACHE_ENTRIES,
+) -> Callable[[Function], Function]:
+    """
+    Cache a method's results, keeping the max_entries most-recently
+    used results for each instance.
+
+    Unlike functools.cache, results are stored on the instance itself,
+    so instances (and their results) can be freed once they're no
+    longer used. Copies of an instance don't share its results. The
+    method's arguments must be hashable. The wrapped
+    method also gets cache_info, cache_clear, and cache_resize, which
+    apply to every instance.
+    """
+
+    def decorate(method: Function) -> Function:
+        cached = CachedCallable(max_entries)
+        attribute = f"_{method.__name__}_cache"
+
+        @wraps(method)
+        def wrapper(self, *args: Any, **kwargs: Any) -> Any:
+            # bypasses __setattr__ so frozen dataclasses can be cached
+            cache = self.__dict__.get(attribute)
+
+            # copies share the original's cache until they get their own
+            if cache is None or cache.owner is None or cache.owner() is not self:
+                cache = self.__dict__[attribute] = cached.new_cache(self)
+
+            key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+
+            return cache.get_or_put(key, lambda: method(self, *args, **kwargs))
+
+        return cached.wrap(cast(Function, wrapper))
+
+    return decorate
+
+
+def cached_function(
+    max_entries: int = METHOD_CACHE_ENTRIES,
+) -> Callable[[Function], Function]:
+    """
+    Cache a function's results, keeping the max_entries most-recently
+    used. The wrapped function gets cache_info, cache_clear, and
+    cache_resize, like cached_method.
+    """
+
+    def decorate(function: Function) -> Function:
+        cached = CachedCallable(max_entries)
+        cache = cached.new_cache()
+
+        @wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+
+            return cache.get_or_put(key, lambda: function(*args, **kwargs))
+
+        return cached.wrap(cast(Function, wrapper))
+
+    return decorate
+
+
+def clear_caches():
+    """
+    Empty every cache: the shared caches (decoded samples, rendered
+    notes, and wavetables) and the results of every cached function and
+    method
+    """
+    for shared in (SAMPLE_CACHE, NOTE_CACHE, WAVETABLE_CACHE):
+        shared.clear()
+
+    for cached in _CACHED_CALLABLES:
+        cached.cache_clear()
+
+
+# Decoded samples, shared by all sample files in the process
+SAMPLE_CACHE = LRUCache(SAMPLE_CACHE_BYTES)
+
+# Rendered notes, shared by all instruments in the process
+NOTE_CACHE = LRUCache(NOTE_CACHE_BYTES)
+
+# Sampled wave functions, shared by all waveforms in the process
+WAVETABLE_CACHE = LRUCache(WAVETABLE_CACHE_BYTES)
+
+METRICS.register_cache("notes", NOTE_CACHE)
+METRICS.register_cache("samples", SAMPLE_CACHE)
+METRICS.register_cache("wavetables", WAVETABLE_CACHE)
+
+
+__all__ = (
+    "NOTE_CACHE",
+    "SAMPLE_CACHE",
+    "WAVETABLE_CACHE",
+    "CacheInfo",
+    "CacheStats",
+    "LRUCache",
+    "cached_function",
+    "cached_method",
+    "clear_caches",
+    "sizeof",
+)
@@ -1,8 +1,11 @@
 """
 Run blooper from the command line
 """
+import json
 import re
-from argparse import ArgumentParser
+import sys
+import time
+from argparse import ArgumentParser, Namespace
 from fractions import Fraction
 from pathlib import Path
 from typing import Optional
@@ -32,6 +35,7 @@ from blooper import (
 from blooper.notes import Notes
 from blooper.pitch import ARAB_SCALE, BOHLEN_PIERCE_SCALE, CHROMATIC_SCALE
 from blooper.waveforms import WAVES
+from blooper.wavs import stream
 
 DEFAULT_TEMPO = Tempo.ALLEGRO
 DEFAULT_DYNAMIC = Dynamic.from_name("mezzo-forte")
@@ -41,6 +45,8 @@ DEFAULT_WAVE = "sine"
 DEFAULT_PITCH = Pitch(4, "A")
 DEFAULT_FREQUENCY = 440
 DEFAULT_SCALE = CHROMATIC_SCALE
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8_180
 
 
 def main(input_args: Optional[list[str]] = None):
@@ -51,8 +57,132 @@ def main(input_args: Optional[list[str]] = None):
     commands = parser.add_subparsers(dest="command", required=True)
 
     sequencer = commands.add_parser("sequencer", help="A (very basic) step sequencer")
-    sequencer.add_argument("path", type=Path, help="Where to save the output.")
     sequencer.add_argument(
+        "path", type=Path, help="Where to save the output ('-' for stdout)."
+    )
+    add_sequence_arguments(sequencer)
+    sequencer.add_argument(
+        "--workers",
+        type=int,
+        help="Render each part in a separate process, using up to this many at once",
+    )
+
+    server = commands.add_parser(
+        "serve", help="Run a local server that renders sequences on request"
+    )
+    server.add_argument(
+        "--host",
+        default=DEFAULT_HOST,
+        help=f"The address to listen on. Defaults to {DEFAULT_HOST}",
+    )
+    server.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help=f"The port to listen on. Defaults to {DEFAULT_PORT}",
+    )
+    server.add_argument(
+        "--socket",
+        type=Path,
+        help="Listen on a Unix socket at this path instead of a port",
+    )
+    server.add_argument(
+        "--workers",
+        type=int,
+        help="Render each part in a separate process, using up to this many at once",
+    )
+
+    batch = commands.add_parser(
+        "batch", help="Render every sequence in a manifest using a pool of processes"
+    )
+    batch.add_argument("manifest", type=Path, help="A JSON file listing jobs to render")
+    batch.add_argument(
+        "--jobs",
+        type=int,
+        help="How many jobs to render at once. Defaults to one per CPU",
+    )
+    batch.add_argument(
+        "--report",
+        type=Path,
+        help="Where to save the timing and outcome of each job (as JSON)",
+    )
+
+    args = parser.parse_args(input_args)
+
+    if args.command == "batch":
+        run_batch_command(args.manifest, args.jobs, args.report)
+        return
+
+    if args.command == "serve":
+        # the server builds its mixers with the functions below
+        from blooper.server import make_server
+
+        with make_server(
+            args.host, args.port, socket_path=args.socket, workers=args.workers
+        ) as running:
+            running.serve_forever()
+
+        return
+
+    mixer = build_mixer(args)
+
+    if args.path == Path("-"):
+        stream(sys.stdout.buffer, mixer, workers=args.workers)
+    else:
+        record(args.path, mixer, workers=args.workers)
+
+
+def run_batch_command(manifest: Path, jobs: Optional[int], report: Optional[Path]):
+    """
+    Render every job in a manifest, printing how each went. Exits with
+    an error if any job failed (once every job has been tried).
+    """
+    # the batch runner builds its mixers with the functions below
+    from blooper.batch import load_manifest, run_batch
+
+    start = time.perf_counter()
+    results = []
+
+    for result in run_batch(load_manifest(manifest), jobs):
+        results.append(result)
+
+        if result.ok:
+            print(f"ok {result.path} ({result.seconds:.3f}s, {result.frames} frames)")
+        else:
+            print(f"failed job {result.index} ({result.path}): {result.error}")
+
+    failures = sum(not result.ok for result in results)
+    print(
+        f"{len(results) - failures} rendered, {failures} failed "
+        f"in {time.perf_counter() - start:.3f}s"
+    )
+
+    if report is not None:
+        with report.open("w") as stream:
+            json.dump(
+                [
+                    {
+                        "index": result.index,
+                        "path": None if result.path is None else str(result.path),
+                        "seconds": result.seconds,
+                        "frames": result.frames,
+                        "error": result.error,
+                    }
+                    for result in sorted(results, key=lambda result: result.index)
+                ],
+                stream,
+                indent=2,
+            )
+
+    if failures:
+        sys.exit(1)
+
+
+def add_sequence_arguments(parser: ArgumentParser):
+    """
+    Add the arguments describing what the sequencer should play
+    """
+    parser.add_argument(
         "--notes",
         action="append",
         required=True,
@@ -60,70 +190,70 @@ def main(input_args: Optional[list[str]] = None):
         type=parse_note,
         help="The notes to play",
     )
-    sequencer.add_argument(
+    parser.add_argument(
         "--tempo",
         action="append",
         type=int,
         help=f"How many beats (steps) to play in a minute. Defaults to {DEFAULT_TEMPO}",
     )
-    sequencer.add_argument(
+    parser.add_argument(
         "--dynamic",
         action="append",
         type=Dynamic.from_name,
         help="How loud the sequencer should play",
     )
-    sequencer.add_argument(
+    parser.add_argument(
         "-d",
         dest="dynamic",
         action="append",
         type=Dynamic.from_symbol,
         help="How loud the sequencer should play",
     )
-    sequencer.add_argument(
+    parser.add_argument(
         "--key",
         action="append",
         type=parse_key,
         help="The key to use",
     )
-    sequencer.add_argument(
+    parser.add_argument(
         "--loops",
         action="append",
         type=int,
         help="How many times to play through the sequenced notes",
     )
-    sequencer.add_argument(
+    parser.add_argument(
         "--wave",
         action="append",
         choices=WAVES.keys(),
         help=f"Kind of instrument to use. Defaults to {DEFAULT_WAVE}",
     )
-    sequencer.add_argument(
+    parser.add_argument(
         "--tuning-pitch",
         action="append",
         type=parse_pitch,
         help=f"The pitch to tune to. Defaults to {DEFAULT_PITCH}",
     )
-    sequencer.add_argument(
+    parser.add_argument(
         "--tuning-frequency",
         action="append",
         type=float,
         help=f"The frequency to tune to. Defaults to {DEFAULT_FREQUENCY}",
     )
-    sequencer.add_argument(
+    parser.add_argument(
         "--chromatic",
         dest="scale",
         action="append_const",
         const=CHROMATIC_SCALE,
         help="Use a chromatic scale (this is the default)",
     )
-    sequencer.add_argument(
+    parser.add_argument(
         "--arab",
         dest="scale",
         action="append_const",
         const=ARAB_SCALE,
         help="Use a Arab scale",
     )
-    sequencer.add_argument(
+    parser.add_argument(
         "--bohlen-pierce",
         dest="scale",
         action="append_const",
@@ -131,8 +261,12 @@ def main(input_args: Optional[list[str]] = None):
         help="Use a Bohlen-Pierce Scale",
     )
 
-    args = parser.parse_args()
 
+def build_mixer(args: Namespace) -> Mixer:
+    """
+    Build the mix described by a set of sequence arguments (see
+    add_sequence_arguments)
+    """
     if args.tempo is None:
         args.tempo = [DEFAULT_TEMPO]
 
@@ -237,7 +371,7 @@ def main(input_args: Optional[list[str]] = None):
             )
         )
 
-    record(args.path, Mixer.even(*inputs))
+    return Mixer.even(*inputs)
 
 
 def parse_key(name: str) -> Key:
@@ -3,10 +3,12 @@ Conversions from Dynamics to absolute volumes
 """
 
 from abc import ABC, abstractmethod
+from array import array
 from fractions import Fraction
-from functools import cache
 from typing import Any, Generator, Optional, cast
 
+from blooper.caches import cached_method
+from blooper.metrics import METRICS
 from blooper.notes import Accent, Dynamic, Tone
 
 
@@ -64,7 +66,7 @@ class DynamicRange:
         if self.full == self.maximum and full_output != maximum_output:
             raise ValueError("full and maximum dynamics match but volumes don't")
 
-    # needed because we provide __eq__ + use @cache?
+    # needed because we provide __eq__
     def __hash__(self) -> int:
         return hash(
             (
@@ -90,7 +92,7 @@ class DynamicRange:
 
         return NotImplemented
 
-    @cache
+    @cached_method()
     def volume(self, dynamic: Dynamic) -> float:
         """
         Get the volume associated with a dynamic
@@ -150,6 +152,54 @@ class Envelope(ABC):
             didn't finish before the current tone is set to start)
         """
 
+    def render(
+        self, tone: Tone, duration: int, sample_rate: int, start: float = 0
+    ) -> array:
+        """
+        Determine the amplitudes of each sample all at once. Returns the
+        same values volumes would produce as an array("d").
+
+        tone: The tone to produce amplitudes for.
+        sample_rate: How many samples are being produced a second.
+        start: The starting amplitude
+        """
+        return array("d", self.volumes(tone, duration, sample_rate, start))
+
+    def length(
+        self, tone: Tone, duration: int, sample_rate: int, start: float = 0
+    ) -> int:
+        """
+        How many amplitudes render would produce, ideally worked out
+        without producing them.
+
+        tone: The tone to produce amplitudes for.
+        sample_rate: How many samples are being produced a second.
+        start: The starting amplitude
+        """
+        return len(self.render(tone, duration, sample_rate, start))
+
+    def volume_at(
+        self,
+        tone: Tone,
+        duration: int,
+        sample_rate: int,
+        start: float,
+        index: int,
+    ) -> float:
+        """
+        The amplitude render would produce for a single sample (0 if the
+        index is past the end), ideally worked out without producing the
+        others.
+
+        tone: The tone to produce amplitudes for.
+        sample_rate: How many samples are being produced a second.
+        start: The starting amplitude
+        index: The (0-indexed) sample to find the amplitude of
+        """
+        rendered = self.render(tone, duration, sample_rate, start)
+
+        return rendered[index] if index < len(rendered) else 0.0
+
 
 class Homogeneous(Envelope):
     """
@@ -163,6 +213,15 @@ class Homogeneous(Envelope):
     def __init__(self, dynamics: DynamicRange):
         self._dynamics = dynamics
 
+    def __hash__(self) -> int:
+        return hash(self.dynamics)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Homogeneous):
+            return self.dynamics == other.dynamics
+
+        return NotImplemented
+
     @property
     def dynamics(self) -> DynamicRange:
         return self._dynamics
@@ -170,10 +229,36 @@ class Homogeneous(Envelope):
     def volumes(
         self, tone: Tone, duration: int, sample_rate: int, start: float = 0
     ) -> Generator[float, None, None]:
-        volume = self.dynamics.volume(tone.dynamic)
+        volume = self.dynamics.volume(cast(Dynamic, tone.dynamic))
         for _ in range(duration):
             yield volume
 
+    def render(
+        self, tone: Tone, duration: int, sample_rate: int, start: float = 0
+    ) -> array:
+        return (
+            array("d", [self.dynamics.volume(cast(Dynamic, tone.dynamic))]) * duration
+        )
+
+    def length(
+        self, tone: Tone, duration: int, sample_rate: int, start: float = 0
+    ) -> int:
+        return duration
+
+    def volume_at(
+        self,
+        tone: Tone,
+        duration: int,
+        sample_rate: int,
+        start: float,
+        index: int,
+    ) -> float:
+        return (
+            self.dynamics.volume(cast(Dynamic, tone.dynamic))
+            if index < duration
+            else 0.0
+        )
+
 
 class AttackDecaySustainRelease(Envelope):
     """
@@ -261,6 +346,20 @@ class AttackDecaySustainRelease(Envelope):
         self.accent_peak = accent_peak
         self.accent_sustain_level = accent_sustain_level
 
+    def __hash__(self) -> int:
+        return hash(
+            (
+                self.dynamics,
+                self.attack,
+                self.decay,
+                self.release,
+                self.sustain_level,
+                self.accent_multiplier,
+                self.accent_peak,
+                self.accent_sustain_level,
+            )
+        )
+
     def __eq__(self, other: Any) -> bool:
         if isinstance(other, AttackDecaySustainRelease):
             return (
@@ -269,6 +368,7 @@ class AttackDecaySustainRelease(Envelope):
                 and self.decay == other.decay
                 and self.release == other.release
                 and self.sustain_level == other.sustain_level
+                and self.accent_multiplier == other.accent_multiplier
                 and self.accent_peak == other.accent_peak
                 and self.accent_sustain_level == other.accent_sustain_level
             )
@@ -282,13 +382,45 @@ class AttackDecaySustainRelease(Envelope):
     def volumes(
         self, tone: Tone, duration: int, sample_rate: int, start: float = 0
     ) -> Generator[float, None, None]:
+        yield from self.render(tone, duration, sample_rate, start)
+
+    def render(
+        self, tone: Tone, duration: int, sample_rate: int, start: float = 0
+    ) -> array:
+        return self._fill(self._tone_stages(tone, duration, sample_rate, start))
+
+    def length(
+        self, tone: Tone, duration: int, sample_rate: int, start: float = 0
+    ) -> int:
+        return sum(
+            stage[1] for stage in self._tone_stages(tone, duration, sample_rate, start)
+        )
+
+    def volume_at(
+        self,
+        tone: Tone,
+        duration: int,
+        sample_rate: int,
+        start: float,
+        index: int,
+    ) -> float:
+        for stage in self._tone_stages(tone, duration, sample_rate, start):
+            if index < stage[1]:
+                return self._stage_volume(stage, index + 1)
+
+            index -= stage[1]
 
+        return 0.0
+
+    def _tone_stages(
+        self, tone: Tone, duration: int, sample_rate: int, start: float
+    ) -> list[tuple]:
         # safe to cast tone.dynamic. We know parts always supply dynamics
         peak, sustain, end, attack_rate, decay_rate, release_rate = self._rates(
             cast(Dynamic, tone.dynamic), tone.accent, sample_rate
         )
 
-        yield from self._volumes(
+        return self._stages(
             duration,
             start,
             peak,
@@ -339,6 +471,129 @@ class AttackDecaySustainRelease(Envelope):
         decay_rate: float,
         release_rate: float,
     ) -> Generator[float, None, None]:
+        yield from cls._render(
+            duration,
+            start,
+            peak,
+            sustain,
+            end,
+            attack_rate,
+            decay_rate,
+            release_rate,
+        )
+
+    @classmethod
+    def _render(
+        cls,
+        duration: int,
+        start: float,
+        peak: float,
+        sustain: float,
+        end: float,
+        attack_rate: float,
+        decay_rate: float,
+        release_rate: float,
+    ) -> array:
+        return cls._fill(
+            cls._stages(
+                duration,
+                start,
+                peak,
+                sustain,
+                end,
+                attack_rate,
+                decay_rate,
+                release_rate,
+            )
+        )
+
+    @staticmethod
+    def _fill(stages: list[tuple]) -> array:
+        """
+        Produce the volumes for each stage (see _stages)
+        """
+        # Each stage is linear, so rather than stepping through samples
+        # one at a time, we fill in each stage in one go.
+        volumes = array("d")
+
+        for stage in stages:
+            kind, count = stage[:2]
+
+            if kind == "attack":
+                _, _, first, difference, samples = stage
+                volumes.extend(
+                    [
+                        first + (difference * index / samples)
+                        for index in range(1, count + 1)
+                    ]
+                )
+            elif kind == "decay":
+                _, _, first, difference, samples, floor = stage
+                volumes.extend(
+                    [
+                        max(floor, first - (difference * index / samples))
+                        for index in range(1, count + 1)
+                    ]
+                )
+            elif kind == "release":
+                _, _, first, samples = stage
+                volumes.extend(
+                    [
+                        max(0.0, first - (first * index / samples))
+                        for index in range(1, count + 1)
+                    ]
+                )
+            else:
+                volumes.extend(array("d", [stage[2]]) * count)
+
+        return volumes
+
+    @staticmethod
+    def _stage_volume(stage: tuple, index: int) -> float:
+        """
+        The volume for a (1-indexed) sample within a stage. Matches the
+        values _render fills each stage with.
+        """
+        kind = stage[0]
+
+        if kind == "attack":
+            _, _, first, difference, samples = stage
+            return first + (difference * index / samples)
+
+        if kind == "decay":
+            _, _, first, difference, samples, floor = stage
+            return max(floor, first - (difference * index / samples))
+
+        if kind == "release":
+            _, _, first, samples = stage
+            return max(0.0, first - (first * index / samples))
+
+        return stage[2]
+
+    @classmethod
+    def _stages(
+        cls,
+        duration: int,
+        start: float,
+        peak: float,
+        sustain: float,
+        end: float,
+        attack_rate: float,
+        decay_rate: float,
+        release_rate: float,
+    ) -> list[tuple]:
+        """
+        Work out each linear stage of an envelope, as a tuple of its
+        kind and how many samples it lasts, followed by what's needed
+        to work out its volumes:
+            ("attack", count, start, difference, samples)
+            ("decay", count, start, difference, samples, sustain)
+            ("sustain", count, volume)
+            ("release", count, start, samples)
+            ("padding", count, 0.0)
+        """
+        stages: list[tuple] = []
+
         # we may not have enough time for a full ADSR envelope. We will
         # always attack/decay/release at the expected rates. We will
         # always start at the start value and produce volumes until we
@@ -410,8 +665,9 @@ class AttackDecaySustainRelease(Envelope):
                 difference = actual_peak - start
                 attack_samples = difference / attack_rate
 
-                for index in range(round(attack_samples)):
-                    yield start + (difference * (index + 1) / attack_samples)
+                stages.append(
+                    ("attack", round(attack_samples), start, difference, attack_samples)
+                )
 
                 volume = actual_peak
                 remaining -= round(attack_samples)
@@ -438,12 +694,18 @@ class AttackDecaySustainRelease(Envelope):
                 difference = volume - decayed
                 decay_samples = difference / decay_rate
 
-                for index in range(round(decay_samples)):
-                    # TODO: if it is rounding up and we aren't sustaining then
-                    # arguably we should be using a blend of decay and release
-                    yield max(
-                        sustain, volume - (difference * (index + 1) / decay_samples)
+                # TODO: if it is rounding up and we aren't sustaining then
+                # arguably we should be using a blend of decay and release
+                stages.append(
+                    (
+                        "decay",
+                        round(decay_samples),
+                        volume,
+                        difference,
+                        decay_samples,
+                        sustain,
                     )
+                )
 
                 volume = decayed
                 remaining -= decay_samples
@@ -452,19 +714,24 @@ class AttackDecaySustainRelease(Envelope):
         sustain_samples = round(remaining - release_samples)
 
         if sustain_samples > 0 and volume == sustain:
-            for _ in range(sustain_samples):
-                yield volume
+            stages.append(("sustain", sustain_samples, volume))
 
             remaining -= sustain_samples
 
         release_samples = volume / release_rate
-        for index in range(round(release_samples)):
-            yield max(0.0, volume - (volume * (index + 1) / release_samples))
+        # (a tone can start below 0, in which case there's nothing to release)
+        stages.append(
+            ("release", max(0, round(release_samples)), volume, release_samples)
+        )
 
         padding = round(remaining - release_samples)
         if padding > 0:
-            for _ in range(padding):
-                yield 0.0
+            stages.append(("padding", padding, 0.0))
+
+        return stages
+
+
+METRICS.register_cache("DynamicRange.volume", DynamicRange.volume)
 
 
 __all__ = ("AttackDecaySustainRelease", "DynamicRange", "Envelope", "Homogeneous")
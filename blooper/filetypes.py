@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from array import array
 from dataclasses import dataclass
+from itertools import chain
 from pathlib import Path
-from typing import Generator, Iterable, Optional
+from typing import Generator, Hashable, Iterable, Optional
 
 from blooper.notes import Dynamic
 
@@ -77,6 +79,31 @@ class SampleFile(ABC):
         loop: Whether to loop to reach the full length of the envelope
         """
 
+    def render(
+        self, sample_rate: int, volumes: Iterable[float], loop: bool = False
+    ) -> array:
+        """
+        Load all samples from a file at once, as an array("d") of
+        interleaved samples. Arguments are the same as for load.
+        """
+        return array("d", chain.from_iterable(self.load(sample_rate, volumes, loop)))
+
+    def frame_count(self, sample_rate: int, length: int, loop: bool = False) -> int:
+        """
+        How many frames render would produce given length volumes,
+        ideally worked out without producing them. Other arguments are
+        the same as for load.
+        """
+        return len(self.render(sample_rate, [1.0] * length, loop)) // self.channels
+
+    def fingerprint(self) -> Hashable:
+        """
+        A value identifying the sample's contents, used to share notes
+        rendered from it. It should change whenever the contents do.
+        Defaults to the sample itself.
+        """
+        return self
+
     @classmethod
     @abstractmethod
     def from_path(cls, path: Path, *, metadata: UsageMetadata) -> SampleFile:
@@ -7,23 +7,56 @@ from __future__ import annotations
 import json
 import math
 from abc import ABC, abstractmethod
-from collections import defaultdict
-from functools import cache
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from functools import partial
 from itertools import chain, islice, repeat, zip_longest
+from operator import add, itemgetter, mul
 from pathlib import Path
 from random import choice
-from typing import Callable, Generator, Iterable, Iterator, Optional
-
+from threading import Lock
+from typing import (
+    Any,
+    Callable,
+    Generator,
+    Hashable,
+    Iterable,
+    Iterator,
+    MutableSequence,
+    Optional,
+    Sequence,
+    TypeVar,
+    cast,
+)
+from weakref import ref
+
+from blooper.caches import NOTE_CACHE, LRUCache, cached_method
 from blooper.dynamics import AttackDecaySustainRelease, DynamicRange, Envelope
 from blooper.filetypes import SampleFile, UsageMetadata
-from blooper.notes import Dynamic
+from blooper.metrics import METRICS
+from blooper.notes import Dynamic, Tone
 from blooper.parts import Part
 from blooper.pitch import A440, Tuning
+from blooper.profiling import end_stage, start_stage, timed
 from blooper.waveforms import Waveform
 
 # Distance in cents
 MAX_DISTANCE = 20
 
+# How many frames to render at a time when producing blocks of samples
+BLOCK_SIZE = 4_096
+
+# How many partially-rendered signals to hold on to (per instrument) so
+# that consecutive calls to render_into don't need to start over
+MAX_CURSORS = 8
+
+# Notes longer than this (in frames) are rendered a block at a time
+# rather than being stored in the note cache
+NOTE_CACHE_FRAMES = 1 << 18
+
+Sample = TypeVar("Sample", int, float)
+
 
 def then_zeroes(iterable: Iterable[float]) -> Iterator[float]:
     """
@@ -32,12 +65,213 @@ def then_zeroes(iterable: Iterable[float]) -> Iterator[float]:
     return chain(iterable, repeat(0.0))
 
 
+def zeroes(count: int) -> array:
+    """
+    Create a buffer containing count silent samples
+    """
+    return array("d", bytes(count * array("d").itemsize))
+
+
+def batched(
+    frames: Iterable[tuple[float, ...]], frames_per_block: int = BLOCK_SIZE
+) -> Iterator[array]:
+    """
+    Group a signal into blocks of interleaved samples. Every block but
+    the last will contain exactly frames_per_block frames
+    """
+    frames = iter(frames)
+
+    while True:
+        block = array("d", chain.from_iterable(islice(frames, frames_per_block)))
+
+        if not block:
+            return
+
+        yield block
+
+
+def unbatched(
+    blocks: Iterable[Sequence[Sample]], channels: int
+) -> Generator[tuple[Sample, ...], None, None]:
+    """
+    Split blocks of interleaved samples back into individual frames
+    """
+    for block in blocks:
+        for start in range(0, len(block), channels):
+            end = start + channels
+            yield tuple(block[start:end])
+
+
+class Cursor:
+    """
+    A position within a signal being rendered one block at a time.
+    """
+
+    def __init__(
+        self, blocks: Iterator[Sequence[float]], channels: int, frame: int = 0
+    ):
+        self.blocks = blocks
+        self.channels = channels
+        self.frame = frame
+        self.finished = False
+
+        self._block: Sequence[float] = array("d")
+        self._offset = 0
+
+    def _available(self) -> int:
+        """
+        How many samples are left in the current block, fetching a new
+        block if the current one is used up
+        """
+        while self._offset >= len(self._block):
+            block = next(self.blocks, None)
+
+            if block is None:
+                self.finished = True
+                return 0
+
+            self._block = block
+            self._offset = 0
+
+        return len(self._block) - self._offset
+
+    def skip(self, frames: int):
+        """
+        Advance through the signal without copying any samples
+        """
+        remaining = frames * self.channels
+
+        while remaining:
+            available = self._available()
+
+            if not available:
+                break
+
+            count = min(available, remaining)
+            self._offset += count
+            remaining -= count
+
+        self.frame += frames - (remaining // self.channels)
+
+    def read_into(self, out: MutableSequence[float], frames: int) -> int:
+        """
+        Copy frames into the start of a buffer, returning how many
+        frames were copied
+        """
+        position = 0
+        remaining = frames * self.channels
+
+        while remaining:
+            available = self._available()
+
+            if not available:
+                break
+
+            count = min(available, remaining)
+            start, end = self._offset, self._offset + count
+            filled = position + count
+
+            out[position:filled] = self._block[start:end]
+
+            self._offset = end
+            position = filled
+            remaining -= count
+
+        written = position // self.channels
+        self.frame += written
+
+        return written
+
+
+_CURSOR_LOCK = Lock()
+
+
+class _Cursors(list):
+    """
+    The partially-rendered signals an instrument is holding on to (see
+    render_into), as (part contents, instrument parameters, sample rate,
+    channels, cursor). They can't be sent to other processes, so
+    pickled instruments start out without any. They also remember which
+    instrument they belong to, so copies (which may then be changed)
+    don't pick up the original's signals.
+    """
+
+    def __init__(self, owner: Optional[Instrument] = None):
+        super().__init__()
+        self.owner = None if owner is None else ref(owner)
+
+    def __reduce__(self) -> tuple:
+        return (_Cursors, ())
+
+
+def _part_key(part: Any) -> Any:
+    """
+    Something that identifies what a part currently contains, so that
+    signals rendered from it aren't reused once it has been edited.
+    Parts that can't describe their contents are identified by the
+    part itself.
+    """
+    contents = getattr(part, "_contents", None)
+
+    if contents is None:
+        return part
+
+    return contents()
+
+
+def _note_key(cache: Optional[LRUCache], *values: Any) -> Optional[tuple]:
+    """
+    Combine everything that determines how a note sounds into a key for
+    the note cache. Returns None if notes aren't being cached or any of
+    the values can't be hashed (e.g., a custom envelope without
+    __hash__).
+    """
+    if cache is None:
+        return None
+
+    try:
+        hash(values)
+    except TypeError:
+        return None
+
+    return values
+
+
+def _render_envelope(
+    envelope: Envelope, tone: Tone, duration: int, sample_rate: int, start: float
+) -> array:
+    """
+    Render the volumes of a tone all at once (see Envelope.render)
+    """
+    started = start_stage()
+    volumes = envelope.render(tone, duration, sample_rate, start)
+    end_stage("Envelope.render", started, len(volumes))
+
+    return volumes
+
+
+def _longest(signals: Iterable[tuple[array, int]]) -> int:
+    """
+    The number of frames in the longest of several signals of
+    interleaved samples (each paired with its channel count)
+    """
+    return max((len(signal) // channels for signal, channels in signals), default=0)
+
+
 class Instrument(ABC):
     """
     A tool for converting a part into a continuous array of samples
     given a set of the properties of the instrument itself.
     """
 
+    # Whether blocks can start partway through a part without rendering
+    # everything that comes before
+    seekable = False
+
+    # Where rendered notes are kept so repeated notes only need to be
+    # rendered once. None renders every note from scratch
+    note_cache: Optional[LRUCache] = NOTE_CACHE
+
     @property
     @abstractmethod
     def tuning(self) -> Tuning:
@@ -73,6 +307,78 @@ class Instrument(ABC):
 
         return (((left * (1 - balance)) + (right * (1 + balance))) / 2,)
 
+    @classmethod
+    def channel_gains(
+        cls, sample_channels: int, channels: int, balance: float
+    ) -> tuple[tuple[float, ...], ...]:
+        """
+        The gain matrix for converting frames with sample_channels
+        channels into frames with channels channels: one row per output
+        channel, one gain per input channel. Gains are taken from
+        mono_to_stereo and stereo_to_mono, which are assumed to be
+        linear.
+
+        balance: The left/right balance. 0 is even, -1 is all left, 1 is
+            all right.
+        """
+        if sample_channels == channels and channels in (1, 2):
+            return tuple(
+                tuple(1.0 if row == column else 0.0 for column in range(channels))
+                for row in range(channels)
+            )
+
+        if (sample_channels, channels) == (1, 2):
+            left, right = cls.mono_to_stereo(1.0, balance)
+            return ((left,), (right,))
+
+        if (sample_channels, channels) == (2, 1):
+            (left,) = cls.stereo_to_mono(1.0, 0.0, balance)
+            (right,) = cls.stereo_to_mono(0.0, 1.0, balance)
+            return ((left, right),)
+
+        raise NotImplementedError(
+            f"Unsupported channel conversion: {sample_channels} to {channels}"
+        )
+
+    @staticmethod
+    def _block_sizes(frames: int) -> Iterator[int]:
+        """
+        Split a number of frames into blocks no larger than BLOCK_SIZE
+        """
+        for _ in range(frames // BLOCK_SIZE):
+            yield BLOCK_SIZE
+
+        if frames % BLOCK_SIZE:
+            yield frames % BLOCK_SIZE
+
+    def _events(
+        self, part: Part, sample_rate: int
+    ) -> Iterator[tuple[int, int, Tone, Sequence[float]]]:
+        """
+        Iterate over the tones in a part along with the frequency of each
+        of their pitches (in the order they were written). Parts are
+        compiled (see Part.compile) so tones are only worked out once no
+        matter how many times a part is played.
+        """
+        compile = getattr(part, "compile", None)
+
+        if compile is not None:
+            started = start_stage()
+            table = compile(sample_rate, self.tuning)
+
+            if started is not None:
+                frames = table.starts[-1] + table.durations[-1] if len(table) else 0
+                end_stage("Part.tones", started, frames)
+
+            yield from table.events()
+            return
+
+        for start, duration, tone in timed(part.tones(sample_rate), "Part.tones"):
+            frequencies = [
+                self.tuning.pitch_to_frequency(pitch) for pitch in tone.pitches
+            ]
+            yield start, duration, tone, frequencies
+
     @abstractmethod
     def play(
         self, part: Part, sample_rate: int, *, channels: int = 2
@@ -86,12 +392,161 @@ class Instrument(ABC):
         channels: How many channels of output to produce
         """
 
+    def frame_count(self, part: Part, sample_rate: int) -> Optional[int]:
+        """
+        How many frames playing a part will produce, worked out without
+        rendering it. None if that can't be known ahead of time.
+
+        part: The part to play
+        sample_rate: The sample rate (in Hz).
+        """
+        return None
+
+    def tone_states(self, part: Part, sample_rate: int) -> Optional[list[Hashable]]:
+        """
+        What each tone of a part picks up from the tones before it (e.g.,
+        the volume it starts from and where its oscillators are in their
+        cycles), worked out without rendering. Tones with the same state
+        (and the same part before them, from the end of the previous
+        tone) sound the same. None if that can't be known.
+
+        part: The part to play
+        sample_rate: The sample rate (in Hz).
+        """
+        return None
+
+    def blocks(
+        self,
+        part: Part,
+        sample_rate: int,
+        *,
+        channels: int = 2,
+        start_frame: int = 0,
+    ) -> Iterator[Sequence[float]]:
+        """
+        Convert a part into a signal, one block of interleaved samples at
+        a time. Blocks may be any length but always contain whole frames.
+
+        By default, this groups the frames yielded by play.
+
+        part: The part to play
+        sample_rate: The sample rate (in Hz).
+        channels: How many channels of output to produce
+        start_frame: The (0-indexed) frame of the signal to start at. The
+            output matches the signal from the beginning with start_frame
+            frames removed.
+        """
+        return batched(
+            islice(self.play(part, sample_rate, channels=channels), start_frame, None)
+        )
+
+    def render_into(
+        self,
+        part: Part,
+        sample_rate: int,
+        out: MutableSequence[float],
+        start_frame: int = 0,
+        *,
+        channels: int = 2,
+    ) -> int:
+        """
+        Render a section of a part into a caller-owned buffer of
+        interleaved samples (e.g., an array("d")). As many frames as fit
+        in the buffer will be written. Returns the number of frames
+        written. If that is fewer than fit in the buffer, the signal has
+        ended.
+
+        Calls that continue where the previous call stopped resume the
+        signal rather than rendering it again from the start (as long as
+        neither the part nor the instrument's attributes have been
+        changed in between, see _parameters).
+
+        part: The part to play
+        sample_rate: The sample rate (in Hz).
+        out: The buffer to write samples into
+        start_frame: The (0-indexed) frame of the signal to start at
+        channels: How many channels of output to produce
+        """
+        key = _part_key(part)
+        parameters = self._parameters()
+
+        with _CURSOR_LOCK:
+            cursors = self.__dict__.get("_cursors")
+
+            # copies share the original's cursors until they get their own
+            if cursors is None or cursors.owner is None or cursors.owner() is not self:
+                cursors = self.__dict__["_cursors"] = _Cursors(self)
+
+            # the furthest cursor that doesn't go past the requested frame
+            # (the most recent, if several are at the same frame)
+            best = None
+            for index, (
+                cursor_key,
+                cursor_parameters,
+                cursor_rate,
+                cursor_channels,
+                cursor,
+            ) in enumerate(cursors):
+                if (
+                    cursor_rate == sample_rate
+                    and cursor_channels == channels
+                    and cursor.frame <= start_frame
+                    and (best is None or cursors[best][4].frame <= cursor.frame)
+                    and cursor_key == key
+                    and cursor_parameters == parameters
+                ):
+                    best = index
+
+            cursor = None if best is None else cursors.pop(best)[4]
+
+        # seekable instruments can jump straight to distant frames
+        if cursor is None or (
+            self.seekable and start_frame - cursor.frame > BLOCK_SIZE
+        ):
+            cursor = Cursor(
+                iter(
+                    self.blocks(
+                        part, sample_rate, channels=channels, start_frame=start_frame
+                    )
+                ),
+                channels,
+                start_frame,
+            )
+
+        if cursor.frame < start_frame:
+            cursor.skip(start_frame - cursor.frame)
+
+        written = cursor.read_into(out, len(out) // channels)
+
+        if not cursor.finished:
+            with _CURSOR_LOCK:
+                cursors.append((key, parameters, sample_rate, channels, cursor))
+                del cursors[:-MAX_CURSORS]
+
+        return written
+
+    def _parameters(self) -> tuple:
+        """
+        The instrument's attributes (other than its caches and the
+        signals it's holding on to), so signals rendered before any of
+        them were set to something else aren't reused. Changes made
+        inside an attribute (e.g., to an envelope's attack) aren't
+        noticed.
+        """
+        return tuple(
+            (name, value)
+            for name, value in sorted(vars(self).items(), key=itemgetter(0))
+            if not isinstance(value, (_Cursors, LRUCache))
+        )
+
 
 class Synthesizer(Instrument):
     """
     An instrument that plays parts by generating a Waveform.
     """
 
+    seekable = True
+
     def __init__(
         self,
         wave: Optional[str | Callable[[float], float]] = "sine",
@@ -100,6 +555,8 @@ class Synthesizer(Instrument):
         tuning: Tuning = A440,
         envelope: Optional[Envelope] = None,
         dynamics: Optional[DynamicRange] = None,
+        note_cache: Optional[LRUCache] = NOTE_CACHE,
+        table_size: Optional[int] = None,
     ):
 
         if wave is None:
@@ -115,6 +572,8 @@ class Synthesizer(Instrument):
         self.wave = wave
         self.balance = balance
         self.envelope = envelope
+        self.note_cache = note_cache
+        self.table_size = table_size
 
     @property
     def tuning(self) -> Tuning:
@@ -123,81 +582,364 @@ class Synthesizer(Instrument):
     def play(
         self, part: Part, sample_rate: int, *, channels: int = 2
     ) -> Generator[tuple[float, ...], None, None]:
+        yield from unbatched(
+            self.blocks(part, sample_rate, channels=channels), channels
+        )
+
+    def blocks(
+        self,
+        part: Part,
+        sample_rate: int,
+        *,
+        channels: int = 2,
+        start_frame: int = 0,
+    ) -> Iterator[Sequence[float]]:
 
         if channels == 1:
 
-            def fill_channels(sample: float) -> tuple[float, ...]:
-                return (sample,)
+            def fill_channels(samples: array) -> array:
+                return samples
 
         elif channels == 2:
-
-            def fill_channels(sample: float) -> tuple[float, ...]:
-                return self.mono_to_stereo(sample, self.balance)
+            left_gain = 1 - self.balance
+            right_gain = 1 + self.balance
+
+            # matches mono_to_stereo, a block at a time
+            def fill_channels(samples: array) -> array:
+                stereo = zeroes(len(samples) * 2)
+                stereo[0::2] = array(
+                    "d", [sample * left_gain / 2 for sample in samples]
+                )
+                stereo[1::2] = array(
+                    "d", [sample * right_gain / 2 for sample in samples]
+                )
+                return stereo
 
         else:
             raise NotImplementedError(f"Unsupported channel count: {channels}")
 
+        def split(samples: array) -> Iterator[array]:
+            offset = 0
+
+            for size in self._block_sizes(len(samples)):
+                end = offset + size
+                yield fill_channels(samples[offset:end])
+                offset = end
+
         waves: list[Waveform] = []
-        volumes: Iterable[float] = []
+        volumes: Callable[[], array] = partial(array, "d")
+        volume_at: Callable[[int], float] = lambda _: 0.0
+        key: Optional[tuple] = None
         index = 0
         start = 0.0
 
-        for next_index, duration, tone in part.tones(sample_rate):
+        # Everything before start_frame is skipped over rather than
+        # rendered. Waves can jump ahead without producing samples, but
+        # each envelope starts from the last sample of the previous tone
+        # so we only ever need to calculate that one sample (without
+        # rendering the rest of the envelope, as with frame_count).
+        for next_index, duration, tone, frequencies in self._events(part, sample_rate):
             if index < next_index:
+                frames = next_index - index
+                skipped = min(max(start_frame - index, 0), frames)
+
                 if not waves:
-                    zero = (0,) * channels
-                    for _ in range(next_index - index):
-                        yield zero
+                    for size in self._block_sizes(frames - skipped):
+                        yield zeroes(size * channels)
 
                     index = next_index
                     start = 0.0
+                elif skipped == frames:
+                    last = skipped - 1
+
+                    for wave in waves:
+                        wave.skip(last)
+
+                    start = self._signal(waves, iter((volume_at(last),)), 1)[0]
+
+                    index = next_index
+                elif not skipped and key is not None and frames <= NOTE_CACHE_FRAMES:
+                    samples = self._cached_signal(
+                        waves, (*key, frames), volumes, frames
+                    )
+                    start = samples[-1]
+                    yield from split(samples)
+
+                    index = next_index
                 else:
-                    padded = then_zeroes(volumes)
+                    for wave in waves:
+                        wave.skip(skipped)
+
+                    padded = then_zeroes(volumes()[skipped:])
 
-                    for _ in range(next_index - index):
-                        volume = next(padded)
-                        start = sum(wave.sample() for wave in waves) * volume
-                        yield fill_channels(start)
+                    for size in self._block_sizes(frames - skipped):
+                        samples = self._signal(waves, padded, size)
+                        start = samples[-1]
+                        yield fill_channels(samples)
 
                     index = next_index
             else:
                 start = 0
 
-            old_waves = waves
-            waves = []
-            for frequency, old_wave in zip_longest(
-                # In theory it shouldn't matter what order we go through frequencies
-                # in a chord but phases won't line up so we'll end up coming up with
-                # different values than if we divide each pitch in a separate part.
-                # Our options here are to respect the order pitches are supplied in
-                # (which feels wrong), or force an order. low-to-high seems reasonable
-                sorted(self.tuning.pitch_to_frequency(pitch) for pitch in tone.pitches),
-                old_waves,
+            # notes before start_frame were played by whoever rendered
+            # the frames before it
+            if next_index >= start_frame:
+                METRICS.increment("notes_played", instrument=self.__class__.__name__)
+
+            waves = self._next_waves(waves, frequencies, sample_rate)
+
+            # Envelopes are only rendered when needed, as notes found in
+            # the cache don't need them. A note depends on its envelope
+            # and where each wave starts (which is always fresh here).
+            volumes = partial(
+                _render_envelope, self.envelope, tone, duration, sample_rate, start
+            )
+            volume_at = partial(
+                self.envelope.volume_at, tone, duration, sample_rate, start
+            )
+            key = _note_key(
+                self.note_cache,
+                self.__class__,
+                self.envelope,
+                tone.dynamic,
+                tone.accent,
+                duration,
+                sample_rate,
+                start,
+                tuple(
+                    (
+                        wave.function,
+                        wave.table_size,
+                        wave.frequency,
+                        wave.offset,
+                        wave.index,
+                    )
+                    for wave in waves
+                ),
+            )
+
+        if waves:
+            # the final tone plays out its entire envelope
+            if (
+                start_frame <= index
+                and key is not None
+                and duration <= NOTE_CACHE_FRAMES
+            ):
+                yield from split(
+                    self._cached_signal(waves, (*key, None), volumes, None)
+                )
+                return
+
+            # seeking past the end doesn't need the envelope at all
+            if start_frame > index and start_frame - index >= self.envelope.length(
+                tone, duration, sample_rate, start
             ):
-                if frequency is None:
-                    break
+                return
 
-                waves.append(
-                    Waveform(
-                        frequency,
+            rendered = volumes()
+            skipped = min(max(start_frame - index, 0), len(rendered))
+
+            for wave in waves:
+                wave.skip(skipped)
+
+            remaining = iter(rendered[skipped:])
+
+            for size in self._block_sizes(len(rendered) - skipped):
+                yield fill_channels(self._signal(waves, remaining, size))
+
+    def frame_count(self, part: Part, sample_rate: int) -> Optional[int]:
+        index = 0
+        final: Optional[tuple[Tone, int, float]] = None
+        waves: list[Waveform] = []
+
+        for index, duration, tone, start, waves in self._walk(part, sample_rate):
+            final = (tone, duration, start)
+
+        if final is None or not waves:
+            return index
+
+        # the final tone plays out its entire envelope
+        return index + self.envelope.length(final[0], final[1], sample_rate, final[2])
+
+    def tone_states(self, part: Part, sample_rate: int) -> Optional[list[Hashable]]:
+        return [
+            (start, tuple(wave.phase for wave in waves))
+            for _, _, _, start, waves in self._walk(part, sample_rate)
+        ]
+
+    def _walk(
+        self, part: Part, sample_rate: int
+    ) -> Iterator[tuple[int, int, Tone, float, list[Waveform]]]:
+        """
+        Walk through a part the same way blocks does when skipping to the
+        end, except envelopes are never rendered. Each tone starts from
+        the last sample of the previous tone, so that one sample is the
+        only one calculated.
+
+        Yields where each tone starts, its duration, the tone, the sample
+        it starts from, and its waves (before they're advanced through
+        the tone).
+        """
+        waves: list[Waveform] = []
+        previous: Optional[Tone] = None
+        previous_duration = 0
+        previous_start = 0.0
+        index = 0
+
+        for next_index, duration, tone, frequencies in self._events(part, sample_rate):
+            start = 0.0
+
+            if index < next_index:
+                if waves:
+                    last = next_index - index - 1
+
+                    for wave in waves:
+                        wave.skip(last)
+
+                    volume = self.envelope.volume_at(
+                        cast(Tone, previous),
+                        previous_duration,
                         sample_rate,
-                        wave=self.wave,
-                        phase=old_wave.phase if old_wave else None,
+                        previous_start,
+                        last,
                     )
+                    start = self._signal(waves, iter((volume,)), 1)[0]
+
+                index = next_index
+
+            waves = self._next_waves(waves, frequencies, sample_rate)
+
+            yield next_index, duration, tone, start, waves
+
+            previous = tone
+            previous_duration = duration
+            previous_start = start
+
+    def _next_waves(
+        self, waves: list[Waveform], frequencies: Sequence[float], sample_rate: int
+    ) -> list[Waveform]:
+        """
+        Create the waves for the next tone, each picking up where the
+        previous tone's waves left off
+        """
+        next_waves = []
+
+        for frequency, old_wave in zip_longest(
+            # In theory it shouldn't matter what order we go through frequencies
+            # in a chord but phases won't line up so we'll end up coming up with
+            # different values than if we divide each pitch in a separate part.
+            # Our options here are to respect the order pitches are supplied in
+            # (which feels wrong), or force an order. low-to-high seems reasonable
+            sorted(frequencies),
+            waves,
+        ):
+            if frequency is None:
+                break
+
+            next_waves.append(
+                Waveform(
+                    frequency,
+                    sample_rate,
+                    wave=self.wave,
+                    phase=old_wave.phase if old_wave else None,
+                    table_size=self.table_size,
                 )
+            )
 
-            volumes = self.envelope.volumes(tone, duration, sample_rate, start)
+        return next_waves
 
-        if waves:
-            for volume in self.envelope.volumes(tone, duration, sample_rate, start):
-                yield fill_channels(sum(wave.sample() for wave in waves) * volume)
+    def _cached_signal(
+        self,
+        waves: list[Waveform],
+        key: Hashable,
+        volumes: Callable[[], array],
+        frames: Optional[int],
+    ) -> array:
+        """
+        Get a note's signal from the note cache, rendering (and storing)
+        it if it isn't there. Waves are advanced past the note either
+        way.
+
+        frames: How many frames of the note to render (padding the
+            envelope with silence), or None for its entire envelope
+
+        The returned array may be shared and must not be modified.
+        """
+        assert self.note_cache is not None
+
+        samples = self.note_cache.get(key)
+
+        if samples is None:
+            rendered = volumes()
+            if frames is None:
+                frames = len(rendered)
+
+            samples = self._signal(waves, then_zeroes(rendered), frames)
+            self.note_cache.put(key, samples)
+        else:
+            for wave in waves:
+                wave.skip(len(samples))
+
+        return samples
+
+    @staticmethod
+    def _signal(waves: list[Waveform], volumes: Iterator[float], size: int) -> array:
+        """
+        Sum the next samples of several waves and apply their volumes
+        """
+        samples = waves[0].samples(size)
+
+        for wave in waves[1:]:
+            samples = array("d", map(add, samples, wave.samples(size)))
+
+        return array("d", map(mul, samples, islice(volumes, size)))
+
+
+@dataclass(frozen=True)
+class _SampleBucket:
+    """
+    The samples recorded at one frequency and sample rate
+    """
+
+    frequency: float
+    # samples that can be played at any dynamic
+    unrestricted: frozenset[SampleFile]
+    # samples only meant to be played within a range of dynamics
+    restricted: tuple[SampleFile, ...]
+
+    def compatible(self, dynamic: Optional[Dynamic]) -> set[SampleFile]:
+        """
+        The samples that can be played at a dynamic
+        """
+        samples = set(self.unrestricted)
+
+        if self.restricted:
+            samples.update(
+                sample
+                for sample in self.restricted
+                if sample.usage_metadata.compatible_dynamic(dynamic)
+            )
+
+        return samples
+
+
+# A bucket close enough to a frequency to be used for it, along with
+# its distance (in cents) and the sample rate of its samples
+_Candidate = tuple[float, int, _SampleBucket]
 
 
 class Sampler(Instrument):
     """
-    An instrument which plays notes using pre-recorded samples
+    An instrument which plays notes using pre-recorded samples.
+
+    Samples are indexed by frequency when the sampler is created. If
+    keymap is set, the samples compatible with every pitch of the tuning
+    are also worked out up front, rather than as each pitch is first
+    played.
     """
 
+    seekable = True
+
     def __init__(
         self,
         samples: dict[Path, UsageMetadata],
@@ -209,6 +951,8 @@ class Sampler(Instrument):
         loop: bool = True,
         max_distance: float = MAX_DISTANCE,
         sample_format: str = "wav",
+        note_cache: Optional[LRUCache] = NOTE_CACHE,
+        keymap: bool = False,
     ):
         if envelope is None:
             if dynamics is None:
@@ -222,163 +966,437 @@ class Sampler(Instrument):
         self.loop = loop
         self.max_distance = max_distance
         self.samples = self.map_samples(samples, sample_format)
+        self.note_cache = note_cache
+
+        self._index = self.index_samples(self.samples)
+        self._keymap: Optional[dict[float, tuple[_Candidate, ...]]] = None
+
+        if keymap:
+            self._keymap = self._compile_keymap()
 
     @property
     def tuning(self) -> Tuning:
         return self._tuning
 
-    @cache
+    @cached_method()
     def compatible_samples(
         self, frequency: float, sample_rate: int, dynamic: Optional[Dynamic] = None
     ) -> set[SampleFile]:
         """
         Return the list of all compatible samples for a given frequency
-        and sample rate
+        and sample rate: the closest samples (within max_distance) at a
+        sample rate that is a multiple of sample_rate, that can be played
+        at the dynamic.
         """
+        candidates = None
+
+        if self._keymap is not None:
+            candidates = self._keymap.get(frequency)
+
+        if candidates is None:
+            candidates = self._candidates(frequency)
+
         distance = None
         closest: set[SampleFile] = set()
 
-        # we could make this all more efficient, who cares
-        for actual_rate, samples_at_rate in self.samples.items():
+        for actual_distance, actual_rate, bucket in candidates:
+            if distance is not None and actual_distance > distance:
+                break
+
             if actual_rate < sample_rate or actual_rate % sample_rate:
                 continue
 
-            for actual_frequency, samples in samples_at_rate.items():
-                samples = {
-                    sample
-                    for sample in samples
-                    if sample.usage_metadata.compatible_dynamic(dynamic)
-                }
+            samples = bucket.compatible(dynamic)
 
-                if not samples:
-                    continue
+            if not samples:
+                continue
 
-                if frequency == actual_frequency:
-                    if distance == 0:
-                        closest = closest.union(samples)
-                    else:
+            if distance is None:
+                distance = actual_distance
+                closest = samples
+            else:
+                closest.update(samples)
+
+        return closest
+
+    def _candidates(self, frequency: float) -> tuple[_Candidate, ...]:
+        """
+        Every bucket of samples within max_distance of a frequency (at any
+        sample rate or dynamic), closest first
+        """
+        candidates: list[_Candidate] = []
+        position = math.log2(frequency)
+
+        for actual_rate, (positions, buckets) in self._index.items():
+            middle = bisect_left(positions, position)
+
+            # work outwards from the frequency in both directions until
+            # samples are too far away
+            for indices in (
+                range(middle, len(buckets)),
+                range(middle - 1, -1, -1),
+            ):
+                for index in indices:
+                    bucket = buckets[index]
+
+                    # We've claimed math elsewhere was acurate to 12 decimal
+                    # places so we'll replicate that here. It's low stakes to
+                    # round or not but this makes it easier to test we _can_
+                    # grab differing frequencies if they're equidistant. Is
+                    # that actually even good? that means two notes played
+                    # together can be off by twice the cents we want and be
+                    # played together. Hmm.
+                    distance = round(
+                        abs(1200 * math.log2(bucket.frequency / frequency)), 12
+                    )
+
+                    if bucket.frequency == frequency:
                         distance = 0.0
-                        closest = set(samples)
-                elif distance == 0:
-                    continue
-
-                # We've claimed math elsewhere was acurate to 12 decimal places
-                # so we'll replicate that here. It's low stakes to round or not
-                # but this makes it easier to test we _can_ grab differing
-                # frequencies if they're equidistant. Is that actually even
-                # good? that means two notes played together can be off by
-                # twice the cents we want and be played together. Hmm.
-                actual_distance = round(
-                    abs(1200 * math.log2(actual_frequency / frequency)), 12
-                )
-                if actual_distance > self.max_distance:
-                    continue
+                    elif distance > self.max_distance:
+                        break
 
-                if distance is None or actual_distance < distance:
-                    distance = actual_distance
-                    closest = set(samples)
-                elif distance == actual_distance:
-                    closest = closest.union(samples)
+                    candidates.append((distance, actual_rate, bucket))
 
-        return closest
+        return tuple(sorted(candidates, key=itemgetter(0)))
+
+    def _compile_keymap(self) -> dict[float, tuple[_Candidate, ...]]:
+        """
+        Work out the candidate samples for the frequency of every pitch of
+        the tuning that is close enough to a sample to use one
+        """
+        keymap: dict[float, tuple[_Candidate, ...]] = {}
+        frequencies = [
+            bucket.frequency
+            for _, buckets in self._index.values()
+            for bucket in buckets
+        ]
+
+        if not frequencies:
+            return keymap
+
+        margin = 2 ** (max(self.max_distance, 0) / 1200)
+        lowest = min(frequencies) / margin
+        highest = max(frequencies) * margin
+
+        tuning = self.tuning
+        ratio = tuning.scale.harmonic_ratio
+
+        # start from an order entirely below the lowest sample
+        order = tuning.order + math.floor(math.log(lowest / tuning.frequency, ratio))
+        order -= 1
+
+        while tuning.position_to_frequency(order, 0) <= highest:
+            for step in range(tuning.scale.steps):
+                frequency = tuning.position_to_frequency(order, step)
+
+                if lowest <= frequency <= highest:
+                    keymap[frequency] = self._candidates(frequency)
+
+            order += 1
+
+        return keymap
 
     def play(
         self, part: Part, sample_rate: int, *, channels: int = 2
     ) -> Generator[tuple[float, ...], None, None]:
+        yield from unbatched(
+            self.blocks(part, sample_rate, channels=channels), channels
+        )
 
-        mixer: dict[int, Callable[[tuple[float, ...]], tuple[float, ...]]] = {}
+    def blocks(
+        self,
+        part: Part,
+        sample_rate: int,
+        *,
+        channels: int = 2,
+        start_frame: int = 0,
+    ) -> Iterator[Sequence[float]]:
+        if channels not in (1, 2):
+            raise NotImplementedError(f"Unsupported channel count: {channels}")
 
-        @cache
-        def matching_channels(samples: tuple[float, ...]) -> tuple[float, ...]:
-            return samples
+        gains = {
+            sample_channels: self.channel_gains(sample_channels, channels, self.balance)
+            for sample_channels in (1, 2)
+        }
 
-        if channels == 1:
-            mixer[1] = matching_channels
+        # the previous tone: its duration, the tone, the volume it
+        # started from, and the samples chosen to play it
+        previous: Optional[tuple[int, Tone, float, list[SampleFile]]] = None
+        index = 0
+        start = 0.0
 
-            @cache
-            def stereo_to_mono(samples: tuple[int, int]) -> tuple[float]:
-                left, right = samples
-                return self.stereo_to_mono(left, right, self.balance)
+        # Everything before start_frame is skipped over rather than
+        # rendered. Each tone starts from the last volume of the previous
+        # one (if its samples lasted until the next tone), which can be
+        # found from its envelope and the length of its samples without
+        # rendering either.
+        for next_index, duration, tone, frequencies in self._events(part, sample_rate):
+            if index < next_index:
+                frames = next_index - index
 
-            mixer[2] = stereo_to_mono
-        elif channels == 2:
+                if next_index <= start_frame:
+                    start = 0.0
+                    if previous is not None:
+                        start = self._next_start(*previous, frames, sample_rate)
+                else:
+                    skipped = max(start_frame - index, 0)
+                    played = 0
 
-            @cache
-            def mono_to_stereo(samples: tuple[int]) -> tuple[float, float]:
-                return self.mono_to_stereo(samples[0], self.balance)
+                    if previous is not None and previous[3]:
+                        volumes, signals = self._render_tone(*previous, sample_rate)
+                        played = min(frames, len(volumes), _longest(signals))
 
-            mixer[1] = mono_to_stereo
-            mixer[2] = matching_channels
+                        if played:
+                            if played > skipped:
+                                mixed = self._mix(signals, gains, played, channels)
+                                del mixed[: skipped * channels]
+                                yield from self._split(mixed, channels)
 
-        else:
-            raise NotImplementedError(f"Unsupported channel count: {channels}")
+                            start = volumes[played - 1]
+
+                    if played < frames:
+                        for size in self._block_sizes(frames - max(played, skipped)):
+                            yield zeroes(size * channels)
+
+                        start = 0.0
+
+                index = next_index
+
+            # notes before start_frame were played by whoever rendered
+            # the frames before it
+            if next_index >= start_frame:
+                METRICS.increment("notes_played", instrument=self.__class__.__name__)
+
+            chosen = []
+            for frequency in frequencies:
+                compatible = self._compatible(frequency, sample_rate, tone)
 
-        signals: list[Iterable[tuple[float, ...]]] = []
-        functions: list[Callable[[tuple[float, ...]], tuple[float, ...]]] = []
+                if compatible:
+                    chosen.append(choice(compatible))
+
+            previous = (duration, tone, start, chosen)
+
+        # the final tone plays out every sample in full
+        if previous is None or not previous[3]:
+            return
+
+        skipped = max(start_frame - index, 0)
+
+        if skipped:
+            duration, tone, start, chosen = previous
+            length = self.envelope.length(tone, duration, sample_rate, start)
+
+            if skipped >= max(
+                sample.frame_count(sample_rate, length, self.loop) for sample in chosen
+            ):
+                return
+
+        _, signals = self._render_tone(*previous, sample_rate)
+        frames = _longest(signals)
+
+        if frames > skipped:
+            mixed = self._mix(signals, gains, frames, channels)
+            del mixed[: skipped * channels]
+            yield from self._split(mixed, channels)
+
+    def tone_states(self, part: Part, sample_rate: int) -> Optional[list[Hashable]]:
+        # Samples are picked at random, so if the samples that might be
+        # picked for a tone are different lengths, the volume the next
+        # tone starts from isn't known (and can't match anything)
+        states: list[Hashable] = []
+        previous: Optional[tuple[int, Tone, float, list[SampleFile]]] = None
+        known = True
         index = 0
-        volumes: Iterable[float] = []
         start = 0.0
-        zero = (0,) * channels
-
-        for next_index, duration, tone in part.tones(sample_rate):
-            while index < next_index:
-                if signals:
-                    for sample_sets, volume in zip(
-                        zip_longest(
-                            *[islice(signal, next_index - index) for signal in signals]
-                        ),
-                        volumes,
-                    ):
-                        total = [0.0] * channels
-                        for set_index, samples in enumerate(sample_sets):
-                            if samples:
-                                for channel, value in enumerate(
-                                    functions[set_index](samples)
-                                ):
-                                    total[channel] += value
-
-                        yield tuple(total)
-                        index += 1
-                        start = volume
-                    signals = []
-                    functions = []
-                else:
-                    for _ in range(next_index - index):
-                        yield zero
 
-                    index = next_index
-                    start = 0
+        for next_index, duration, tone, frequencies in self._events(part, sample_rate):
+            if index < next_index:
+                if previous is None or not previous[3]:
+                    start = 0.0
+                    known = True
+                elif known:
+                    start = self._next_start(*previous, next_index - index, sample_rate)
 
-            signals = []
-            functions = []
-            # Used just for keeping track of start volume
-            volumes = self.envelope.volumes(tone, duration, sample_rate, start)
+                index = next_index
 
-            for pitch in tone.pitches:
-                frequency = self.tuning.pitch_to_frequency(pitch)
-                compatible = list(
-                    self.compatible_samples(frequency, sample_rate, tone.dynamic)
-                )
+            states.append(start if known else object())
+
+            # any one of the samples that might be picked will do, if
+            # they're all the same length
+            representatives = []
+            for frequency in frequencies:
+                compatible = self._compatible(frequency, sample_rate, tone)
 
                 if compatible:
-                    sample = choice(compatible)
-                    signal = sample.load(
-                        sample_rate,
-                        self.envelope.volumes(tone, duration, sample_rate, start),
-                        loop=self.loop,
-                    )
-                    signals.append(signal)
-                    functions.append(mixer[sample.channels])
+                    representatives.append(compatible[0])
+
+                    if known:
+                        length = self.envelope.length(
+                            tone, duration, sample_rate, start
+                        )
+                        known = (
+                            len(
+                                {
+                                    sample.frame_count(sample_rate, length, self.loop)
+                                    for sample in compatible
+                                }
+                            )
+                            == 1
+                        )
+
+            previous = (duration, tone, start, representatives)
+
+        return states
+
+    def _compatible(
+        self, frequency: float, sample_rate: int, tone: Tone
+    ) -> list[SampleFile]:
+        """
+        The samples a tone may be played with at a frequency, in the
+        order they're picked from
+        """
+        started = start_stage()
+        compatible = list(self.compatible_samples(frequency, sample_rate, tone.dynamic))
+        end_stage("Sampler.compatible_samples", started)
 
-        if signals:
-            for sample_sets in zip_longest(*signals):
-                total = [0.0] * channels
-                for set_index, samples in enumerate(sample_sets):
-                    if samples:
-                        for channel, value in enumerate(functions[set_index](samples)):
-                            total[channel] += value
+        return compatible
+
+    def _next_start(
+        self,
+        duration: int,
+        tone: Tone,
+        start: float,
+        chosen: list[SampleFile],
+        frames: int,
+        sample_rate: int,
+    ) -> float:
+        """
+        The volume the tone after this one starts from, given how many
+        frames there are until it starts, without rendering anything
+        """
+        if not chosen:
+            return 0.0
+
+        length = self.envelope.length(tone, duration, sample_rate, start)
+        played = min(
+            frames,
+            length,
+            max(
+                sample.frame_count(sample_rate, length, self.loop) for sample in chosen
+            ),
+        )
 
-                        yield tuple(total)
+        if played < frames:
+            return 0.0
+
+        return self.envelope.volume_at(tone, duration, sample_rate, start, played - 1)
+
+    def _render_tone(
+        self,
+        duration: int,
+        tone: Tone,
+        start: float,
+        chosen: list[SampleFile],
+        sample_rate: int,
+    ) -> tuple[array, list[tuple[array, int]]]:
+        """
+        Render a tone's envelope along with each of the samples chosen to
+        play it. Every sample of a tone shares its envelope.
+        """
+        volumes = _render_envelope(self.envelope, tone, duration, sample_rate, start)
+        signals = []
+
+        for sample in chosen:
+            key = _note_key(
+                self.note_cache,
+                self.__class__,
+                self.envelope,
+                tone.dynamic,
+                tone.accent,
+                duration,
+                sample_rate,
+                start,
+                sample.fingerprint(),
+                self.loop,
+            )
+
+            if key is None or self.note_cache is None:
+                rendered = self._render_sample(sample, volumes, sample_rate)
+            else:
+                rendered = self.note_cache.get_or_put(
+                    key, partial(self._render_sample, sample, volumes, sample_rate)
+                )
+
+            signals.append((rendered, sample.channels))
+
+        return volumes, signals
+
+    def _split(self, samples: array, channels: int) -> Iterator[array]:
+        """
+        Split interleaved samples into blocks no larger than BLOCK_SIZE
+        """
+        offset = 0
+
+        for size in self._block_sizes(len(samples) // channels):
+            end = offset + size * channels
+            yield samples[offset:end]
+            offset = end
+
+    @staticmethod
+    def _mix(
+        signals: list[tuple[array, int]],
+        gains: dict[int, tuple[tuple[float, ...], ...]],
+        frames: int,
+        channels: int,
+    ) -> array:
+        """
+        Convert the first frames of each signal to the output's channels
+        (multiplying by the gain matrix for its channel count) and sum
+        them. Signals shorter than frames are padded with silence.
+        """
+        mixed = zeroes(frames * channels)
+
+        for signal, sample_channels in signals:
+            available = min(frames, len(signal) // sample_channels)
+
+            if not available:
+                continue
+
+            end = available * sample_channels
+            columns = [
+                signal[channel:end:sample_channels]
+                for channel in range(sample_channels)
+            ]
+
+            for channel, row in enumerate(gains[sample_channels]):
+                converted: Optional[array] = None
+
+                for column, gain in zip(columns, row):
+                    if gain != 1:
+                        column = array("d", [sample * gain for sample in column])
+
+                    if converted is None:
+                        converted = column
+                    else:
+                        converted = array("d", map(add, converted, column))
+
+                assert converted is not None
+                output = slice(channel, available * channels, channels)
+                mixed[output] = array("d", map(add, mixed[output], converted))
+
+        return mixed
+
+    def _render_sample(
+        self, sample: SampleFile, volumes: array, sample_rate: int
+    ) -> array:
+        """
+        Render a tone from a sample, given its envelope
+        """
+        started = start_stage()
+        rendered = sample.render(sample_rate, volumes, loop=self.loop)
+        end_stage("SampleFile.load", started, len(rendered) // sample.channels)
+
+        return rendered
 
     @staticmethod
     def map_samples(
@@ -391,18 +1409,58 @@ class Sampler(Instrument):
             raise NotImplementedError(f"Unsupported sample format: {sample_format}")
 
         # sort samples by sample rate then frequency. There may be
-        # multiple samples that match.
-        samples: dict[int, dict[float, set[SampleFile]]] = defaultdict(
-            lambda: defaultdict(set)
-        )
+        # multiple samples that match. These are plain dicts (rather
+        # than defaultdicts) so that samplers can be pickled
+        samples: dict[int, dict[float, set[SampleFile]]] = {}
 
         for path, metadata in sample_paths.items():
             sample = SampleClass.from_path(path, metadata=metadata)
 
-            samples[sample.sample_rate][metadata.frequency].add(sample)
+            samples.setdefault(sample.sample_rate, {}).setdefault(
+                metadata.frequency, set()
+            ).add(sample)
 
         return samples
 
+    @staticmethod
+    def index_samples(
+        samples: dict[int, dict[float, set[SampleFile]]]
+    ) -> dict[int, tuple[list[float], list[_SampleBucket]]]:
+        """
+        Sort mapped samples (see map_samples) by frequency within each
+        sample rate, so that the closest samples to a frequency can be
+        found with a binary search. Each rate has the log₂ of each
+        frequency (the positions searched) and the samples at each.
+        """
+        index = {}
+
+        for sample_rate, samples_at_rate in samples.items():
+            buckets = [
+                _SampleBucket(
+                    frequency,
+                    frozenset(
+                        sample
+                        for sample in samples_at_frequency
+                        if sample.usage_metadata.minimum_volume is None
+                        and sample.usage_metadata.maximum_volume is None
+                    ),
+                    tuple(
+                        sample
+                        for sample in samples_at_frequency
+                        if sample.usage_metadata.minimum_volume is not None
+                        or sample.usage_metadata.maximum_volume is not None
+                    ),
+                )
+                for frequency, samples_at_frequency in sorted(samples_at_rate.items())
+            ]
+
+            index[sample_rate] = (
+                [math.log2(bucket.frequency) for bucket in buckets],
+                buckets,
+            )
+
+        return index
+
     @classmethod
     def from_file(
         cls,
@@ -414,6 +1472,7 @@ class Sampler(Instrument):
         balance: float = 0,
         loop: bool = True,
         max_distance: float = MAX_DISTANCE,
+        keymap: bool = False,
     ) -> Sampler:
         with path.open("r") as stream:
             data = json.load(stream)
@@ -451,7 +1510,11 @@ class Sampler(Instrument):
             loop=loop,
             max_distance=max_distance,
             sample_format=data["format"],
+            keymap=keymap,
         )
 
 
-__all__ = ("Instrument", "Sampler", "Synthesizer")
+METRICS.register_cache("Sampler.compatible_samples", Sampler.compatible_samples)
+
+
+__all__ = ("BLOCK_SIZE", "Instrument", "Sampler", "Synthesizer")
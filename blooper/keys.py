@@ -5,9 +5,10 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from fractions import Fraction
-from functools import cache
 from typing import Iterable, Optional
 
+from blooper.caches import cached_method
+from blooper.metrics import METRICS
 from blooper.pitch import (
     DOUBLE_FLAT,
     DOUBLE_SHARP,
@@ -50,11 +51,11 @@ class Key:
     def __hash__(self) -> int:
         return hash((self.root, self.major, tuple(sorted(self.accidentals.items()))))
 
-    @cache
+    @cached_method()
     def accidental(self, pitch_class: str) -> Fraction:
         return self.accidentals.get(pitch_class, NATURAL)
 
-    @cache
+    @cached_method()
     def in_key(self, pitch: Pitch, accidental: Optional[Fraction] = None) -> Pitch:
         if pitch.accidental is None:
             if accidental is None:
@@ -434,5 +435,8 @@ KEYS = {
     ),
 }
 
+METRICS.register_cache("Key.accidental", Key.accidental)
+METRICS.register_cache("Key.in_key", Key.in_key)
+
 
 __all__ = ("KEYS", "Key")
@@ -0,0 +1,174 @@
+"""
+Counters and cache statistics for keeping an eye on long-running
+processes (e.g., a render server).
+
+Everything is collected in METRICS, which can be snapshotted as JSON:
+
+    METRICS.snapshot()
+
+or in the Prometheus text exposition format:
+
+    METRICS.to_prometheus()
+"""
+from __future__ import annotations
+
+from threading import Lock
+from typing import Any, Optional
+
+# What each counter counts
+COUNTERS = {
+    "frames_rendered": "Frames of audio rendered by each instrument",
+    "notes_played": "Notes played by each instrument",
+    "clipped_samples": "Mixed samples that had to be clipped to fit the output",
+    "bytes_written": "Bytes of WAV data written",
+}
+
+# What each statistic reported for caches measures, and its Prometheus
+# type
+CACHE_METRICS = {
+    "hits": ("Lookups that found a cached value", "counter"),
+    "misses": ("Lookups that didn't find a cached value", "counter"),
+    "entries": ("Values held by the cache", "gauge"),
+    "size": ("Bytes held by the cache", "gauge"),
+}
+
+PREFIX = "blooper_"
+
+
+def cache_stats(cache: Any) -> dict[str, Optional[int]]:
+    """
+    The hits, misses, entries, and size (in bytes, if known) of either
+    an LRUCache or a function wrapped by functools.cache
+    """
+    stats = getattr(cache, "stats", None)
+
+    if stats is not None:
+        snapshot = stats()
+
+        return {
+            "hits": snapshot.hits,
+            "misses": snapshot.misses,
+            "entries": snapshot.entries,
+            "size": snapshot.size,
+        }
+
+    info = cache.cache_info()
+
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "entries": info.currsize,
+        "size": None,
+    }
+
+
+class MetricsRegistry:
+    """
+    A thread-safe collection of counters (each split up by labels) and
+    the caches being watched
+    """
+
+    def __init__(self):
+        self._counters: dict[str, dict[tuple[tuple[str, str], ...], int]] = {}
+        self._caches: dict[str, Any] = {}
+        self._lock = Lock()
+
+    def register_cache(self, name: str, cache: Any):
+        """
+        Report the statistics of a cache: either an LRUCache or a
+        function wrapped by functools.cache
+        """
+        with self._lock:
+            self._caches[name] = cache
+
+    def increment(self, name: str, value: int = 1, **labels: str):
+        """
+        Add to a counter
+        """
+        key = tuple(sorted(labels.items()))
+
+        with self._lock:
+            counter = self._counters.setdefault(name, {})
+            counter[key] = counter.get(key, 0) + value
+
+    def reset(self):
+        """
+        Set every counter back to 0. Caches are left as they are.
+        """
+        with self._lock:
+            self._counters.clear()
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        The current value of every counter and cache statistic, as
+        something that can be saved as JSON
+        """
+        with self._lock:
+            caches = dict(self._caches)
+            counters = {
+                name: [
+                    {"labels": dict(labels), "value": value}
+                    for labels, value in values.items()
+                ]
+                for name, values in self._counters.items()
+            }
+
+        return {
+            "caches": {name: cache_stats(cache) for name, cache in caches.items()},
+            "counters": {name: counters.get(name, []) for name in COUNTERS} | counters,
+        }
+
+    def to_prometheus(self) -> str:
+        """
+        The current value of every counter and cache statistic, in the
+        Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        lines = []
+
+        for name, values in snapshot["counters"].items():
+            metric = f"{PREFIX}{name}_total"
+            lines.append(f"# HELP {metric} {COUNTERS.get(name, name)}")
+            lines.append(f"# TYPE {metric} counter")
+
+            for value in values:
+                lines.append(f"{metric}{_labels(value['labels'])} {value['value']}")
+
+        for statistic, (description, kind) in CACHE_METRICS.items():
+            metric = f"{PREFIX}cache_{statistic}"
+            if kind == "counter":
+                metric += "_total"
+            elif statistic == "size":
+                metric += "_bytes"
+
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} {kind}")
+
+            for name, stats in snapshot["caches"].items():
+                if stats[statistic] is not None:
+                    lines.append(
+                        f"{metric}{_labels({'cache': name})} {stats[statistic]}"
+                    )
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: dict[str, str]) -> str:
+    """
+    Format labels for the Prometheus text format
+    """
+    if not labels:
+        return ""
+
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels.items()
+    )
+
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+METRICS = MetricsRegistry()
+
+
+__all__ = ("METRICS", "MetricsRegistry", "cache_stats")
@@ -3,12 +3,189 @@ Have instruments play through parts and bound them within a range.
 """
 from __future__ import annotations
 
+import math
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from dataclasses import dataclass
-from itertools import zip_longest
-from typing import Generator
+from operator import add
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import BinaryIO, Generator, Iterable, Iterator, Optional, Sequence
 
-from blooper.instruments import Instrument
+from blooper.instruments import (
+    BLOCK_SIZE,
+    Cursor,
+    Instrument,
+    batched,
+    unbatched,
+    zeroes,
+)
+from blooper.metrics import METRICS
 from blooper.parts import Part
+from blooper.profiling import Profiler, profiled
+
+
+def instrument_blocks(
+    instrument: Instrument,
+    part: Part,
+    sample_rate: int,
+    channels: int,
+    block_size: int = BLOCK_SIZE,
+) -> Iterator[Sequence[float]]:
+    """
+    Read an instrument's signal one block of interleaved samples at a
+    time. Every block but the last will contain exactly block_size
+    frames.
+
+    Instruments that support render_into fill a single reused buffer.
+    Anything else is read a frame at a time from play.
+    """
+    render_into = getattr(instrument, "render_into", None)
+
+    if render_into is None:
+        yield from batched(
+            instrument.play(part, sample_rate, channels=channels), block_size
+        )
+        return
+
+    block = zeroes(block_size * channels)
+
+    # Instruments using the standard render_into are read through a
+    # cursor of our own (rather than one kept by the instrument) so that
+    # nothing is left behind if the render is abandoned partway through
+    cursor = None
+    if getattr(type(instrument), "render_into", None) is Instrument.render_into:
+        cursor = Cursor(
+            iter(instrument.blocks(part, sample_rate, channels=channels)), channels
+        )
+
+    start = 0
+
+    while True:
+        if cursor is None:
+            written = render_into(part, sample_rate, block, start, channels=channels)
+        else:
+            written = cursor.read_into(block, block_size)
+
+        if written < block_size:
+            if written:
+                size = written * channels
+                yield block[:size]
+
+            return
+
+        yield block
+        start += written
+
+
+def render_to_file(
+    instrument: Instrument,
+    part: Part,
+    sample_rate: int,
+    channels: int,
+    path: Path,
+    block_size: int = BLOCK_SIZE,
+    start_frame: int = 0,
+    end_frame: Optional[int] = None,
+) -> int:
+    """
+    Write an instrument's signal to a file as raw (native) doubles.
+    Returns the number of frames written.
+
+    start_frame: The first frame of the signal to write.
+    end_frame: If supplied, stop writing before this frame.
+
+    Sections are written at the same position in the file as they would
+    be if the whole signal were written, so separate processes can each
+    write a section of the same (existing) file.
+    """
+    if start_frame or end_frame is not None:
+        blocks: Iterable[Sequence[float]] = instrument.blocks(
+            part, sample_rate, channels=channels, start_frame=start_frame
+        )
+    else:
+        blocks = instrument_blocks(instrument, part, sample_rate, channels, block_size)
+
+    remaining = None if end_frame is None else (end_frame - start_frame) * channels
+    frames = 0
+
+    with path.open("r+b" if path.exists() else "wb") as stream:
+        stream.seek(start_frame * channels * array("d").itemsize)
+
+        for block in blocks:
+            if not isinstance(block, array):
+                block = array("d", block)
+
+            if remaining is not None:
+                if len(block) > remaining:
+                    block = block[:remaining]
+
+                remaining -= len(block)
+
+            block.tofile(stream)
+            frames += len(block) // channels
+
+            if remaining == 0:
+                break
+
+    return frames
+
+
+def counted_blocks(
+    blocks: Iterable[Sequence[float]], instrument: Instrument, channels: int
+) -> Iterator[Sequence[float]]:
+    """
+    Pass blocks of interleaved samples through, counting the frames
+    each instrument renders (see blooper.metrics)
+    """
+    name = instrument.__class__.__name__
+
+    for block in blocks:
+        METRICS.increment("frames_rendered", len(block) // channels, instrument=name)
+        yield block
+
+
+def split_part(part: Part, sample_rate: int, count: int) -> list[int]:
+    """
+    Choose up to count - 1 measure boundaries that split a part into
+    roughly even sections.
+    """
+    boundaries = part.measure_boundaries(sample_rate)
+    end = boundaries[-1]
+
+    splits = set()
+    for index in range(1, count):
+        target = end * index / count
+        split = min(boundaries, key=lambda boundary: abs(boundary - target))
+
+        if 0 < split < end:
+            splits.add(split)
+
+    return sorted(splits)
+
+
+def file_blocks(
+    stream: BinaryIO, channels: int, block_size: int = BLOCK_SIZE
+) -> Iterator[array]:
+    """
+    Read a signal written by render_to_file one block of interleaved
+    samples at a time. Every block but the last will contain exactly
+    block_size frames.
+    """
+    size = block_size * channels * array("d").itemsize
+
+    while True:
+        data = stream.read(size)
+
+        if not data:
+            return
+
+        block = array("d")
+        block.frombytes(data)
+
+        yield block
 
 
 @dataclass(frozen=True)
@@ -52,8 +229,36 @@ class Mixer:
 
         return cls(instruments, parts, volumes)
 
+    def frame_count(self, sample_rate: int) -> Optional[int]:
+        """
+        How many frames mixing will produce, worked out without
+        rendering anything. None if any instrument can't tell how long
+        it will play for (see Instrument.frame_count).
+
+        sample_rate: how many samples per second
+        """
+        frames = 0
+
+        for instrument, part in zip(self.instruments, self.parts):
+            frame_count = getattr(instrument, "frame_count", None)
+            count = None if frame_count is None else frame_count(part, sample_rate)
+
+            if count is None:
+                return None
+
+            frames = max(frames, count)
+
+        return frames
+
     def mix(
-        self, sample_rate: int, channels: int, max_value: int
+        self,
+        sample_rate: int,
+        channels: int,
+        max_value: int,
+        *,
+        block_size: int = BLOCK_SIZE,
+        workers: Optional[int] = None,
+        profiler: Optional[Profiler] = None,
     ) -> Generator[tuple[int, ...], None, None]:
         """
         Mix all parts into a single bounded output
@@ -61,26 +266,223 @@ class Mixer:
         sample_rate: how many samples per second
         channels: how many channels of audio to output
         max_value: The upper/lower bound for samples
+        block_size: How many frames to read from each instrument at once
+        workers: If supplied, how many processes to render parts in
+        profiler: If supplied, where to collect how long each stage of
+            rendering takes (see blooper.profiling)
+        """
+        yield from unbatched(
+            self.blocks(
+                sample_rate,
+                channels,
+                max_value,
+                block_size=block_size,
+                workers=workers,
+                profiler=profiler,
+            ),
+            channels,
+        )
+
+    def blocks(
+        self,
+        sample_rate: int,
+        channels: int,
+        max_value: int,
+        *,
+        block_size: int = BLOCK_SIZE,
+        typecode: str = "q",
+        workers: Optional[int] = None,
+        profiler: Optional[Profiler] = None,
+    ) -> Iterator[array]:
+        """
+        Mix all parts into a single bounded output, one block of
+        interleaved integer samples at a time. Every block but the last
+        will contain exactly block_size frames.
+
+        sample_rate: how many samples per second
+        channels: how many channels of audio to output
+        max_value: The upper/lower bound for samples
+        block_size: How many frames to mix at once
+        typecode: The array typecode to store samples as. It must be
+            an integer type large enough to hold max_value
+        workers: If supplied, each part is rendered to a temporary file
+            in a separate process (using at most this many processes at
+            once) before mixing. Instruments and parts must be
+            picklable. The output is identical to mixing serially.
+        profiler: If supplied, where to collect how long each stage of
+            rendering takes (see blooper.profiling)
+        """
+        blocks = self._blocks(
+            sample_rate, channels, max_value, block_size, typecode, workers, profiler
+        )
+
+        if profiler is None:
+            return blocks
+
+        return profiled(blocks, profiler, "Mixer.mix", channels=channels)
+
+    def _blocks(
+        self,
+        sample_rate: int,
+        channels: int,
+        max_value: int,
+        block_size: int,
+        typecode: str,
+        workers: Optional[int],
+        profiler: Optional[Profiler],
+    ) -> Iterator[array]:
+        """
+        Implementation of blocks
         """
+        streams: Sequence[Iterator[Sequence[float]]]
 
-        for sample_sets in zip_longest(
-            *(
-                instrument.play(part, sample_rate, channels=channels)
-                for instrument, part in zip(self.instruments, self.parts)
-            )
-        ):
-            mixed = [0] * channels
+        with ExitStack() as stack:
+            if workers is None or workers < 2:
+                streams = [
+                    instrument_blocks(
+                        instrument, part, sample_rate, channels, block_size
+                    )
+                    for instrument, part in zip(self.instruments, self.parts)
+                ]
+            else:
+                started = time.perf_counter()
+                streams = self._rendered_blocks(
+                    stack, sample_rate, channels, block_size, workers
+                )
 
-            for sample_set, volume in zip(sample_sets, self.volumes):
-                if sample_set is None:
+                if profiler is not None:
+                    profiler.add("Mixer.workers", time.perf_counter() - started)
+
+            streams = [
+                counted_blocks(stream, instrument, channels)
+                for instrument, stream in zip(self.instruments, streams)
+            ]
+
+            if profiler is not None:
+                streams = [
+                    profiled(
+                        stream,
+                        profiler,
+                        "Instrument.render",
+                        instrument=f"{index}:{instrument.__class__.__name__}",
+                        channels=channels,
+                    )
+                    for index, (instrument, stream) in enumerate(
+                        zip(self.instruments, streams)
+                    )
+                ]
+
+            yield from self._mix_blocks(streams, max_value, typecode)
+
+    def _rendered_blocks(
+        self,
+        stack: ExitStack,
+        sample_rate: int,
+        channels: int,
+        block_size: int,
+        workers: int,
+    ) -> list[Iterator[array]]:
+        """
+        Render every part in a pool of processes, returning a stream of
+        blocks for each. Files will be cleaned up when the stack closes.
+
+        If there are fewer parts than workers, parts played by seekable
+        instruments are split at measure boundaries and each section is
+        rendered separately.
+        """
+        directory = Path(stack.enter_context(TemporaryDirectory()))
+        paths = [directory / f"{index}.raw" for index in range(len(self.parts))]
+        sections = math.ceil(workers / max(len(self.parts), 1))
+
+        jobs = []
+        for instrument, part, path in zip(self.instruments, self.parts, paths):
+            path.touch()
+
+            splits = []
+            if sections > 1 and getattr(instrument, "seekable", False):
+                splits = split_part(part, sample_rate, sections)
+
+            for start, end in zip([0, *splits], [*splits, None]):
+                jobs.append(
+                    (
+                        instrument,
+                        part,
+                        sample_rate,
+                        channels,
+                        path,
+                        block_size,
+                        start,
+                        end,
+                    )
+                )
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for _ in pool.map(render_to_file, *zip(*jobs)):
+                pass
+
+        return [
+            file_blocks(stack.enter_context(path.open("rb")), channels, block_size)
+            for path in paths
+        ]
+
+    def _mix_blocks(
+        self,
+        streams: Sequence[Iterator[Sequence[float]]],
+        max_value: int,
+        typecode: str,
+    ) -> Iterator[array]:
+        """
+        Sum blocks from each stream, then round and bound them
+        """
+        minimum = -max_value
+
+        while True:
+            blocks = [next(stream, None) for stream in streams]
+            size = max((len(block) for block in blocks if block), default=0)
+
+            if not size:
+                break
+
+            mixed = zeroes(size)
+
+            for block, volume in zip(blocks, self.volumes):
+                if not block:
                     continue
 
-                for channel, sample in enumerate(sample_set):
-                    mixed[channel] += sample * max_value * volume
+                # instruments that have finished early are silent for
+                # the rest of the block
+                length = len(block)
+                mixed[:length] = array(
+                    "d",
+                    map(
+                        add,
+                        mixed,
+                        [sample * max_value * volume for sample in block],
+                    ),
+                )
+
+            rounded = list(map(round, mixed))
+
+            if max(rounded) > max_value or min(rounded) < minimum:
+                METRICS.increment(
+                    "clipped_samples",
+                    sum(
+                        1
+                        for sample in rounded
+                        if sample > max_value or sample < minimum
+                    ),
+                )
+
+                rounded = [max(minimum, min(max_value, sample)) for sample in rounded]
 
-            yield tuple(
-                max(-max_value, min(max_value, round(sample))) for sample in mixed
-            )
+            yield array(typecode, rounded)
 
 
-__all__ = ("Mixer",)
+__all__ = (
+    "Mixer",
+    "counted_blocks",
+    "file_blocks",
+    "instrument_blocks",
+    "render_to_file",
+    "split_part",
+)
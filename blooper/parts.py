@@ -10,14 +10,30 @@ allow for polyphonics.
 """
 from __future__ import annotations
 
-from dataclasses import dataclass
+import math
+from array import array
+from dataclasses import dataclass, replace
 from enum import IntEnum
 from fractions import Fraction
-from typing import Generator, Iterable, NamedTuple, Optional, cast
+from typing import Any, Generator, Iterable, Iterator, NamedTuple, Optional, cast
 
 from blooper.keys import KEYS, Key
 from blooper.notes import TAILOFF_FACTOR, Accent, Dynamic, Note, Notes, Rest, Tone
-from blooper.pitch import Chord
+from blooper.pitch import Chord, Tuning
+
+
+def _divide(numerator: int, denominator: int) -> int:
+    """
+    Divide two (positive) integers, rounding to the nearest integer.
+    Ties round to even, matching round.
+    """
+    quotient, remainder = divmod(numerator, denominator)
+    remainder *= 2
+
+    if remainder > denominator or (remainder == denominator and quotient % 2):
+        quotient += 1
+
+    return quotient
 
 
 class TimeSignature(NamedTuple):
@@ -73,6 +89,55 @@ class Tempo(IntEnum):
     PRESTISSIMO = 240
 
 
+# Accents are stored in event tables as their index in this tuple (or -1
+# for no accent)
+ACCENTS = tuple(Accent)
+
+
+@dataclass(frozen=True)
+class EventTable:
+    """
+    The tones of a part converted into columns of numbers for a specific
+    sample rate and tuning (see Part.compile).
+
+    Event i starts on sample starts[i] and lasts durations[i] samples.
+    It plays frequencies[offsets[i]:offsets[i + 1]] (one frequency for
+    each pitch, in the order the pitches were written). dynamics holds
+    the value of each event's Dynamic and accents holds the index of
+    each event's accent within ACCENTS (-1 if there isn't one).
+
+    The tones that each event was converted from are kept in tones.
+    """
+
+    sample_rate: int
+    starts: array
+    durations: array
+    offsets: array
+    frequencies: array
+    dynamics: array
+    accents: array
+    tones: tuple[Tone, ...]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def events(self) -> Iterator[tuple[int, int, Tone, tuple[float, ...]]]:
+        """
+        Iterate over events as tuples containing the sample to start
+        on, the duration (in samples), the tone, and the frequency of
+        each of the tone's pitches.
+        """
+        frequencies = self.frequencies
+        offsets = self.offsets
+
+        for index, (start, duration, tone) in enumerate(
+            zip(self.starts, self.durations, self.tones)
+        ):
+            first = offsets[index]
+            last = offsets[index + 1]
+            yield start, duration, tone, tuple(frequencies[first:last])
+
+
 @dataclass
 class State:
     time: TimeSignature
@@ -114,6 +179,24 @@ class Measure:
 
         return 0
 
+    def _contents(self) -> tuple:
+        """
+        A copy of everything that determines how the measure is played.
+        Copies of an unchanged measure compare equal (cheaply, as they
+        share all the same immutable notes and values).
+        """
+        return (
+            self.time,
+            tuple(self.notes),
+            tuple(self.tempos.items()),
+            tuple(self.dynamics.items()),
+            tuple(
+                (position, tuple(accidentals.items()))
+                for position, accidentals in self.accidentals.items()
+            ),
+            tuple(self.keys.items()),
+        )
+
     def add(
         self,
         note: Note | Rest | Notes,
@@ -193,146 +276,181 @@ class Measure:
 
         measure_size = state.time.beat_size * state.time.beats_per_measure
 
-        position = Fraction(0, 1)
+        notes: list[Note | Rest] = []
+        for element in self.notes:
+            if isinstance(element, (Note, Rest)):
+                notes.append(element)
+            else:
+                notes.extend(element.notes(state.time.beat_size))
+
+        changes: list[Fraction | int] = [
+            *self.tempos,
+            *self.dynamics,
+            *self.accidentals,
+            *self.keys,
+        ]
+
+        # Positions are tracked in integer ticks, with enough ticks to a
+        # whole note that every note and change lands exactly on one
+        resolution = math.lcm(
+            measure_size.denominator,
+            *(note.duration.denominator for note in notes),
+            *(change.denominator for change in changes),
+        )
+
+        def ticks(value: Fraction | int) -> int:
+            return value.numerator * (resolution // value.denominator)
+
+        def beats(count: int) -> Fraction:
+            return Fraction(count, resolution)
 
-        tempo_changes = sorted(self.tempos.items())
-        dynamic_changes = sorted(self.dynamics.items())
-        measure_accidentals = sorted(self.accidentals.items())
-        key_changes = sorted(self.keys.items())
+        measure_ticks = ticks(measure_size)
+        position = 0
+
+        tempo_changes = sorted(
+            (ticks(change), tempo) for change, tempo in self.tempos.items()
+        )
+        dynamic_changes = sorted(
+            (ticks(change), dynamic) for change, dynamic in self.dynamics.items()
+        )
+        measure_accidentals = sorted(
+            (ticks(change), accidentals)
+            for change, accidentals in self.accidentals.items()
+        )
+        key_changes = sorted((ticks(change), key) for change, key in self.keys.items())
 
         accidentals = {}
 
-        for element in self.notes:
-            if isinstance(element, (Note, Rest)):
-                notes: Iterable[Note | Rest] = [element]
-            else:
-                notes = element.notes(state.time.beat_size)
+        for note in notes:
+            note_ticks = ticks(note.duration)
+
+            if position + note_ticks > measure_ticks:
+                raise ValueError(
+                    f"Error at beat {self._position(state.time, beats(position))}: "
+                    "Note extends past measure."
+                )
 
-            for note in notes:
-                if position + note.duration > measure_size:
+            if tempo_changes:
+                change_position = tempo_changes[0][0]
+                if change_position < position:
                     raise ValueError(
-                        f"Error at beat {self._position(state.time, position)}: "
-                        "Note extends past measure."
+                        "Error at beat "
+                        f"{self._position(state.time, beats(change_position))}: "
+                        "Tempo change mid-note. Use a tie."
                     )
+                elif change_position == position:
+                    state.tempo = tempo_changes.pop(0)[1]
 
-                if tempo_changes:
-                    change_position = tempo_changes[0][0]
-                    if change_position < position:
-                        raise ValueError(
-                            "Error at beat "
-                            f"{self._position(state.time, change_position)}: "
-                            "Tempo change mid-note. Use a tie."
-                        )
-                    elif change_position == position:
-                        state.tempo = tempo_changes.pop(0)[1]
+            if dynamic_changes:
+                change_position = dynamic_changes[0][0]
+                if change_position < position:
+                    raise ValueError(
+                        "Error at beat "
+                        f"{self._position(state.time, beats(change_position))}: "
+                        "Tempo change mid-note. Use a tie."
+                    )
+                elif change_position == position:
+                    state.dynamic = dynamic_changes.pop(0)[1]
 
-                if dynamic_changes:
-                    change_position = dynamic_changes[0][0]
-                    if change_position < position:
-                        raise ValueError(
-                            "Error at beat "
-                            f"{self._position(state.time, change_position)}: "
-                            "Tempo change mid-note. Use a tie."
-                        )
-                    elif change_position == position:
-                        state.dynamic = dynamic_changes.pop(0)[1]
+            if measure_accidentals:
+                change_position = measure_accidentals[0][0]
+                if change_position < position:
+                    raise ValueError(
+                        "Error at beat "
+                        f"{self._position(state.time, beats(change_position))}: "
+                        "Accidental added mid-note. Use a tie."
+                    )
+                elif change_position == position:
+                    accidentals.update(measure_accidentals.pop(0)[1])
 
-                if measure_accidentals:
-                    change_position = measure_accidentals[0][0]
-                    if change_position < position:
+            if key_changes:
+                change_position = key_changes[0][0]
+                if change_position < position:
+                    raise ValueError(
+                        "Error at beat "
+                        f"{self._position(state.time, beats(change_position))}: "
+                        "Tempo change mid-note. Use a tie."
+                    )
+                elif change_position == position:
+                    state.key = key_changes.pop(0)[1]
+
+            if isinstance(note, Note):
+                if note.tone.accent:
+                    if (
+                        state.time.beat_size < note.duration
+                        and not note.tone.accent.long()
+                    ):
                         raise ValueError(
                             "Error at beat "
-                            f"{self._position(state.time, change_position)}: "
-                            "Accidental added mid-note. Use a tie."
+                            f"{self._position(state.time, beats(position))}: "
+                            f"invalid accent for a long note: {note.tone.accent}"
                         )
-                    elif change_position == position:
-                        accidentals.update(measure_accidentals.pop(0)[1])
 
-                if key_changes:
-                    change_position = key_changes[0][0]
-                    if change_position < position:
+                    if not note.tone.accent.can_follow(state.previous_accent):
                         raise ValueError(
                             "Error at beat "
-                            f"{self._position(state.time, change_position)}: "
-                            "Tempo change mid-note. Use a tie."
+                            f"{self._position(state.time, beats(position))}: "
+                            f"accent {note.tone.accent} can not follow "
+                            f"{state.previous_accent}"
                         )
-                    elif change_position == position:
-                        state.key = key_changes.pop(0)[1]
-
-                if isinstance(note, Note):
-                    if note.tone.accent:
-                        if (
-                            state.time.beat_size < note.duration
-                            and not note.tone.accent.long()
-                        ):
-                            raise ValueError(
-                                "Error at beat "
-                                f"{self._position(state.time, position)}: "
-                                f"invalid accent for a long note: {note.tone.accent}"
-                            )
-
-                        if not note.tone.accent.can_follow(state.previous_accent):
-                            raise ValueError(
-                                "Error at beat "
-                                f"{self._position(state.time, position)}: "
-                                f"accent {note.tone.accent} can not follow "
-                                f"{state.previous_accent}"
-                            )
-
-                    duration, pitch, dynamic, accent = note.components(
-                        state.time.beat_size, tailoff_factor=state.tailoff_factor
-                    )
 
-                    pitch = Chord(
-                        *(
-                            state.key.in_key(p, accidentals.get(p.pitch_class))
-                            for p in pitch.pitches
-                        )
+                duration, pitch, dynamic, accent = note.components(
+                    state.time.beat_size, tailoff_factor=state.tailoff_factor
+                )
+
+                pitch = Chord(
+                    *(
+                        state.key.in_key(p, accidentals.get(p.pitch_class))
+                        for p in pitch.pitches
                     )
+                )
 
-                    yield Note(duration, Tone(pitch, dynamic or state.dynamic, accent))
+                yield Note(duration, Tone(pitch, dynamic or state.dynamic, accent))
 
-                    if duration != note.duration:
-                        yield Rest(note.duration - duration)
+                if duration != note.duration:
+                    yield Rest(note.duration - duration)
 
-                    position += note.duration
-                    state.previous_accent = note.tone.accent
-                else:
-                    # we could catch slur-to-rest here but we can't catch
-                    # them between measures or at the end of a song so we
-                    # might as well leave them for elsewhere
+                position += note_ticks
+                state.previous_accent = note.tone.accent
+            else:
+                # we could catch slur-to-rest here but we can't catch
+                # them between measures or at the end of a song so we
+                # might as well leave them for elsewhere
 
-                    yield note
-                    position += note.duration
-                    state.previous_accent = None
+                yield note
+                position += note_ticks
+                state.previous_accent = None
 
         if tempo_changes:
             raise ValueError(
-                f"Error at beat {self._position(state.time, tempo_changes[0][0])}: "
+                "Error at beat "
+                f"{self._position(state.time, beats(tempo_changes[0][0]))}: "
                 "Tempo change after last note in measure."
             )
 
         if dynamic_changes:
             raise ValueError(
-                f"Error at beat {self._position(state.time, dynamic_changes[0][0])}: "
+                "Error at beat "
+                f"{self._position(state.time, beats(dynamic_changes[0][0]))}: "
                 "Dynamic change after last note in measure."
             )
 
         if measure_accidentals:
             raise ValueError(
                 "Error at beat "
-                f"{self._position(state.time, measure_accidentals[0][0])}: "
+                f"{self._position(state.time, beats(measure_accidentals[0][0]))}: "
                 "Accidental after last note in measure."
             )
 
         if key_changes:
             raise ValueError(
-                f"Error at beat {self._position(state.time, key_changes[0][0])}: "
+                "Error at beat "
+                f"{self._position(state.time, beats(key_changes[0][0]))}: "
                 "Key change after last note in measure."
             )
 
-        if position < measure_size:
-            yield Rest(measure_size - position)
+        if position < measure_ticks:
+            yield Rest(beats(measure_ticks - position))
 
 
 class Part:
@@ -364,6 +482,9 @@ class Part:
         self.key = key
         self._tailoff_factor = _tailoff_factor
 
+        self._compiled: dict[tuple[int, Tuning], EventTable] = {}
+        self._compiled_from: Any = None
+
     def concurrence(self) -> int:
         """
         How many concurrent tones are played in the part
@@ -373,6 +494,80 @@ class Part:
 
         return max(measure.concurrence() for measure in self.measures)
 
+    def compile(self, sample_rate: int, tuning: Tuning) -> EventTable:
+        """
+        Convert a part into an EventTable for a given sample rate and
+        tuning.
+
+        Tables are kept until the part changes (including any changes
+        to its measures) so playing a part several times only converts
+        it once.
+
+        sample_rate: how many samples the recording will use for each second.
+        tuning: how to convert pitches into frequencies
+        """
+        contents = self._contents()
+
+        if contents != self._compiled_from:
+            self._compiled = {}
+            self._compiled_from = contents
+
+        key = (sample_rate, tuning)
+        table = self._compiled.get(key)
+
+        if table is None:
+            table = self._compiled[key] = self._compile(sample_rate, tuning)
+
+        return table
+
+    def _contents(self) -> tuple:
+        """
+        A copy of everything that determines how the part is played,
+        for noticing when a compiled table is out of date.
+        """
+        return (
+            self.time,
+            self.tempo,
+            self.dynamic,
+            self.key,
+            self._tailoff_factor,
+            tuple((measure, measure._contents()) for measure in self.measures),
+        )
+
+    def _compile(self, sample_rate: int, tuning: Tuning) -> EventTable:
+        """
+        Implementation of compile, bypassing the stored tables
+        """
+        starts = array("q")
+        durations = array("q")
+        offsets = array("q", [0])
+        frequencies = array("d")
+        dynamics = array("i")
+        accents = array("b")
+        tones = []
+
+        for start, duration, tone in self.tones(sample_rate):
+            starts.append(start)
+            durations.append(duration)
+            frequencies.extend(
+                tuning.pitch_to_frequency(pitch) for pitch in tone.pitches
+            )
+            offsets.append(len(frequencies))
+            dynamics.append(cast(Dynamic, tone.dynamic).value)
+            accents.append(-1 if tone.accent is None else ACCENTS.index(tone.accent))
+            tones.append(tone)
+
+        return EventTable(
+            sample_rate,
+            starts,
+            durations,
+            offsets,
+            frequencies,
+            dynamics,
+            accents,
+            tuple(tones),
+        )
+
     def tones(
         self,
         sample_rate: int,
@@ -385,6 +580,79 @@ class Part:
 
         sample_rate: how many samples the recording will use for each second.
         """
+        yield from self._tones(sample_rate)
+
+    def duration_samples(self, sample_rate: int) -> int:
+        """
+        How many samples long the part is: the sample its final measure
+        ends on (including any rests at the end). Instruments may keep
+        sounding after this as the final tone is released (see
+        Instrument.frame_count).
+
+        sample_rate: how many samples the recording will use for each second.
+        """
+        return self.measure_boundaries(sample_rate)[-1]
+
+    def measure_boundaries(self, sample_rate: int) -> list[int]:
+        """
+        The 0-indexed sample each measure starts on, followed by the
+        sample the final measure ends on. Rendering can be split at any
+        of these points.
+
+        sample_rate: how many samples the recording will use for each second.
+        """
+        boundaries: list[int] = []
+
+        for _ in self._tones(sample_rate, boundaries):
+            pass
+
+        return boundaries
+
+    def _measure_signatures(
+        self, sample_rate: int
+    ) -> tuple[list[tuple], list[int], list[int]]:
+        """
+        Work out everything that determines how each measure sounds: its
+        contents, everything carried over into it from earlier measures
+        (including the sample it starts on), and whether it's the final
+        measure. A measure with the same signature as before plays
+        exactly the same tones.
+
+        Also returns the boundaries of each measure (as with
+        measure_boundaries) and the sample each tone starts on.
+        """
+        boundaries: list[int] = []
+        checkpoints: list[tuple] = []
+        starts = [
+            start for start, _, _ in self._tones(sample_rate, boundaries, checkpoints)
+        ]
+        last = len(self.measures) - 1
+
+        signatures: list[tuple] = [
+            (measure._contents(), checkpoint, index == last)
+            for index, (measure, checkpoint) in enumerate(
+                zip(self.measures, checkpoints)
+            )
+        ]
+
+        return signatures, boundaries, starts
+
+    def _tones(
+        self,
+        sample_rate: int,
+        boundaries: Optional[list[int]] = None,
+        checkpoints: Optional[list[tuple]] = None,
+    ) -> Generator[tuple[int, int, Tone], None, None]:
+        """
+        Implementation of tones.
+
+        boundaries: If supplied, the starting sample of each measure
+            (and the end of the part) will be appended to it.
+        checkpoints: If supplied, everything carried over into each
+            measure (the sample it starts on, the part's state, where
+            it falls in the current tempo, and any tone being tied into
+            it) will be appended to it.
+        """
         state = State(
             self.time,
             self.tempo,
@@ -398,23 +666,65 @@ class Part:
         tied_tone = None
 
         samples_per_minute = sample_rate * 60
-        tempo = state.tempo
-        samples_per_beat = round(samples_per_minute / tempo)
+
+        # Time is tracked in integer ticks (with enough ticks to a whole
+        # note that every note so far lands exactly on one) since the
+        # last time the tempo or time signature changed. Samples are
+        # worked out from the total ticks so far rather than note by
+        # note, so rounding never accumulates.
+        resolution = 1
+        ticks = 0
+        segment_start = 0
+        # samples per tick is (samples_per_whole / resolution)
+        samples_per_whole = Fraction(0)
+        tempo = None
+        time = None
 
         index = 0
         for measure_index, measure in enumerate(self.measures):
+            if boundaries is not None:
+                boundaries.append(index)
+
+            if checkpoints is not None:
+                checkpoints.append(
+                    (
+                        index,
+                        replace(state),
+                        (tempo, time, segment_start, Fraction(ticks, resolution)),
+                        (tied_index, tied_duration, tied_tone),
+                    )
+                )
+
             try:
                 for note in measure.play(state):
-                    if tempo != state.tempo:
+                    if tempo != state.tempo or time != state.time:
                         tempo = state.tempo
-                        samples_per_beat = round(samples_per_minute / tempo)
-
-                    note_duration = duration = round(
-                        samples_per_beat
-                        * state.time.beat_size.denominator
-                        * note.duration
+                        time = state.time
+                        # a beat lasts a minute / tempo, and there are as
+                        # many beats to a whole note as the time
+                        # signature's lower number
+                        samples_per_whole = (
+                            Fraction(samples_per_minute)
+                            / Fraction(tempo)
+                            * Fraction(time.beat_size).denominator
+                        )
+                        segment_start = index
+                        ticks = 0
+
+                    denominator = note.duration.denominator
+                    if resolution % denominator:
+                        scale = denominator // math.gcd(resolution, denominator)
+                        resolution *= scale
+                        ticks *= scale
+
+                    ticks += note.duration.numerator * (resolution // denominator)
+                    end = segment_start + _divide(
+                        ticks * samples_per_whole.numerator,
+                        resolution * samples_per_whole.denominator,
                     )
 
+                    note_duration = duration = end - index
+
                     if isinstance(note, Rest):
                         if tied_tone is not None:
                             raise ValueError("Cannot slur/tie into a rest")
@@ -461,8 +771,20 @@ class Part:
                 print(f"Error occured at measure {measure}:")
                 raise
 
+        if boundaries is not None:
+            boundaries.append(index)
+
         if tied_tone:
             raise ValueError("Hanging slur/tie at end of part")
 
 
-__all__ = ("COMMON_TIME", "WALTZ_TIME", "Measure", "Part", "Tempo", "TimeSignature")
+__all__ = (
+    "ACCENTS",
+    "COMMON_TIME",
+    "WALTZ_TIME",
+    "EventTable",
+    "Measure",
+    "Part",
+    "Tempo",
+    "TimeSignature",
+)
@@ -6,9 +6,11 @@ from __future__ import annotations
 import re
 from dataclasses import dataclass
 from fractions import Fraction
-from functools import cache
 from typing import Any, Optional
 
+from blooper.caches import cached_function, cached_method
+from blooper.metrics import METRICS
+
 # just normal music stuff
 SUBSCRIPTS = {
     "-": "₋",
@@ -71,7 +73,7 @@ SHARP = ACCIDENTAL_NAMES["sharp"]
 DOUBLE_SHARP = ACCIDENTAL_SYMBOLS["𝄪"]
 
 
-@cache
+@cached_function()
 def accidental_symbol(accidental: Fraction) -> str:
     """
     Get the set of symbols that represents an accidental
@@ -296,7 +298,7 @@ class Scale:
             )
         )
 
-    @cache
+    @cached_method()
     def position(self, pitch: Pitch) -> tuple[int, int]:
         """
         Get the order and step within an order for a given pitch.
@@ -405,7 +407,7 @@ class Tuning:
         self.order = order
         self.frequency = frequency
 
-    # needed so we can cache pitch_to_frequency
+    # needed so tunings can be used as keys (e.g., when compiling parts)
     def __hash__(self) -> int:
         return hash(
             (
@@ -416,7 +418,7 @@ class Tuning:
             )
         )
 
-    @cache
+    @cached_method()
     def pitch_to_frequency(self, pitch: Pitch) -> float:
         """
         Calculate the frequency of a supplied pitch
@@ -426,8 +428,13 @@ class Tuning:
         if pitch == self.standard_pitch:
             return self.standard_frequency
 
-        order, step = self.scale.position(pitch)
+        return self.position_to_frequency(*self.scale.position(pitch))
 
+    def position_to_frequency(self, order: int, step: int) -> float:
+        """
+        Calculate the frequency of the pitch at a given order and step
+        (see Scale.position)
+        """
         if step == self.standard_step:
             frequency = self.standard_frequency
             step = 0
@@ -445,6 +452,10 @@ class Tuning:
 
 A440 = Tuning(Pitch(4, "A"), 440)
 
+METRICS.register_cache("accidental_symbol", accidental_symbol)
+METRICS.register_cache("Scale.position", Scale.position)
+METRICS.register_cache("Tuning.pitch_to_frequency", Tuning.pitch_to_frequency)
+
 
 __all__ = (
     "A440",
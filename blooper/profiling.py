@@ -0,0 +1,282 @@
+"""
+Find out where the time goes while rendering.
+
+Pass a Profiler to record (or Mixer.mix/Mixer.blocks) and it will
+collect how long each stage of rendering took, how many times it ran,
+and how many frames it produced, for each instrument in the mix:
+
+    profiler = Profiler()
+    record(path, mixer, profiler=profiler)
+    print(profiler.report().to_json())
+
+Stages nest (e.g., Instrument.render includes the Envelope.render and
+Waveform.samples calls made while rendering), so each stage's time
+includes the time of any stages within it. Stages run in other
+processes (see Mixer.blocks's workers) aren't collected.
+
+Nothing is collected (and very little time is spent checking) unless
+a profiler has been supplied.
+"""
+from __future__ import annotations
+
+from contextvars import ContextVar
+from dataclasses import dataclass
+from threading import Lock
+from time import perf_counter
+from typing import Any, Iterable, Iterator, Optional, Sized, TypeVar, cast
+
+Item = TypeVar("Item")
+
+# The profiler collecting stats for whatever is currently being
+# rendered, along with the instrument doing the rendering (if known)
+_ACTIVE: ContextVar[Optional[tuple[Profiler, Optional[str]]]] = ContextVar(
+    "profiler", default=None
+)
+
+_FINISHED = object()
+
+
+@dataclass(frozen=True)
+class StageStats:
+    """
+    How much time a stage took over the course of a render
+    """
+
+    stage: str
+    instrument: Optional[str]  # None for stages not run by an instrument
+    calls: int
+    frames: int
+    seconds: float
+
+    @property
+    def frames_per_second(self) -> float:
+        """
+        How many frames the stage produced a second (0 if no time was
+        spent in it)
+        """
+        return self.frames / self.seconds if self.seconds else 0.0
+
+
+@dataclass(frozen=True)
+class ProfileReport:
+    """
+    A snapshot of everything a profiler has collected
+    """
+
+    stages: tuple[StageStats, ...]
+
+    def stage(self, name: str) -> StageStats:
+        """
+        The combined stats for a stage across all instruments
+        """
+        matching = [stats for stats in self.stages if stats.stage == name]
+
+        if not matching:
+            raise KeyError(name)
+
+        return StageStats(
+            name,
+            None,
+            sum(stats.calls for stats in matching),
+            sum(stats.frames for stats in matching),
+            sum(stats.seconds for stats in matching),
+        )
+
+    @property
+    def instruments(self) -> tuple[str, ...]:
+        """
+        Every instrument that stats were collected for
+        """
+        return tuple(
+            dict.fromkeys(
+                stats.instrument
+                for stats in self.stages
+                if stats.instrument is not None
+            )
+        )
+
+    def to_json(self) -> dict[str, Any]:
+        """
+        A JSON-serializable version of the report
+        """
+        return {
+            "stages": [
+                {
+                    "stage": stats.stage,
+                    "instrument": stats.instrument,
+                    "calls": stats.calls,
+                    "frames": stats.frames,
+                    "seconds": stats.seconds,
+                    "frames_per_second": stats.frames_per_second,
+                }
+                for stats in self.stages
+            ]
+        }
+
+
+class Profiler:
+    """
+    Collects the time spent in each stage of rendering, per instrument.
+    A profiler can be shared by several renders (including ones running
+    in different threads) and will combine their stats.
+    """
+
+    def __init__(self):
+        self._stages: dict[tuple[str, Optional[str]], list] = {}
+        self._lock = Lock()
+
+    def add(
+        self,
+        stage: str,
+        seconds: float,
+        *,
+        frames: int = 0,
+        calls: int = 1,
+        instrument: Optional[str] = None,
+    ):
+        """
+        Record time spent in a stage
+        """
+        with self._lock:
+            stats = self._stages.setdefault((stage, instrument), [0, 0, 0.0])
+            stats[0] += calls
+            stats[1] += frames
+            stats[2] += seconds
+
+    def report(self) -> ProfileReport:
+        """
+        Everything collected so far, in the order stages first ran
+        """
+        with self._lock:
+            return ProfileReport(
+                tuple(
+                    StageStats(stage, instrument, calls, frames, seconds)
+                    for (stage, instrument), (
+                        calls,
+                        frames,
+                        seconds,
+                    ) in self._stages.items()
+                )
+            )
+
+    def clear(self):
+        """
+        Discard everything collected so far
+        """
+        with self._lock:
+            self._stages.clear()
+
+
+def profiled(
+    iterable: Iterable[Item],
+    profiler: Profiler,
+    stage: Optional[str] = None,
+    *,
+    instrument: Optional[str] = None,
+    channels: int = 0,
+) -> Iterator[Item]:
+    """
+    Iterate with a profiler collecting stats from every stage run while
+    producing each item.
+
+    stage: If supplied, the time spent producing items is recorded
+        under this stage
+    instrument: The instrument producing the items, which stages run
+        while producing them are recorded under
+    channels: If supplied, items are blocks of interleaved samples with
+        this many channels, and the frames they contain are counted
+    """
+    iterator = iter(iterable)
+    active = (profiler, instrument)
+
+    try:
+        while True:
+            token = _ACTIVE.set(active)
+            started = perf_counter()
+
+            try:
+                item = next(iterator, _FINISHED)
+            finally:
+                seconds = perf_counter() - started
+                _ACTIVE.reset(token)
+
+            if item is _FINISHED:
+                if stage is not None:
+                    profiler.add(stage, seconds, calls=0, instrument=instrument)
+
+                return
+
+            if stage is not None:
+                frames = len(cast(Sized, item)) // channels if channels else 0
+                profiler.add(stage, seconds, frames=frames, instrument=instrument)
+
+            yield cast(Item, item)
+    finally:
+        close = getattr(iterator, "close", None)
+
+        if close is not None:
+            token = _ACTIVE.set(active)
+
+            try:
+                close()
+            finally:
+                _ACTIVE.reset(token)
+
+
+def timed(iterable: Iterable[Item], stage: str, channels: int = 0) -> Iterable[Item]:
+    """
+    Record the time spent producing each item of a lazily-produced
+    signal under a stage, if anything is being profiled. If not, the
+    iterable is returned unchanged.
+
+    channels: If supplied, items are interleaved samples with this many
+        channels, and the frames they contain are counted
+    """
+    active = _ACTIVE.get()
+
+    if active is None:
+        return iterable
+
+    profiler, instrument = active
+
+    return profiled(iterable, profiler, stage, instrument=instrument, channels=channels)
+
+
+def start_stage() -> Optional[float]:
+    """
+    When a stage started, or None if nothing is being profiled. Pass
+    the result to end_stage once the stage is done.
+    """
+    if _ACTIVE.get() is None:
+        return None
+
+    return perf_counter()
+
+
+def end_stage(stage: str, started: Optional[float], frames: int = 0):
+    """
+    Record the time spent in a stage since start_stage was called
+
+    frames: How many frames the stage produced
+    """
+    if started is None:
+        return
+
+    active = _ACTIVE.get()
+
+    if active is not None:
+        profiler, instrument = active
+        profiler.add(
+            stage, perf_counter() - started, frames=frames, instrument=instrument
+        )
+
+
+__all__ = (
+    "ProfileReport",
+    "Profiler",
+    "StageStats",
+    "end_stage",
+    "profiled",
+    "start_stage",
+    "timed",
+)
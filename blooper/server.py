@@ -0,0 +1,286 @@
+"""
+A long-lived local server that renders sequences on request, so caches
+(decoded samples, rendered notes, compiled parts) stay warm between
+jobs.
+
+Jobs are POSTed to /render as JSON:
+
+    {"args": ["--notes", "a3", "b3", "c4", "--wave", "saw"]}
+
+where args are the sequencer's arguments (without the path). The
+response is a WAV file, streamed as it is rendered. sample_rate,
+channels, and bits_per_sample may also be supplied.
+
+GET /status describes how the server's caches are being used, and
+GET /metrics reports the same in the Prometheus text format (see
+blooper.metrics).
+"""
+from __future__ import annotations
+
+import json
+import os
+from argparse import ArgumentParser
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from socketserver import BaseServer, ThreadingUnixStreamServer
+from typing import Any, NoReturn, Optional
+
+from blooper.caches import NOTE_CACHE, SAMPLE_CACHE, WAVETABLE_CACHE, LRUCache
+from blooper.cli import DEFAULT_HOST, DEFAULT_PORT, add_sequence_arguments, build_mixer
+from blooper.metrics import METRICS
+from blooper.mixers import Mixer
+from blooper.wavs import (
+    BITS_PER_SAMPLE,
+    CHUNK_SIZE,
+    HEADER_SIZE,
+    SAMPLE_TYPECODES,
+    SAMPLES_PER_SECOND,
+    _wav_chunks,
+)
+
+# How many of the most recently requested mixes to keep (along with
+# their compiled parts)
+MIXER_CACHE_ENTRIES = 64
+
+MAX_JOB_SIZE = 1024 * 1024  # bytes
+
+
+class JobError(ValueError):
+    """
+    A render job that can't be run
+    """
+
+
+class JobParser(ArgumentParser):
+    """
+    Parses a job's sequencer arguments, raising JobError rather than
+    exiting on bad input
+    """
+
+    def __init__(self):
+        super().__init__(prog="job", add_help=False)
+        add_sequence_arguments(self)
+
+    def error(self, message: str) -> NoReturn:
+        raise JobError(message)
+
+
+class Renderer:
+    """
+    Turns jobs into mixes. Identical jobs share a mix, so their parts
+    are only compiled once.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        mixers: int = MIXER_CACHE_ENTRIES,
+    ):
+        """
+        workers: If supplied, how many processes to render each job's
+            parts in
+        mixers: How many mixes to hold on to
+        """
+        self.workers = workers
+        self.parser = JobParser()
+        self.mixers = LRUCache(mixers, size=lambda _: 1)
+
+    def mixer(self, args: Any) -> Mixer:
+        """
+        Get the mix for a job's sequencer arguments (a list of strings)
+        """
+        if not isinstance(args, list) or not all(isinstance(arg, str) for arg in args):
+            raise JobError("args must be a list of strings")
+
+        def build() -> Mixer:
+            try:
+                return build_mixer(self.parser.parse_args(args))
+            except JobError:
+                raise
+            except ValueError as error:
+                raise JobError(str(error)) from error
+
+        return self.mixers.get_or_put(tuple(args), build)
+
+    def status(self) -> dict[str, Any]:
+        """
+        How each cache is being used
+        """
+        return {
+            "caches": {
+                "mixers": asdict(self.mixers.stats()),
+                "notes": asdict(NOTE_CACHE.stats()),
+                "samples": asdict(SAMPLE_CACHE.stats()),
+                "wavetables": asdict(WAVETABLE_CACHE.stats()),
+            },
+            "metrics": METRICS.snapshot(),
+        }
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    server: Any  # a server with a renderer attribute
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            data = METRICS.to_prometheus().encode("utf-8")
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        if self.path != "/status":
+            self._send_json(404, {"error": f"Not found: {self.path}"})
+            return
+
+        self._send_json(200, self.server.renderer.status())
+
+    def do_POST(self):
+        if self.path != "/render":
+            # the request's body hasn't been read
+            self.close_connection = True
+            self._send_json(404, {"error": f"Not found: {self.path}"})
+            return
+
+        renderer = self.server.renderer
+
+        try:
+            size = int(self.headers.get("Content-Length", 0))
+
+            if size > MAX_JOB_SIZE:
+                raise JobError(f"Job too large: {size} bytes")
+
+            try:
+                job = json.loads(self.rfile.read(size) or b"{}")
+            except json.JSONDecodeError as error:
+                raise JobError(f"Invalid JSON: {error}") from error
+
+            if not isinstance(job, dict):
+                raise JobError("Jobs must be JSON objects")
+
+            mixer = renderer.mixer(job.get("args"))
+            sample_rate = int(job.get("sample_rate", SAMPLES_PER_SECOND))
+            channels = int(job.get("channels", 2))
+            bits_per_sample = int(job.get("bits_per_sample", BITS_PER_SAMPLE))
+
+            if bits_per_sample not in SAMPLE_TYPECODES:
+                raise JobError(f"Unsupported bits per sample: {bits_per_sample}")
+
+            if channels not in (1, 2) or sample_rate <= 0:
+                raise JobError("Unsupported channels or sample rate")
+
+            # working out the length goes through every note, so notes
+            # that can't be played are found before anything is sent
+            frames, chunks = _wav_chunks(
+                mixer,
+                channels,
+                sample_rate,
+                bits_per_sample,
+                CHUNK_SIZE,
+                renderer.workers,
+            )
+        except (JobError, KeyError, TypeError, ValueError) as error:
+            self.close_connection = True
+            self._send_json(400, {"error": f"Invalid job: {error}"})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/wav")
+
+        if frames is None:
+            # the length is only known once it's done
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        else:
+            block_align = channels * bits_per_sample // 8
+            self.send_header("Content-Length", str(HEADER_SIZE + frames * block_align))
+
+        self.end_headers()
+
+        for chunk in chunks:
+            self.wfile.write(chunk)
+            METRICS.increment("bytes_written", len(chunk))
+
+    def address_string(self) -> str:
+        # Unix sockets don't have a client address
+        if isinstance(self.client_address, tuple):
+            return super().address_string()
+
+        return "local"
+
+    def _send_json(self, status: int, body: Any):
+        data = json.dumps(body).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+
+        if self.close_connection:
+            self.send_header("Connection", "close")
+
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class RenderServer(ThreadingHTTPServer):
+    """
+    Serves render jobs over TCP, each in its own thread
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], renderer: Renderer):
+        self.renderer = renderer
+        super().__init__(address, RenderHandler)
+
+
+class UnixRenderServer(ThreadingUnixStreamServer):
+    """
+    Serves render jobs over a Unix socket, each in its own thread
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: Path, renderer: Renderer):
+        self.renderer = renderer
+        self.path = path
+        super().__init__(str(path), RenderHandler)
+
+    def server_close(self):
+        super().server_close()
+
+        if self.path.exists():
+            os.unlink(self.path)
+
+
+def make_server(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    *,
+    socket_path: Optional[Path] = None,
+    workers: Optional[int] = None,
+) -> BaseServer:
+    """
+    Create a server for render jobs. Call serve_forever to start it.
+
+    host: The address to listen on
+    port: The port to listen on (0 picks any free port)
+    socket_path: If supplied, listen on a Unix socket at this path
+        instead of a port
+    workers: If supplied, how many processes to render each job's parts
+        in
+    """
+    renderer = Renderer(workers)
+
+    if socket_path is not None:
+        return UnixRenderServer(socket_path, renderer)
+
+    return RenderServer((host, port), renderer)
+
+
+__all__ = ("JobError", "RenderServer", "Renderer", "UnixRenderServer", "make_server")
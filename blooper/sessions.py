@@ -0,0 +1,375 @@
+"""
+Re-record WAV files as parts are edited, re-rendering only what changed
+"""
+from __future__ import annotations
+
+import sys
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Hashable, Iterator, Optional, Sequence
+
+from blooper.instruments import BLOCK_SIZE, Instrument
+from blooper.mixers import Mixer, file_blocks, render_to_file
+from blooper.wavs import (
+    BITS_PER_SAMPLE,
+    HEADER_SIZE,
+    SAMPLE_TYPECODES,
+    SAMPLES_PER_SECOND,
+    _header,
+)
+
+FRAME_SIZE = array("d").itemsize  # bytes per channel in a rendered signal
+
+
+@dataclass
+class _Rendered:
+    """
+    What was last rendered for a single part
+    """
+
+    instrument: Instrument
+    parameters: tuple  # the instrument's attributes (see Instrument._parameters)
+    signatures: list[tuple]
+    path: Path  # the part's signal, as written by render_to_file
+    frames: int
+
+
+class RenderSession:
+    """
+    Record a mix to a WAV file, then keep that file up to date as the
+    mix's parts are edited.
+
+    The session remembers everything that went into each measure of each
+    part (its contents, the sample it started on, the part's state
+    coming in to it, and what the instrument carries over into its first
+    tone, see Instrument.tone_states). When re-rendering, only the
+    measures that would now sound different are synthesized again (along
+    with whatever tones bleed into or out of them), and only those
+    sections of the WAV file are rewritten. Each section runs until the
+    tones after it start from the same state as before (or to the end of
+    the part), so the file matches what record would write. (Samplers
+    with several samples to pick between pick again in each section, as
+    they would in another call to record.)
+
+    Instruments are compared by identity and by their attributes, so
+    setting an instrument's attribute (e.g., its balance or envelope)
+    re-renders its part. Changes made inside an attribute (e.g., to an
+    envelope's attack) aren't noticed: supply a new (or copied)
+    instrument instead, or render with full=True.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        mixer: Mixer,
+        *,
+        channels: int = 2,
+        sample_rate: int = SAMPLES_PER_SECOND,
+        bits_per_sample: int = BITS_PER_SAMPLE,
+        block_size: int = BLOCK_SIZE,
+        workers: Optional[int] = None,
+        directory: Optional[Path] = None,
+    ):
+        """
+        path: Where to write the WAV file
+        mixer: The mix to record
+        block_size: How many frames to mix at once
+        workers: If supplied, how many processes to render parts in
+        directory: Where to keep each part's rendered signal. If not
+            supplied, a temporary directory is used (and removed when
+            the session is closed).
+        """
+        self.path = path
+        self.mixer = mixer
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.bits_per_sample = bits_per_sample
+        self.block_size = block_size
+        self.workers = workers
+
+        self._temporary: Optional[TemporaryDirectory] = None
+        if directory is None:
+            self._temporary = TemporaryDirectory()
+            directory = Path(self._temporary.name)
+
+        self.directory = directory
+        self._rendered: list[_Rendered] = []
+        self._volumes: Optional[tuple[float, ...]] = None
+        self._frames = 0
+
+    def render(
+        self, mixer: Optional[Mixer] = None, *, full: bool = False
+    ) -> list[tuple[int, int]]:
+        """
+        Bring the WAV file up to date. Returns the (start, end) frames
+        of each section of the file that was rewritten.
+
+        mixer: If supplied, the mix to record from now on
+        full: Re-render every part from scratch, regardless of what has
+            changed
+        """
+        if mixer is not None:
+            self.mixer = mixer
+
+        mixer = self.mixer
+
+        if len(mixer.parts) != len(self._rendered) or not self.path.exists():
+            full = True
+
+        jobs = []
+        spans: list[tuple[int, Optional[int]]] = []
+        rendered = []
+
+        for index, (instrument, part) in enumerate(zip(mixer.instruments, mixer.parts)):
+            signatures, boundaries, starts = part._measure_signatures(self.sample_rate)
+            path = self.directory / f"{index}.raw"
+
+            # each tone picks up where the tones before it left off (e.g.,
+            # its starting volume), so a measure also depends on what its
+            # first tone is handed
+            tone_states = getattr(instrument, "tone_states", None)
+            states = (
+                None if tone_states is None else tone_states(part, self.sample_rate)
+            )
+
+            if states is not None:
+                signatures = [
+                    (*signature, _state_at(states, starts, boundary))
+                    for signature, boundary in zip(signatures, boundaries)
+                ]
+
+            parameters = instrument._parameters()
+
+            if (
+                full
+                or instrument is not self._rendered[index].instrument
+                or parameters != self._rendered[index].parameters
+            ):
+                part_spans: list[tuple[int, Optional[int]]] = [(0, None)]
+            else:
+                previous = self._rendered[index]
+                part_spans = _merge(
+                    _changes(previous.signatures, signatures, boundaries, starts)
+                )
+
+                # without knowing what each tone is handed, any change may
+                # carry through to the end of the part
+                if states is None and part_spans:
+                    part_spans = [(part_spans[0][0], None)]
+
+            for start, end in part_spans:
+                if end is None:
+                    # the signal may end up shorter than before
+                    with path.open("ab") as stream:
+                        stream.truncate(start * self.channels * FRAME_SIZE)
+
+                jobs.append(
+                    (
+                        instrument,
+                        part,
+                        self.sample_rate,
+                        self.channels,
+                        path,
+                        self.block_size,
+                        start,
+                        end,
+                    )
+                )
+
+            spans.extend(part_spans)
+            rendered.append(_Rendered(instrument, parameters, signatures, path, 0))
+
+        self._render(jobs)
+
+        for part_rendered in rendered:
+            size = part_rendered.path.stat().st_size
+            part_rendered.frames = size // (self.channels * FRAME_SIZE)
+
+        self._rendered = rendered
+        frames = max((part.frames for part in rendered), default=0)
+
+        if full or mixer.volumes != self._volumes:
+            spans = [(0, None)]
+        elif frames != self._frames:
+            spans.append((min(frames, self._frames), None))
+
+        self._volumes = mixer.volumes
+        self._frames = frames
+
+        return self._write(_merge(spans), frames)
+
+    def close(self):
+        """
+        Remove the temporary directory holding each part's signal (if
+        the session created one)
+        """
+        if self._temporary is not None:
+            self._temporary.cleanup()
+            self._temporary = None
+
+    def _render(self, jobs: Sequence[tuple]):
+        """
+        Render each section of each part to its file
+        """
+        if self.workers is None or self.workers < 2 or len(jobs) < 2:
+            for job in jobs:
+                render_to_file(*job)
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                for _ in pool.map(render_to_file, *zip(*jobs)):
+                    pass
+
+    def _write(
+        self, spans: list[tuple[int, Optional[int]]], frames: int
+    ) -> list[tuple[int, int]]:
+        """
+        Mix each span of the rendered parts into the WAV file
+        """
+        block_align = self.channels * self.bits_per_sample // 8
+        max_value = (2 ** (self.bits_per_sample - 1)) - 1
+        typecode = SAMPLE_TYPECODES[self.bits_per_sample]
+
+        written = []
+
+        with self.path.open("r+b" if self.path.exists() else "wb") as stream:
+            stream.write(
+                _header(self.channels, self.sample_rate, self.bits_per_sample, frames)
+            )
+            stream.truncate(HEADER_SIZE + frames * block_align)
+
+            for start, end in spans:
+                if end is None or end > frames:
+                    end = frames
+
+                if start >= end:
+                    continue
+
+                streams = [
+                    _read_frames(part.path, start, end, self.channels, self.block_size)
+                    for part in self._rendered
+                ]
+
+                stream.seek(HEADER_SIZE + start * block_align)
+                for block in self.mixer._mix_blocks(streams, max_value, typecode):
+                    if sys.byteorder == "big":
+                        block.byteswap()
+
+                    stream.write(block.tobytes())
+
+                written.append((start, end))
+
+        return written
+
+    def __enter__(self) -> RenderSession:
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def _changes(
+    previous: list[tuple],
+    signatures: list[tuple],
+    boundaries: list[int],
+    starts: list[int],
+) -> list[tuple[int, Optional[int]]]:
+    """
+    Find the sections of a part's signal that need to be rendered again.
+    An end of None means the rest of the signal.
+    """
+    if not signatures:
+        return [(0, None)] if previous else []
+
+    spans: list[tuple[int, Optional[int]]] = []
+    index = 0
+    count = len(signatures)
+
+    while index < count:
+        if index < len(previous) and previous[index] == signatures[index]:
+            index += 1
+            continue
+
+        first = index
+        while index < count and (
+            index >= len(previous) or previous[index] != signatures[index]
+        ):
+            index += 1
+
+        # the tone playing as the section starts lasts until the next
+        # tone, which may have moved
+        position = bisect_left(starts, boundaries[first])
+        start = starts[position - 1] if position else boundaries[first]
+
+        # what follows is unchanged from the next tone onwards
+        end = None
+        if index < count:
+            position = bisect_left(starts, boundaries[index])
+
+            if position < len(starts):
+                end = starts[position]
+
+        spans.append((start, end))
+
+    return spans
+
+
+def _state_at(states: list, starts: list[int], boundary: int) -> Hashable:
+    """
+    The state handed to the first tone starting at or after a boundary
+    (None if there isn't one)
+    """
+    position = bisect_left(starts, boundary)
+
+    return states[position] if position < len(states) else None
+
+
+def _merge(spans: list[tuple[int, Optional[int]]]) -> list[tuple[int, Optional[int]]]:
+    """
+    Combine overlapping spans
+    """
+    merged: list[tuple[int, Optional[int]]] = []
+
+    for start, end in sorted(spans, key=lambda span: span[0]):
+        if merged:
+            previous_start, previous_end = merged[-1]
+
+            if previous_end is None or start <= previous_end:
+                if previous_end is not None and (end is None or end > previous_end):
+                    merged[-1] = (previous_start, end)
+                continue
+
+        merged.append((start, end))
+
+    return merged
+
+
+def _read_frames(
+    path: Path, start: int, end: int, channels: int, block_size: int
+) -> Iterator[array]:
+    """
+    Read a section of a signal written by render_to_file one block of
+    interleaved samples at a time
+    """
+    remaining = (end - start) * channels
+
+    with path.open("rb") as stream:
+        stream.seek(start * channels * FRAME_SIZE)
+
+        for block in file_blocks(stream, channels, block_size):
+            if len(block) > remaining:
+                block = block[:remaining]
+
+            remaining -= len(block)
+
+            if block:
+                yield block
+
+            if not remaining:
+                return
+
+
+__all__ = ("RenderSession",)
@@ -3,10 +3,18 @@ Functions for generating different kinds of wave
 """
 
 import math
-from typing import Callable, Optional
+from array import array
+from operator import sub
+from typing import Callable, Optional, Sequence
+
+from blooper.caches import WAVETABLE_CACHE
+from blooper.profiling import end_stage, start_stage
 
 TWO_PI = math.pi * 2
 
+# How many values wavetables hold by default
+TABLE_SIZE = 4_096
+
 
 def sine_wave(phase: float, /) -> float:
     """
@@ -66,6 +74,64 @@ def triangle_wave(phase: float, /) -> float:
     return sample
 
 
+def sine_waves(phases: Sequence[float], /) -> array:
+    """
+    Return the values of a sine wave at each of several phases. Values
+    match those from sine_wave exactly.
+
+    phases: The positions within the phase of the wave (as ratios out
+        of 1)
+    """
+    sin = math.sin
+    phases = [phase % 1 for phase in phases]
+
+    return array("d", [0 if phase == 0.5 else sin(phase * TWO_PI) for phase in phases])
+
+
+def square_waves(phases: Sequence[float], /) -> array:
+    """
+    Return the values of a square wave at each of several phases. Values
+    match those from square_wave exactly.
+
+    phases: The positions within the phase of the wave (as ratios out
+        of 1)
+    """
+
+    return array("d", [-1 if (phase % 1) >= 0.5 else 1 for phase in phases])
+
+
+def saw_waves(phases: Sequence[float], /) -> array:
+    """
+    Return the values of a sawtooth wave at each of several phases.
+    Values match those from saw_wave exactly.
+
+    phases: The positions within the phase of the wave (as ratios out
+        of 1)
+    """
+
+    return array("d", [(4 * ((phase - 0.25) % 0.5)) - 1 for phase in phases])
+
+
+def triangle_waves(phases: Sequence[float], /) -> array:
+    """
+    Return the values of a triangle wave at each of several phases.
+    Values match those from triangle_wave exactly.
+
+    phases: The positions within the phase of the wave (as ratios out
+        of 1)
+    """
+    rising = [(phase % 0.25) / 0.25 for phase in phases]
+
+    return array(
+        "d",
+        [
+            (-1 if phase % 1 >= 0.5 else 1)
+            * ((1 - sample) if phase % 0.5 >= 0.25 else sample)
+            for phase, sample in zip(phases, rising)
+        ],
+    )
+
+
 WAVES = {
     "sine": sine_wave,
     "square": square_wave,
@@ -73,6 +139,58 @@ WAVES = {
     "triangle": triangle_wave,
 }
 
+# Versions of each wave function that produce many samples at once
+BLOCK_WAVES: dict[Callable[[float], float], Callable[[Sequence[float]], array]] = {
+    sine_wave: sine_waves,
+    square_wave: square_waves,
+    saw_wave: saw_waves,
+    triangle_wave: triangle_waves,
+}
+
+
+def wavetable(
+    function: Callable[[float], float], size: int = TABLE_SIZE
+) -> tuple[array, array]:
+    """
+    Sample a single cycle of a wave function into a table of evenly
+    spaced values. Tables are shared through WAVETABLE_CACHE, so a
+    function is only ever called size times for each table size.
+
+    Returns the table (with the first value repeated at the end) along
+    with the difference between each value and the next, for linear
+    interpolation. Both are size + 1 long.
+
+    function: The wave function to sample
+    size: How many values to sample
+    """
+    if size < 1:
+        raise ValueError(f"Invalid table size: {size}")
+
+    return WAVETABLE_CACHE.get_or_put(
+        (function, size), lambda: _sample_table(function, size)
+    )
+
+
+def _sample_table(function: Callable[[float], float], size: int) -> tuple[array, array]:
+    """
+    Build a wavetable, bypassing the cache
+    """
+    phases = [index / size for index in range(size)]
+    block_function = BLOCK_WAVES.get(function)
+
+    if block_function is None:
+        values = array("d", map(function, phases))
+    else:
+        values = block_function(phases)
+
+    values.append(values[0])
+
+    deltas = array("d", map(sub, values[1:], values))
+    # a phase that rounds up to exactly 1 lands on the repeated value
+    deltas.append(0.0)
+
+    return values, deltas
+
 
 class Waveform:
     """
@@ -87,6 +205,7 @@ class Waveform:
         *,
         wave: str | Callable[[float], float] = sine_wave,
         phase: Optional[float] = None,
+        table_size: Optional[int] = None,
     ):
         """
         frequency: The frequency of the wave (in hz)
@@ -97,6 +216,11 @@ class Waveform:
             and returns an amplitude (between [-1, 1]).
         phase: If supplied, the previous phase position of the wave.
             Should be [0, 1).
+        table_size: If supplied, the wave function is sampled into a
+            wavetable of this many values and samples are interpolated
+            from that table rather than calling the function each time.
+            This is much faster for expensive functions at the cost of
+            some accuracy.
         """
         self.frequency = frequency
         self.sample_rate = sample_rate
@@ -108,6 +232,12 @@ class Waveform:
 
         self.step = sample_rate / frequency
 
+        self.table_size = table_size
+        self._table: Optional[tuple[array, array]] = None
+
+        if table_size is not None:
+            self._table = wavetable(self.function, table_size)
+
         if phase is None:
             self.offset = 0.0
             self.index = -1
@@ -124,7 +254,65 @@ class Waveform:
 
     def sample(self) -> float:
         self.index += 1
-        return self.function((self.index / self.step) + self.offset)
+        phase = (self.index / self.step) + self.offset
+
+        if self._table is not None:
+            return self._interpolate([phase])[0]
+
+        return self.function(phase)
+
+    def skip(self, count: int):
+        """
+        Advance the wave by count samples without producing them. This
+        leaves the wave exactly where calling samples(count) would.
+        """
+        self.index += count
+
+    def samples(self, count: int) -> array:
+        """
+        Produce the next count samples at once. This matches calling
+        sample count times (including where the phase ends up).
+        """
+        started = start_stage()
+        step = self.step
+        offset = self.offset
+        first = self.index + 1
+        self.index += count
+
+        phases = [(index / step) + offset for index in range(first, first + count)]
+
+        if self._table is not None:
+            samples = self._interpolate(phases)
+        else:
+            block_function = BLOCK_WAVES.get(self.function)
+
+            if block_function is None:
+                samples = array("d", map(self.function, phases))
+            else:
+                samples = block_function(phases)
+
+        end_stage("Waveform.samples", started, count)
+
+        return samples
+
+    def _interpolate(self, phases: Sequence[float]) -> array:
+        """
+        Look up phases in the wavetable, interpolating between the two
+        nearest values
+        """
+        assert self._table is not None and self.table_size is not None
+
+        values, deltas = self._table
+        size = self.table_size
+        positions = [(phase % 1) * size for phase in phases]
+
+        return array(
+            "d",
+            [
+                values[index] + deltas[index] * (position - index)
+                for position, index in zip(positions, map(int, positions))
+            ],
+        )
 
 
-__all__ = ("Waveform",)
+__all__ = ("Waveform", "wavetable")
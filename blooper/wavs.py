@@ -3,21 +3,53 @@ Writing samples to WAV files
 """
 from __future__ import annotations
 
+import math
+import mmap
 import struct
+import sys
+import time
+from array import array
+from itertools import chain, islice
 from pathlib import Path
-from typing import Any, BinaryIO, Generator, Iterable
-
+from typing import (
+    Any,
+    BinaryIO,
+    Generator,
+    Hashable,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+)
+
+from blooper.caches import SAMPLE_CACHE
 from blooper.filetypes import SampleFile, UsageMetadata
+from blooper.instruments import unbatched, zeroes
+from blooper.metrics import METRICS
 from blooper.mixers import Mixer
+from blooper.profiling import Profiler, profiled
 
 FILE_HEADER = "<4sI4s"
 CHUNK_HEADER = "<4sI"
 FORMAT_CHUNK = "<hhIIhh"
 SAMPLES = {16: "<h", 32: "<l", 64: "<q"}
+SAMPLE_TYPECODES = {16: "h", 32: "i", 64: "q"}  # for array
 
 SAMPLES_PER_SECOND = 24_000
 FORMAT_TAG = 1  # No compression
 BITS_PER_SAMPLE = 32
+CHUNK_SIZE = 16_384  # frames to write at once
+
+# Header sizes for a stream of unknown length
+UNKNOWN_SIZE = 0xFFFFFFFF
+
+# The RIFF header, format chunk, and data chunk header
+HEADER_SIZE = (
+    struct.calcsize(FILE_HEADER)
+    + struct.calcsize(CHUNK_HEADER)
+    + struct.calcsize(FORMAT_CHUNK)
+    + struct.calcsize(CHUNK_HEADER)
+)
 
 
 def record(
@@ -27,56 +59,257 @@ def record(
     channels: int = 2,
     sample_rate: int = SAMPLES_PER_SECOND,
     bits_per_sample: int = BITS_PER_SAMPLE,
+    chunk_size: int = CHUNK_SIZE,
+    workers: Optional[int] = None,
+    profiler: Optional[Profiler] = None,
 ):
     """
     Write a WAV file by having a single instrument play a part
-    """
-    sample_format = SAMPLES[bits_per_sample]
-    max_value = (2 ** (bits_per_sample - 1)) - 1
 
+    chunk_size: How many frames to gather before writing them out
+    workers: If supplied, how many processes to render parts in (see
+        Mixer.blocks)
+    profiler: If supplied, where to collect how long each stage of
+        rendering takes (see blooper.profiling)
+    """
     block_align = channels * bits_per_sample // 8
-    bytes_per_second = sample_rate * block_align
+    started = time.perf_counter()
 
     with path.open("wb") as stream:
-        format_chunk = struct.pack(
-            FORMAT_CHUNK,
-            FORMAT_TAG,
+        # skip the header until we know the size
+        stream.seek(HEADER_SIZE)
+
+        frames = 0
+        for chunk in _chunks(
+            mixer,
             channels,
             sample_rate,
-            bytes_per_second,
-            block_align,
             bits_per_sample,
-        )
-        format_size = len(format_chunk)
-        format_header = struct.pack(CHUNK_HEADER, b"fmt ", format_size)
-
-        # skip reading file header and data header until we know the size
-        stream.seek(struct.calcsize(FILE_HEADER))
-        stream.write(format_header)
-        stream.write(format_chunk)
-        data_header_byte = stream.tell()
-        stream.seek(struct.calcsize(CHUNK_HEADER), 1)
-
-        samples = 0
-        for sample_set in mixer.mix(sample_rate, channels, max_value):
-            samples += 1
-
-            for sample in sample_set:
-                stream.write(struct.pack(sample_format, sample))
-
-        data_size = samples * block_align
-        data_header = struct.pack(CHUNK_HEADER, b"data", data_size)
-        file_header = struct.pack(
-            FILE_HEADER,
-            b"RIFF",
-            4 + len(format_header) + format_size + len(data_header) + data_size,
-            b"WAVE",
-        )
+            chunk_size,
+            workers,
+            profiler,
+        ):
+            if profiler is None:
+                stream.write(chunk)
+            else:
+                write_started = time.perf_counter()
+                stream.write(chunk)
+                profiler.add(
+                    "wavs.write",
+                    time.perf_counter() - write_started,
+                    frames=len(chunk) // block_align,
+                )
+
+            frames += len(chunk) // block_align
+            METRICS.increment("bytes_written", len(chunk))
 
         stream.seek(0)
-        stream.write(file_header)
-        stream.seek(data_header_byte)
-        stream.write(data_header)
+        stream.write(_header(channels, sample_rate, bits_per_sample, frames))
+        METRICS.increment("bytes_written", HEADER_SIZE)
+
+    if profiler is not None:
+        profiler.add("wavs.record", time.perf_counter() - started, frames=frames)
+
+
+def stream(
+    output: BinaryIO,
+    mixer: Mixer,
+    *,
+    channels: int = 2,
+    sample_rate: int = SAMPLES_PER_SECOND,
+    bits_per_sample: int = BITS_PER_SAMPLE,
+    chunk_size: int = CHUNK_SIZE,
+    workers: Optional[int] = None,
+    profiler: Optional[Profiler] = None,
+) -> Optional[int]:
+    """
+    Write a WAV file to a stream that can't be seeked (e.g., a pipe or
+    stdout) by writing the header first. Returns the number of frames
+    written if it was known up front.
+
+    How many frames the recording will contain is worked out from each
+    part without rendering it (see Mixer.frame_count). If that
+    isn't possible for every instrument (or the recording is too long
+    for a WAV header to hold), the sizes in the header are written as
+    0xFFFFFFFF, which most readers take to mean 'read until the end'.
+
+    chunk_size: How many frames to gather before writing them out
+    workers: If supplied, how many processes to render parts in (see
+        Mixer.blocks)
+    profiler: If supplied, where to collect how long each stage of
+        rendering takes (see blooper.profiling)
+    """
+    frames, chunks = _wav_chunks(
+        mixer, channels, sample_rate, bits_per_sample, chunk_size, workers, profiler
+    )
+
+    for chunk in chunks:
+        output.write(chunk)
+        METRICS.increment("bytes_written", len(chunk))
+
+    return frames
+
+
+def _wav_chunks(
+    mixer: Mixer,
+    channels: int,
+    sample_rate: int,
+    bits_per_sample: int,
+    chunk_size: int,
+    workers: Optional[int] = None,
+    profiler: Optional[Profiler] = None,
+) -> tuple[Optional[int], Iterator[bytes]]:
+    """
+    Work out how many frames a mixer will produce (if possible), then
+    produce a WAV file's header followed by its data, chunk_size frames
+    at a time (see stream).
+    """
+    block_align = channels * bits_per_sample // 8
+    frame_count = getattr(mixer, "frame_count", None)
+    frames = None if frame_count is None else frame_count(sample_rate)
+
+    if frames is not None and HEADER_SIZE - 8 + frames * block_align > UNKNOWN_SIZE:
+        frames = None
+
+    def generate() -> Iterator[bytes]:
+        yield _header(channels, sample_rate, bits_per_sample, frames)
+
+        chunks = _chunks(
+            mixer,
+            channels,
+            sample_rate,
+            bits_per_sample,
+            chunk_size,
+            workers,
+            profiler,
+        )
+
+        if frames is None:
+            yield from chunks
+            return
+
+        # The header can't be fixed later, so the data has to match it
+        remaining = frames * block_align
+        for chunk in chunks:
+            if len(chunk) > remaining:
+                chunk = chunk[:remaining]
+
+            yield chunk
+            remaining -= len(chunk)
+
+            if not remaining:
+                break
+
+        if remaining:
+            yield bytes(remaining)
+
+    return frames, generate()
+
+
+def _header(
+    channels: int, sample_rate: int, bits_per_sample: int, frames: Optional[int]
+) -> bytes:
+    """
+    The header for a WAV file of PCM data, which is always HEADER_SIZE
+    bytes long. If frames is None, the sizes are left unknown.
+    """
+    block_align = channels * bits_per_sample // 8
+    bytes_per_second = sample_rate * block_align
+
+    format_chunk = struct.pack(
+        FORMAT_CHUNK,
+        FORMAT_TAG,
+        channels,
+        sample_rate,
+        bytes_per_second,
+        block_align,
+        bits_per_sample,
+    )
+    format_size = len(format_chunk)
+    format_header = struct.pack(CHUNK_HEADER, b"fmt ", format_size)
+
+    if frames is None:
+        data_size = file_size = UNKNOWN_SIZE
+    else:
+        data_size = frames * block_align
+        file_size = HEADER_SIZE - struct.calcsize(CHUNK_HEADER) + data_size
+
+    data_header = struct.pack(CHUNK_HEADER, b"data", data_size)
+    file_header = struct.pack(FILE_HEADER, b"RIFF", file_size, b"WAVE")
+
+    return file_header + format_header + format_chunk + data_header
+
+
+def _chunks(
+    mixer: Mixer,
+    channels: int,
+    sample_rate: int,
+    bits_per_sample: int,
+    chunk_size: int,
+    workers: Optional[int] = None,
+    profiler: Optional[Profiler] = None,
+) -> Generator[bytes, None, None]:
+    """
+    Mix samples into little-endian PCM data, chunk_size frames at a time
+    """
+    max_value = (2 ** (bits_per_sample - 1)) - 1
+    blocks = getattr(mixer, "blocks", None)
+
+    if blocks is None:
+        # mixers that can only produce individual frames
+        frames: Iterator[tuple[int, ...]] = mixer.mix(sample_rate, channels, max_value)
+        sample_format = SAMPLES[bits_per_sample]
+
+        if profiler is not None:
+            frames = profiled(frames, profiler, "Mixer.mix", channels=channels)
+
+        while True:
+            samples = list(chain.from_iterable(islice(frames, chunk_size)))
+
+            if not samples:
+                return
+
+            started = time.perf_counter()
+            chunk = struct.pack(
+                f"{sample_format[0]}{len(samples)}{sample_format[1:]}", *samples
+            )
+
+            if profiler is not None:
+                profiler.add(
+                    "wavs.encode",
+                    time.perf_counter() - started,
+                    frames=len(samples) // channels,
+                )
+
+            yield chunk
+
+    # only mixers that can be profiled are asked to be
+    options = {} if profiler is None else {"profiler": profiler}
+
+    for block in blocks(
+        sample_rate,
+        channels,
+        max_value,
+        block_size=chunk_size,
+        typecode=SAMPLE_TYPECODES[bits_per_sample],
+        workers=workers,
+        **options,
+    ):
+        started = time.perf_counter()
+
+        if sys.byteorder == "big":
+            block.byteswap()
+
+        chunk = block.tobytes()
+
+        if profiler is not None:
+            profiler.add(
+                "wavs.encode",
+                time.perf_counter() - started,
+                frames=len(block) // channels,
+            )
+
+        yield chunk
 
 
 class WavSample(SampleFile):
@@ -84,6 +317,8 @@ class WavSample(SampleFile):
         self.path = path
         self.usage = usage
         self._loaded = False
+        self._resolved: Optional[Path] = None
+        self._fingerprint: Optional[Hashable] = None  # when the header was read
 
         self._channels: int
         self._sample_rate: int
@@ -95,19 +330,32 @@ class WavSample(SampleFile):
 
     @property
     def channels(self) -> int:
-        if not self._loaded:
-            with self.path.open("rb") as stream:
-                self._load(stream)
+        self._header()
 
         return self._channels
 
     @property
     def sample_rate(self) -> int:
-        if not self._loaded:
+        self._header()
+
+        return self._sample_rate
+
+    def _header(self) -> Hashable:
+        """
+        Read the file's header, unless it's already been read since the
+        file last changed. Returns the file's fingerprint.
+        """
+        fingerprint = self.fingerprint()
+
+        if fingerprint != self._fingerprint:
+            self._loaded = False
+
             with self.path.open("rb") as stream:
                 self._load(stream)
 
-        return self._sample_rate
+            self._fingerprint = fingerprint
+
+        return fingerprint
 
     def _load(self, stream: BinaryIO):
         """
@@ -176,46 +424,157 @@ class WavSample(SampleFile):
     def load(
         self, sample_rate: int, volumes: Iterable[float], loop: bool = False
     ) -> Generator[tuple[float, ...], None, None]:
+        yield from unbatched(
+            (self.render(sample_rate, volumes, loop=loop),), self.channels
+        )
+
+    def render(
+        self, sample_rate: int, volumes: Iterable[float], loop: bool = False
+    ) -> array:
+        sums, last_count = self._decode(sample_rate, loop)
+
+        channels = self._channels
+        wave_range = (2 ** (self._bits_per_sample - 1)) - 1
+        sample_ratio = self._sample_rate // sample_rate
+        available = len(sums) // channels
+
+        if loop:
+            volumes = list(volumes)
+
+            if available and len(volumes) > available:
+                sums = sums * math.ceil(len(volumes) / available)
+        else:
+            volumes = list(islice(volumes, available))
+
+        frames = min(len(volumes), len(sums) // channels)
+        output = zeroes(frames * channels)
+
+        for channel in range(channels):
+            output[channel::channels] = array(
+                "d",
+                [
+                    volume * sample / sample_ratio / wave_range
+                    for volume, sample in zip(volumes, sums[channel::channels])
+                ],
+            )
+
+        # if we ran out of samples, the final frame may be an average
+        # of fewer than sample_ratio samples
+        if frames == available and last_count != sample_ratio:
+            offset = (frames - 1) * channels
+            for channel in range(channels):
+                output[offset + channel] = (
+                    volumes[-1] * sums[offset + channel] / last_count / wave_range
+                )
+
+        return output
+
+    def _decode(self, sample_rate: int, loop: bool) -> tuple[array | list[int], int]:
+        """
+        Read the file's samples and sum them into groups of frames, one
+        group per frame at the requested sample_rate.
+
+        Returns the interleaved sums along with the number of frames in
+        the last group. If looping, groups continue across the loop
+        point and the sums cover every frame until groups and the file
+        line back up again.
+
+        Results are shared through SAMPLE_CACHE with every other
+        WavSample reading the same file. Modifying the file (changing
+        its size or modification time) invalidates the cached version,
+        and means its header is read again.
+        """
+        fingerprint = self._header()
+
+        if self._sample_rate % sample_rate:
+            raise ValueError(
+                "Incompatible sample rate. "
+                f"Expected {sample_rate} found {self._sample_rate}"
+            )
+
+        key = (fingerprint, sample_rate, loop)
+
+        return SAMPLE_CACHE.get_or_put(key, lambda: self._read(sample_rate, loop))
+
+    def frame_count(self, sample_rate: int, length: int, loop: bool = False) -> int:
+        sums, _ = self._decode(sample_rate, loop)
+        available = len(sums) // self._channels
+
+        if loop:
+            return length if available else 0
+
+        return min(length, available)
+
+    def fingerprint(self) -> Hashable:
+        """
+        The file's resolved path, modification time, and size
+        """
+        if self._resolved is None:
+            self._resolved = self.path.resolve()
+
+        stat = self._resolved.stat()
+
+        return (self._resolved, stat.st_mtime_ns, stat.st_size)
+
+    def _read(self, sample_rate: int, loop: bool) -> tuple[array | list[int], int]:
+        """
+        Decode the file's samples for _decode, bypassing the cache
+        """
         with self.path.open("rb") as stream:
             self._load(stream)
 
-            if self._sample_rate % sample_rate:
-                raise ValueError(
-                    "Incompatible sample rate. "
-                    f"Expected {sample_rate} found {self._sample_rate}"
-                )
+            samples = array(SAMPLE_TYPECODES[self._bits_per_sample])
+            size = self._num_samples * self._block_align
+
+            if size:
+                with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    with memoryview(mapped) as view:
+                        start = self._seek_point
+                        end = start + size
+                        samples.frombytes(view[start:end])
+
+        if sys.byteorder == "big":
+            samples.byteswap()
+
+        channels = self._channels
+        sample_ratio = self._sample_rate // sample_rate
+        num_samples = self._num_samples
 
-            wave_range = (2 ** (self._bits_per_sample - 1)) - 1
-            sample_format = SAMPLES[self._bits_per_sample]
-            sample_ratio = self._sample_rate // sample_rate
-            sample_size = self._block_align // self._channels
+        if loop and num_samples % sample_ratio:
+            # repeat the file until a group ends exactly at the end of it
+            repeats = math.lcm(num_samples, sample_ratio) // num_samples
+            samples *= repeats
+            num_samples *= repeats
 
-            sample_index = 0
+        groups = math.ceil(num_samples / sample_ratio)
+        last_count = num_samples - ((groups - 1) * sample_ratio)
+        sums = [0] * (groups * channels)
 
-            for volume in volumes:
-                samples = [0] * self._channels
-                count = 0
+        for channel in range(channels):
+            values = samples[channel::channels]
 
-                while count < sample_ratio:
-                    for channel in range(self._channels):
-                        samples[channel] += struct.unpack(
-                            sample_format, stream.read(sample_size)
-                        )[0]
+            if sample_ratio == 1:
+                totals: Sequence[int] = values
+            else:
+                # sum each group in one pass per offset into the group
+                partials = [
+                    values[offset::sample_ratio] for offset in range(1, sample_ratio)
+                ]
+                totals = [
+                    sum(group) for group in zip(values[::sample_ratio], *partials)
+                ]
 
-                    count += 1
-                    sample_index += 1
+                if last_count != sample_ratio:
+                    start = (groups - 1) * sample_ratio
+                    totals.append(sum(values[start:]))
 
-                    if sample_index == self._num_samples:
-                        if loop:
-                            stream.seek(self._seek_point)
-                            sample_index = 0
-                        else:
-                            break
+            sums[channel::channels] = totals
 
-                yield tuple(volume * sample / count / wave_range for sample in samples)
+        # 64-bit sums can't always be represented exactly as floats
+        if self._bits_per_sample <= 32:
+            return array("d", sums), last_count
 
-                if sample_index == self._num_samples and not loop:
-                    break
+        return sums, last_count
 
     def __hash__(self) -> int:
         return hash(self.path)
@@ -234,4 +593,4 @@ class WavSample(SampleFile):
         return cls(path, metadata)
 
 
-__all__ = ("record", "WavSample")
+__all__ = ("record", "stream", "WavSample")
@@ -0,0 +1,125 @@
+import asyncio
+from fractions import Fraction
+from threading import Event
+
+import pytest
+
+
+def test_render_async():
+    from blooper.asynchronous import render_async
+    from blooper.instruments import Synthesizer
+    from blooper.mixers import Mixer
+    from blooper.notes import Note
+    from blooper.parts import Part
+    from blooper.pitch import Pitch
+    from blooper.wavs import _chunks, _wav_chunks
+
+    part = Part([[Note.new(Fraction(1, 4), Pitch(4, "A"))] * 4] * 2)
+    mixer = Mixer.even((Synthesizer("saw"), part), (Synthesizer("square"), part))
+
+    async def collect(**kwargs) -> list[bytes]:
+        return [
+            chunk
+            async for chunk in render_async(mixer, 1_000, chunk_size=100, **kwargs)
+        ]
+
+    expected = list(_chunks(mixer, 2, 1_000, 32, 100))
+    assert asyncio.run(collect()) == expected
+
+    _, wav = _wav_chunks(mixer, 2, 1_000, 32, 100)
+    assert asyncio.run(collect(header=True, buffer_size=1)) == list(wav)
+
+    # renders can run alongside each other (and anything else)
+    async def concurrently():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        ticker = asyncio.create_task(tick())
+        results = await asyncio.gather(collect(), collect(), collect())
+        ticker.cancel()
+
+        return results, ticks
+
+    results, ticks = asyncio.run(concurrently())
+    assert results == [expected] * 3
+    assert ticks > 0
+
+    with pytest.raises(ValueError):
+        asyncio.run(collect(buffer_size=0))
+
+
+def test_render_async_backpressure():
+    from blooper.asynchronous import render_async
+
+    class CountingMixer:
+        def __init__(self):
+            self.produced = 0
+            self.closed = Event()
+
+        def blocks(self, sample_rate, channels, max_value, **kwargs):
+            from array import array
+
+            try:
+                while True:
+                    self.produced += 1
+                    yield array("i", [self.produced] * channels)
+            finally:
+                self.closed.set()
+
+    async def consume(mixer: CountingMixer, count: int) -> list[int]:
+        seen = []
+        chunks = render_async(mixer, 1_000, channels=1, chunk_size=1, buffer_size=2)
+
+        async for chunk in chunks:
+            seen.append(chunk)
+
+            # give rendering every chance to race ahead
+            for _ in range(20):
+                await asyncio.sleep(0.001)
+
+            # buffered chunks, plus one being rendered
+            assert mixer.produced <= len(seen) + 3
+
+            if len(seen) == count:
+                break
+
+        await chunks.aclose()
+        return seen
+
+    mixer = CountingMixer()
+    assert len(asyncio.run(consume(mixer, 5))) == 5
+
+    # rendering stops once the consumer does
+    assert mixer.closed.wait(5)
+    assert mixer.produced <= 8
+
+    # cancelling the consumer stops rendering too
+    async def cancel(mixer: CountingMixer):
+        task = asyncio.create_task(consume(mixer, 1_000))
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    mixer = CountingMixer()
+    asyncio.run(cancel(mixer))
+    assert mixer.closed.wait(5)
+
+    # errors while rendering reach the consumer
+    class BrokenMixer:
+        def blocks(self, *args, **kwargs):
+            raise RuntimeError("broken")
+            yield
+
+    async def broken():
+        async for _ in render_async(BrokenMixer(), 1_000):
+            pass
+
+    with pytest.raises(RuntimeError, match="broken"):
+        asyncio.run(broken())
@@ -0,0 +1,85 @@
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+
+
+def test_batch():
+    from blooper.batch import load_manifest, run_batch
+    from blooper.cli import build_mixer, main
+    from blooper.server import JobParser
+    from blooper.wavs import record
+
+    jobs = [
+        {"path": "a.wav", "args": ["--notes", "a3", "b3"], "sample_rate": 1_000},
+        {"path": "b.wav", "args": ["--notes", "c4", "--wave", "saw"]},
+        {"path": "c.wav", "args": ["--notes", "q9"]},
+        {"path": "d.wav", "args": "--notes a3"},
+        {"args": ["--notes", "a3"]},
+        {"path": "e.wav", "args": ["--notes", "a3", "b3"], "channels": 1},
+    ]
+
+    with TemporaryDirectory() as directory_name:
+        directory = Path(directory_name)
+        expected = directory / "expected"
+        expected.mkdir()
+
+        for job in jobs:
+            if job.get("path") in ("a.wav", "b.wav", "e.wav"):
+                record(
+                    expected / job["path"],
+                    build_mixer(JobParser().parse_args(job["args"])),
+                    channels=job.get("channels", 2),
+                    sample_rate=job.get("sample_rate", 24_000),
+                )
+
+        manifest = directory / "manifest.json"
+        manifest.write_text(json.dumps({"jobs": jobs}))
+
+        loaded = load_manifest(manifest)
+        assert loaded[0]["path"] == str(directory / "a.wav")
+        assert loaded[4] == jobs[4]
+
+        for processes in (1, 2):
+            results = sorted(
+                run_batch(loaded, processes), key=lambda result: result.index
+            )
+
+            assert [result.index for result in results] == list(range(len(jobs)))
+            assert [result.ok for result in results] == [
+                True,
+                True,
+                False,
+                False,
+                False,
+                True,
+            ]
+            assert results[0].frames == build_mixer(
+                JobParser().parse_args(jobs[0]["args"])
+            ).frame_count(1_000)
+            assert all(result.seconds >= 0 for result in results)
+            assert "args must be a list of strings" in results[3].error
+            assert results[4].path is None
+
+            for name in ("a.wav", "b.wav", "e.wav"):
+                assert (directory / name).read_bytes() == (expected / name).read_bytes()
+                (directory / name).unlink()
+
+        # the command renders everything it can, then fails
+        report = directory / "report.json"
+        with pytest.raises(SystemExit):
+            main(["batch", str(manifest), "--jobs", "2", "--report", str(report)])
+
+        assert (directory / "b.wav").read_bytes() == (expected / "b.wav").read_bytes()
+        assert [entry["error"] is None for entry in json.loads(report.read_text())] == [
+            True,
+            True,
+            False,
+            False,
+            False,
+            True,
+        ]
+
+        manifest.write_text(json.dumps(jobs[:2]))
+        main(["batch", str(manifest), "--jobs", "1"])
@@ -0,0 +1,142 @@
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+
+
+def test_run_benchmarks():
+    from blooper.bench import STAGES, Scenario, build_mixer, run_benchmarks, score
+    from blooper.dynamics import AttackDecaySustainRelease, DynamicRange
+
+    small = Scenario(2, 1, 1, 1_000, 1, 16)
+    chords = Scenario(2, 3, 2, 1_000, 2, 16)
+
+    parts = score(chords)
+    assert len(parts) == 2
+    assert all(len(part.measures) == 2 for part in parts)
+    assert {tone.concurrence for _, _, tone in parts[0].tones(1_000)} == {3}
+
+    results = run_benchmarks([small, chords], repeat=2)
+    assert [result.stage for result in results] == list(STAGES) * 2
+
+    count = len(STAGES)
+    for scenario, stage_results in (
+        (small, results[:count]),
+        (chords, results[count:]),
+    ):
+        tones = [
+            (duration, tone)
+            for part in score(scenario)
+            for _, duration, tone in part.tones(1_000)
+        ]
+        envelope = AttackDecaySustainRelease(DynamicRange())
+
+        # stages that generate signals count the frames they generate
+        waves, volumes, *mixed = stage_results[1:]
+        assert waves.frames == sum(
+            duration * tone.concurrence for duration, tone in tones
+        )
+        assert volumes.frames == sum(
+            envelope.length(tone, duration, 1_000) for duration, tone in tones
+        )
+
+        for result in [stage_results[0], *mixed]:
+            assert result.frames == build_mixer(scenario).frame_count(1_000)
+
+    for result in results:
+        assert result.seconds > 0
+        assert result.real_time_factor == pytest.approx(
+            result.frames_per_second / 1_000
+        )
+
+    # stages that don't write audio don't depend on the output format
+    assert results[0].scenario == {
+        "measures": 2,
+        "concurrence": 1,
+        "parts": 1,
+        "sample_rate": 1_000,
+        "channels": None,
+        "bits_per_sample": None,
+    }
+    assert results[-1].scenario["channels"] == 2
+
+    stereo = Scenario(2, 1, 1, 1_000, 2, 16)
+    results = run_benchmarks([small, stereo], ["Part.tones", "wavs.record"], repeat=1)
+    assert [result.stage for result in results] == [
+        "Part.tones",
+        "wavs.record",
+        "wavs.record",
+    ]
+
+    with pytest.raises(ValueError):
+        run_benchmarks([small], ["Part.notes"])
+
+    with pytest.raises(ValueError):
+        run_benchmarks([small], repeat=0)
+
+
+def test_compare():
+    from blooper.bench import Result, compare, main, to_json
+
+    scenario = {"sample_rate": 1_000, "channels": None}
+    baseline = to_json(
+        [
+            Result("Part.tones", scenario, 1_000, 1.0),
+            Result("Mixer.mix", scenario, 1_000, 1.0),
+        ]
+    )
+
+    (tones, mix) = compare(
+        [
+            Result("Part.tones", scenario, 1_000, 0.5),
+            Result("Mixer.mix", scenario, 1_000, 2.0),
+            Result("wavs.record", scenario, 1_000, 1.0),
+        ],
+        json.loads(json.dumps(baseline)),
+    )
+    assert tones.ratio == 2
+    assert not tones.regressed()
+    assert mix.ratio == 0.5
+    assert mix.regressed()
+    assert not mix.regressed(0.6)
+
+    with TemporaryDirectory() as directory_name:
+        directory = Path(directory_name)
+        output = directory / "results.json"
+        args = [
+            "--measures",
+            "1",
+            "--concurrence",
+            "2",
+            "--parts",
+            "1",
+            "--sample-rate",
+            "1000",
+            "--stage",
+            "Part.tones",
+            "--repeat",
+            "1",
+            "--output",
+            str(output),
+        ]
+
+        main(args)
+        report = json.loads(output.read_text())
+        (result,) = report["results"]
+        assert result["stage"] == "Part.tones"
+        assert result["scenario"]["concurrence"] == 2
+
+        # nothing can be this fast
+        result["frames_per_second"] = float("inf")
+        baseline_path = directory / "baseline.json"
+        baseline_path.write_text(json.dumps(report))
+
+        with pytest.raises(SystemExit):
+            main(args + ["--baseline", str(baseline_path)])
+
+        main(args + ["--baseline", str(baseline_path), "--tolerance", "1"])
+
+    # only bit depths that can be recorded are offered
+    with pytest.raises(SystemExit):
+        main(["--bits-per-sample", "24"])
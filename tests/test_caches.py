@@ -0,0 +1,208 @@
+import pickle
+from array import array
+
+import pytest
+
+
+def test_sizeof():
+    from blooper.caches import sizeof
+
+    assert sizeof(array("d", [0.0] * 10)) == 80
+    assert sizeof(array("h", [0] * 10)) == 20
+    assert sizeof(b"1234") == 4
+    assert sizeof((array("d", [0.0] * 10), b"1234")) > 84
+    assert sizeof(12) > 0
+
+
+def test_lru_cache():
+    from blooper.caches import CacheStats, LRUCache
+
+    with pytest.raises(ValueError):
+        LRUCache(-1)
+
+    cache = LRUCache(100, size=len)
+    assert repr(cache) == "LRUCache(100)"
+    assert cache.stats() == CacheStats(0, 0, 0, 0, 0, 100)
+
+    assert cache.get("a") is None
+    assert cache.get("a", 1) == 1
+    assert "a" not in cache
+
+    cache.put("a", "a" * 40)
+    cache.put("b", "b" * 40)
+    assert len(cache) == 2
+    assert cache.get("a") == "a" * 40
+    assert cache.stats() == CacheStats(1, 2, 0, 2, 80, 100)
+
+    # b is the least-recently used
+    cache.put("c", "c" * 40)
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.stats() == CacheStats(1, 2, 1, 2, 80, 100)
+
+    # replacing a value
+    cache.put("c", "c" * 10)
+    assert cache.stats().size == 50
+
+    # explicit sizes
+    cache.put("d", "d", size=50)
+    assert cache.stats().size == 100
+    assert cache.stats().evictions == 1
+
+    # too large to cache at all
+    cache.put("e", "e" * 101)
+    assert "e" not in cache
+    assert len(cache) == 3
+
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "f" * 10
+
+    assert cache.get_or_put("f", compute) == "f" * 10
+    assert cache.get_or_put("f", compute) == "f" * 10
+    assert len(calls) == 1
+    assert "a" not in cache
+
+    # falsy values are still cached
+    cache.put("g", "")
+    assert cache.get_or_put("g", compute) == ""
+    assert len(calls) == 1
+
+    cache.resize(20)
+    assert cache.stats().size <= 20
+    assert "g" in cache
+
+    with pytest.raises(ValueError):
+        cache.resize(-1)
+
+    # caches can be sent to other processes, but arrive empty
+    copy = pickle.loads(pickle.dumps(LRUCache(100)))
+    assert copy.max_size == 100
+    assert len(copy) == 0
+
+    cache.clear()
+    assert cache.stats() == CacheStats(0, 0, 0, 0, 0, 20)
+
+    # hit rate
+    assert cache.stats().hit_rate == 0
+    cache.put("a", "a")
+    cache.get("a")
+    cache.get("a")
+    cache.get("b")
+    assert cache.stats().hit_rate == 2 / 3
+
+
+def test_cached_method():
+    import copy
+    import gc
+    import weakref
+    from dataclasses import dataclass
+
+    from blooper.caches import (
+        NOTE_CACHE,
+        CacheInfo,
+        cached_function,
+        cached_method,
+        clear_caches,
+    )
+
+    calls = []
+
+    @dataclass(frozen=True)
+    class Doubler:
+        offset: int
+
+        @cached_method(max_entries=2)
+        def double(self, value: int, extra: int = 0) -> int:
+            calls.append((self.offset, value, extra))
+            return value * 2 + self.offset + extra
+
+    first = Doubler(1)
+    second = Doubler(1)
+
+    assert first.double(1) == 3
+    assert first.double(1) == 3
+    assert first.double(1, extra=1) == 4
+    assert first.double(1, extra=1) == 4
+    assert len(calls) == 2
+
+    # each instance has its own results, even if they're equal
+    assert second.double(1) == 3
+    assert len(calls) == 3
+    assert first == second
+    assert Doubler.double.cache_info() == CacheInfo(2, 3, 2, 3)
+
+    # only the most recently-used results are kept
+    first.double(2)
+    first.double(1)
+    assert len(calls) == 5
+    assert Doubler.double.cache_info().currsize == 3
+
+    Doubler.double.cache_resize(1)
+    assert Doubler.double.cache_info() == CacheInfo(2, 5, 1, 2)
+    first.double(1)
+    assert len(calls) == 5
+    first.double(2)
+    assert len(calls) == 6
+
+    with pytest.raises(ValueError):
+        Doubler.double.cache_resize(-1)
+
+    # instances (and their results) aren't kept alive by the cache
+    reference = weakref.ref(second)
+    del second
+    gc.collect()
+    assert reference() is None
+    assert Doubler.double.cache_info().currsize == 1
+
+    # pickled instances leave their results behind
+    from blooper.pitch import Pitch, Tuning
+
+    tuning = Tuning(Pitch(4, "A"), 432)
+    frequency = tuning.pitch_to_frequency(Pitch(4, "C"))
+    entries = Tuning.pitch_to_frequency.cache_info().currsize
+    unpickled = pickle.loads(pickle.dumps(tuning))
+    assert unpickled.pitch_to_frequency(Pitch(4, "C")) == frequency
+    assert Tuning.pitch_to_frequency.cache_info().currsize == entries + 1
+
+    # nor do copies, which may be changed afterwards
+    class Counter:
+        def __init__(self, start: int):
+            self.start = start
+
+        @cached_method()
+        def count(self, value: int) -> int:
+            calls.append(value)
+            return self.start + value
+
+    original = Counter(1)
+    assert original.count(1) == 2
+    copied = copy.copy(original)
+    copied.start = 10
+    assert copied.count(1) == 11
+    assert original.count(1) == 2
+    assert copy.deepcopy(copied).count(1) == 11
+
+    @cached_function(max_entries=10)
+    def triple(value: int) -> int:
+        calls.append(value)
+        return value * 3
+
+    assert triple(2) == 6
+    assert triple(2) == 6
+    assert triple.__name__ == "triple"
+    assert triple.cache_info() == CacheInfo(1, 1, 10, 1)
+
+    NOTE_CACHE.put("clear-me", b"1234")
+    clear_caches()
+    assert triple.cache_info() == CacheInfo(0, 0, 10, 0)
+    assert Doubler.double.cache_info().currsize == 0
+    assert "clear-me" not in NOTE_CACHE
+
+    calls.clear()
+    first.double(1)
+    triple(2)
+    assert len(calls) == 2
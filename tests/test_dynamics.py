@@ -1,3 +1,4 @@
+from array import array
 from fractions import Fraction
 
 import pytest
@@ -123,6 +124,20 @@ def test_homogeneous():
 
                 assert volumes == 100 * [dynamics.volume(dynamic)]
 
+                rendered = envelope.render(tone, 100, 100, start)
+
+                assert isinstance(rendered, array)
+                assert list(rendered) == volumes
+
+                assert envelope.length(tone, 100, 100, start) == 100
+                assert envelope.volume_at(tone, 100, 100, start, 99) == volumes[99]
+                assert envelope.volume_at(tone, 100, 100, start, 100) == 0
+
+    # envelopes can be used as (part of) a cache key
+    assert envelope == Homogeneous(DynamicRange())
+    assert hash(envelope) == hash(Homogeneous(DynamicRange()))
+    assert envelope != Homogeneous(DynamicRange(full_output=0.5))
+
 
 def test_adsr_rates():
     from blooper.dynamics import AttackDecaySustainRelease, DynamicRange
@@ -155,6 +170,14 @@ def test_adsr_rates():
     # just making sure this doesn't error
     AttackDecaySustainRelease(dynamics, sustain_level=1)
 
+    # envelopes can be used as (part of) a cache key
+    assert hash(envelope) == hash(
+        AttackDecaySustainRelease(dynamics, attack=0.1, decay=0.2, release=0.05)
+    )
+    assert envelope != AttackDecaySustainRelease(
+        dynamics, attack=0.1, decay=0.2, release=0.05, accent_multiplier=2
+    )
+
     # what about bad values
     with pytest.raises(ValueError):
         AttackDecaySustainRelease(dynamics, sustain_level=1.1)
@@ -524,3 +547,42 @@ def test_adsr_volumes():
         dynamics, attack=0.4
     )
     assert AttackDecaySustainRelease(dynamics, attack=0.3) != dynamics
+
+
+def test_adsr_render():
+    from blooper.dynamics import AttackDecaySustainRelease, DynamicRange
+    from blooper.notes import Accent, Dynamic, Tone
+    from blooper.pitch import Pitch
+
+    dynamics = DynamicRange()
+    envelope = AttackDecaySustainRelease(dynamics, release=0.1)
+
+    for symbol in ("ppp", "p", "mf", "ff", "fff"):
+        for accent in (None, Accent.ACCENT):
+            tone = Tone(Pitch(4, "A"), Dynamic.from_symbol(symbol), accent=accent)
+
+            for duration in (0, 1, 50, 1000):
+                for start in (0, 0.5, 1.1):
+                    rendered = envelope.render(tone, duration, 1000, start)
+
+                    assert isinstance(rendered, array)
+                    assert list(rendered) == list(
+                        envelope.volumes(tone, duration, 1000, start)
+                    )
+
+    # lengths and individual volumes can be found without rendering
+    for accent in (None, Accent.ACCENT, Accent.SLUR):
+        tone = Tone(Pitch(4, "A"), Dynamic.from_symbol("mf"), accent=accent)
+
+        for duration in (0, 1, 50, 100, 1000):
+            for start in (-0.3, 0, 0.5, 1.1):
+                rendered = envelope.render(tone, duration, 1000, start)
+
+                assert envelope.length(tone, duration, 1000, start) == len(rendered)
+                assert [
+                    envelope.volume_at(tone, duration, 1000, start, index)
+                    for index in range(len(rendered) + 2)
+                ] == [*rendered, 0, 0]
+
+    # zero-length stages shouldn't produce anything
+    assert list(AttackDecaySustainRelease._render(0, 0, 0, 0, 0, 0.1, 0.1, 0.1)) == []
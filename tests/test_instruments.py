@@ -1,6 +1,13 @@
+import copy
+import gc
 import json
+import math
+import pickle
+import weakref
+from array import array
 from dataclasses import dataclass
 from fractions import Fraction
+from itertools import chain
 from pathlib import Path
 from tempfile import TemporaryDirectory
 from typing import Iterator
@@ -25,6 +32,324 @@ def test_then_zeroes():
     assert next(iterable) == 0
 
 
+def test_batched():
+    from blooper.instruments import batched
+
+    assert list(batched([])) == []
+    assert list(batched([(1, 2), (3, 4), (5, 6)], 2)) == [
+        array("d", [1, 2, 3, 4]),
+        array("d", [5, 6]),
+    ]
+    assert list(batched([(1,), (2,)], 2)) == [array("d", [1, 2])]
+
+
+def test_unbatched():
+    from blooper.instruments import batched, unbatched
+
+    assert list(unbatched([], 2)) == []
+    assert list(unbatched([array("d", [1, 2, 3, 4]), array("d", [5, 6])], 2)) == [
+        (1, 2),
+        (3, 4),
+        (5, 6),
+    ]
+    assert list(unbatched([[1, 2, 3]], 1)) == [(1,), (2,), (3,)]
+
+    frames = [(index, -index) for index in range(10)]
+    assert list(unbatched(batched(frames, 3), 2)) == frames
+
+
+def test_render_into():
+    from blooper.instruments import Synthesizer
+    from blooper.notes import Note, Rest
+    from blooper.parts import Measure, Part
+    from blooper.pitch import Chord, Pitch
+
+    part = Part(
+        [
+            [
+                Note.new(Fraction(1, 4), Pitch(4, "C")),
+                Rest(Fraction(1, 4)),
+                Note.new(Fraction(1, 2), Chord(Pitch(4, "E"), Pitch(4, "G"))),
+            ]
+        ]
+    )
+    synthesizer = Synthesizer("triangle", balance=-0.25)
+
+    for channels in (1, 2):
+        expected = array(
+            "d",
+            (
+                sample
+                for frame in synthesizer.play(part, 2_000, channels=channels)
+                for sample in frame
+            ),
+        )
+        assert expected
+
+        # all at once
+        out = array("d", [0.5]) * (len(expected) + 6)
+        assert (
+            synthesizer.render_into(part, 2_000, out, channels=channels)
+            == len(expected) // channels
+        )
+        size = len(expected)
+        assert out[:size] == expected
+        # samples past the end of the signal are left alone
+        assert set(out[size:]) == {0.5}
+
+        # in consecutive chunks
+        rendered = array("d")
+        start = 0
+        out = array("d", [0]) * (7 * channels)
+        while True:
+            written = synthesizer.render_into(
+                part, 2_000, out, start, channels=channels
+            )
+            size = written * channels
+            rendered.extend(out[:size])
+            start += written
+
+            if written < 7:
+                break
+
+        assert rendered == expected
+
+        # jumping around
+        out = array("d", [0]) * (5 * channels)
+        for start in (300, 10, 301, 0, 999):
+            written = synthesizer.render_into(
+                part, 2_000, out, start, channels=channels
+            )
+            first = start * channels
+            last = first + (written * channels)
+            assert out[: last - first] == expected[first:last]
+
+        # past the end
+        assert synthesizer.render_into(part, 2_000, out, 1_000_000) == 0
+
+    # signals aren't resumed once the part has been edited
+    out = array("d", [0]) * 20
+    assert synthesizer.render_into(part, 2_000, out, 0) == 10
+    part.measures[0] = Measure(
+        [Note.new(Fraction(1, 2), Pitch(4, "D")), Rest(Fraction(1, 2))]
+    )
+    assert synthesizer.render_into(part, 2_000, out, 10) == 10
+
+    edited = Synthesizer("triangle", balance=-0.25)
+    expected = array("d", [0]) * 20
+    edited.render_into(part, 2_000, expected, 10)
+    assert out == expected
+
+    # instruments holding on to abandoned signals can still be sent to
+    # other processes, and are freed once they aren't in use
+    unpickled = pickle.loads(pickle.dumps(synthesizer))
+    assert unpickled.render_into(part, 2_000, out, 10) == 10
+    assert out == expected
+
+    # nor once the instrument has been changed (or copied then changed)
+    def fresh(instrument, start):
+        rendered = array("d", [0]) * 20
+        copy.deepcopy(instrument).render_into(part, 2_000, rendered, start)
+        return rendered
+
+    centred = Synthesizer("sine")
+    centred.render_into(part, 2_000, out, 0)
+    panned = copy.copy(centred)
+    panned.balance = 1.0
+    assert panned.render_into(part, 2_000, out, 10) == 10
+    assert out == fresh(panned, 10)
+    assert out[0::2] != out[1::2]
+
+    assert centred.render_into(part, 2_000, out, 20) == 10
+    assert out == fresh(centred, 20)
+
+    centred.render_into(part, 2_000, out, 30)
+    centred.wave = "square"
+    centred.balance = -0.5
+    assert centred.render_into(part, 2_000, out, 40) == 10
+    assert out == fresh(centred, 40)
+
+    instruments = [Synthesizer() for _ in range(20)]
+    for instrument in instruments:
+        instrument.render_into(part, 2_000, out)
+
+    references = [weakref.ref(instrument) for instrument in instruments]
+    del instrument, instruments
+    gc.collect()
+    assert all(reference() is None for reference in references)
+
+
+def test_seeking():
+    from blooper.dynamics import AttackDecaySustainRelease, DynamicRange, Homogeneous
+    from blooper.instruments import Instrument, Synthesizer
+    from blooper.notes import Accent, Note, Rest
+    from blooper.parts import Part
+    from blooper.pitch import A440, Chord, Pitch
+
+    part = Part(
+        [
+            [
+                Note.new(Fraction(1, 8), Pitch(4, "C"), accent=Accent.STACCATO),
+                Note.new(Fraction(1, 8), Pitch(4, "D")),
+                Rest(Fraction(1, 4)),
+                Note.new(Fraction(1, 2), Chord(Pitch(4, "E"), Pitch(4, "G"))),
+            ],
+            [
+                Note.new(Fraction(1, 4), Pitch(3, "C"), accent=Accent.SLUR),
+                Note.new(Fraction(1, 4), Pitch(3, "C")),
+                Note.new(Fraction(1, 4), Chord(Pitch(4, "E"), Pitch(4, "G"))),
+            ],
+        ]
+    )
+
+    for synthesizer in (
+        Synthesizer("saw", balance=0.5),
+        Synthesizer("sine", envelope=Homogeneous(DynamicRange())),
+    ):
+        assert synthesizer.seekable
+
+        for channels in (1, 2):
+            expected = [
+                sample
+                for block in synthesizer.blocks(part, 2_000, channels=channels)
+                for sample in block
+            ]
+            frames = len(expected) // channels
+            assert synthesizer.frame_count(part, 2_000) == frames
+
+            for start in {
+                0,
+                1,
+                frames - 1,
+                frames,
+                frames + 1,
+                *range(0, frames, 97),
+                *part.measure_boundaries(2_000),
+            }:
+                first = start * channels
+                assert [
+                    sample
+                    for block in synthesizer.blocks(
+                        part, 2_000, channels=channels, start_frame=start
+                    )
+                    for sample in block
+                ] == expected[first:]
+
+    # skipped tones never have their envelopes rendered
+    class CountingEnvelope(AttackDecaySustainRelease):
+        renders = 0
+
+        def render(self, *args):
+            CountingEnvelope.renders += 1
+            return super().render(*args)
+
+    synthesizer = Synthesizer("saw", envelope=CountingEnvelope(DynamicRange()))
+    frames = synthesizer.frame_count(part, 2_000)
+    expected = list(synthesizer.blocks(part, 2_000))
+    CountingEnvelope.renders = 0
+
+    assert list(synthesizer.blocks(part, 2_000, start_frame=frames)) == []
+    assert CountingEnvelope.renders == 0
+
+    assert list(synthesizer.blocks(part, 2_000, start_frame=frames - 1)) == [
+        expected[-1][-2:]
+    ]
+    assert CountingEnvelope.renders == 1
+
+    # other instruments fall back to skipping through play
+    class Counter(Instrument):
+        tuning = A440
+
+        def play(self, part, sample_rate, *, channels=2):
+            yield from ((index,) * channels for index in range(10))
+
+    counter = Counter()
+    assert not counter.seekable
+    assert counter.frame_count(part, 2_000) is None
+    assert [
+        list(block) for block in counter.blocks(part, 2_000, channels=1, start_frame=7)
+    ] == [[7, 8, 9]]
+
+
+def test_note_cache():
+    from blooper.caches import NOTE_CACHE, LRUCache
+    from blooper.dynamics import Envelope
+    from blooper.instruments import Synthesizer
+    from blooper.notes import Accent, Note, Rest
+    from blooper.parts import Part
+    from blooper.pitch import Chord, Pitch
+
+    part = Part(
+        [
+            [
+                Note.new(Fraction(1, 4), Pitch(4, "C"), accent=Accent.STACCATO),
+                Rest(Fraction(1, 4)),
+                Note.new(Fraction(1, 2), Chord(Pitch(4, "E"), Pitch(4, "G"))),
+            ],
+        ]
+        * 3
+    )
+
+    assert Synthesizer().note_cache is NOTE_CACHE
+
+    expected = list(Synthesizer("saw", note_cache=None).play(part, 2_000))
+
+    cache = LRUCache(1024 * 1024)
+    synthesizer = Synthesizer("saw", note_cache=cache)
+    assert list(synthesizer.play(part, 2_000)) == expected
+    assert cache.stats().hits == 0
+    notes = len(cache)
+    assert notes
+
+    # Playing the part again (on any synthesizer with the same sound,
+    # with any balance or number of channels) only copies notes
+    assert list(synthesizer.play(part, 2_000)) == expected
+    assert cache.stats().hits == notes
+
+    mono = list(
+        Synthesizer("saw", balance=0.5, note_cache=cache).play(part, 2_000, channels=1)
+    )
+    assert mono == list(
+        Synthesizer("saw", note_cache=None).play(part, 2_000, channels=1)
+    )
+    assert cache.stats().hits == notes * 2
+    assert len(cache) == notes
+
+    # anything that changes the sound needs to be rendered separately
+    list(Synthesizer("square", note_cache=cache).play(part, 2_000))
+    list(synthesizer.play(part, 4_000))
+    assert cache.stats().hits == notes * 2
+    assert len(cache) == notes * 3
+
+    # seeking past the start of a note renders it without the cache
+    assert [
+        sample
+        for block in synthesizer.blocks(part, 2_000, start_frame=11)
+        for sample in block
+    ] == [sample for frame in expected[11:] for sample in frame]
+
+    # envelopes that can't be hashed are never cached
+    class Unhashable(Envelope):
+        __hash__ = None  # type: ignore
+
+        def __init__(self, envelope):
+            self.envelope = envelope
+
+        @property
+        def dynamics(self):
+            return self.envelope.dynamics
+
+        def volumes(self, tone, duration, sample_rate, start=0):
+            yield from self.envelope.volumes(tone, duration, sample_rate, start)
+
+    cache.clear()
+    synthesizer = Synthesizer(
+        "saw", envelope=Unhashable(synthesizer.envelope), note_cache=cache
+    )
+    assert list(synthesizer.play(part, 2_000)) == expected
+    assert len(cache) == 0
+
+
 def test_mono_to_stereo():
     from blooper.instruments import Instrument
 
@@ -68,6 +393,34 @@ def test_stereo_to_mono():
     assert Instrument.stereo_to_mono(0, 0, 0.5) == (0,)
 
 
+def test_channel_gains():
+    from blooper.instruments import Instrument
+
+    assert Instrument.channel_gains(1, 1, 0.5) == ((1,),)
+    assert Instrument.channel_gains(2, 2, 0.5) == ((1, 0), (0, 1))
+
+    assert Instrument.channel_gains(1, 2, 0) == ((0.5,), (0.5,))
+    assert Instrument.channel_gains(1, 2, -1) == ((1,), (0,))
+    assert Instrument.channel_gains(1, 2, 0.5) == ((0.25,), (0.75,))
+
+    assert Instrument.channel_gains(2, 1, 0) == ((0.5, 0.5),)
+    assert Instrument.channel_gains(2, 1, 1) == ((0, 1),)
+    assert Instrument.channel_gains(2, 1, 0.5) == ((0.25, 0.75),)
+
+    # gains match converting a sample at a time
+    for balance in (-1, -0.3, 0, 0.7, 1):
+        ((left,), (right,)) = Instrument.channel_gains(1, 2, balance)
+        assert (0.3 * left, 0.3 * right) == Instrument.mono_to_stereo(0.3, balance)
+
+        ((left, right),) = Instrument.channel_gains(2, 1, balance)
+        assert (0.3 * left + 0.9 * right,) == Instrument.stereo_to_mono(
+            0.3, 0.9, balance
+        )
+
+    with pytest.raises(NotImplementedError):
+        Instrument.channel_gains(1, 4, 0)
+
+
 def test_synthesizer():
     from blooper.dynamics import AttackDecaySustainRelease, DynamicRange, Homogeneous
     from blooper.instruments import Synthesizer
@@ -323,6 +676,13 @@ def test_synthesizer():
     )
     assert synthesizer.envelope == default_envelope
 
+    # wavetables
+    exact = Synthesizer("triangle", tuning=tuning)
+    tabled = Synthesizer("triangle", tuning=tuning, table_size=1_024)
+    assert [sample for (sample,) in tabled.play(part, 20, channels=1)] == pytest.approx(
+        [sample for (sample,) in exact.play(part, 20, channels=1)]
+    )
+
     # okay, here's the deal. I want to test that concurrance is handled
     # correctly but I absolutely don't want to write the tests for that.
     # Testing that it is the same as multiple parts should be good
@@ -391,7 +751,8 @@ def test_synthesizer():
 
 
 def test_sampler():
-    from blooper.dynamics import DynamicRange, Homogeneous
+    from blooper.caches import LRUCache
+    from blooper.dynamics import AttackDecaySustainRelease, DynamicRange, Homogeneous
     from blooper.filetypes import UsageMetadata
     from blooper.instruments import Sampler
     from blooper.notes import Dynamic, Tone
@@ -511,6 +872,9 @@ def test_sampler():
         sampler = Sampler.from_file(config, tuning=tuning)
         assert sampler.samples == expected
 
+        # samplers can be sent to other processes
+        assert pickle.loads(pickle.dumps(sampler)).samples == expected
+
         # compatible_samples
 
         # matching frequency
@@ -573,6 +937,70 @@ def test_sampler():
             sampler.compatible_samples(200, 20_000, Dynamic.from_symbol("ppp"))
         )
 
+        # samples are found through an index (and, optionally, a keymap
+        # of every pitch in the tuning) rather than by checking every
+        # sample. Either way, the results match checking every sample.
+        library = {}
+        for index, frequency in enumerate(
+            (100, 190, 200, 200.5, 210, 233.08, 250, 300, 400, 401, 415.3, 800)
+        ):
+            for name, sample_rate, minimum, maximum in (
+                ("soft", 20_000, None, Dynamic.from_symbol("mp")),
+                ("loud", 20_000, Dynamic.from_symbol("mf"), None),
+                ("any", 40_000, None, None),
+            ):
+                if (index + sample_rate // 20_000) % 3 or name == "any":
+                    path = directory / f"library_{frequency}_{name}.wav"
+                    write_wav(path, sample_rate, [(0, 0)])
+                    library[path] = UsageMetadata(frequency, minimum, maximum)
+
+        def check_every_sample(sampler, frequency, sample_rate, dynamic):
+            distances = {}
+            for actual_rate, samples_at_rate in sampler.samples.items():
+                if actual_rate % sample_rate:
+                    continue
+
+                for actual_frequency, samples in samples_at_rate.items():
+                    distance = round(
+                        abs(1200 * math.log2(actual_frequency / frequency)), 12
+                    )
+                    if distance <= sampler.max_distance:
+                        distances.setdefault(distance, set()).update(
+                            sample
+                            for sample in samples
+                            if sample.usage_metadata.compatible_dynamic(dynamic)
+                        )
+
+            for distance in sorted(distances):
+                if distances[distance]:
+                    return distances[distance]
+
+            return set()
+
+        indexed = Sampler(library, tuning=tuning, max_distance=100)
+        keymapped = Sampler(library, tuning=tuning, max_distance=100, keymap=True)
+        assert tuning.pitch_to_frequency(Pitch(4, "A")) in keymapped._keymap
+        assert tuning.pitch_to_frequency(Pitch(7, "A")) not in keymapped._keymap
+
+        frequencies = [
+            tuning.pitch_to_frequency(Pitch(order, "C", Fraction(step, 2)))
+            for order in range(2, 6)
+            for step in range(24)
+        ]
+        frequencies += [50, 195, 205, 400.5, 1000]
+
+        for frequency in frequencies:
+            for sample_rate in (10_000, 20_000, 40_000):
+                for dynamic in (None, pianissimo, forte):
+                    expected_samples = check_every_sample(
+                        indexed, frequency, sample_rate, dynamic
+                    )
+                    assert (
+                        indexed.compatible_samples(frequency, sample_rate, dynamic)
+                        == keymapped.compatible_samples(frequency, sample_rate, dynamic)
+                        == expected_samples
+                    )
+
         # play
         paths = {}
         for frequency, samples in (
@@ -686,6 +1114,27 @@ def test_sampler():
             ],
         )
 
+        # note cache
+        cache = LRUCache(1024 * 1024)
+        uncached = Sampler(paths, tuning=tuning, envelope=envelope, note_cache=None)
+        cached = Sampler(paths, tuning=tuning, envelope=envelope, note_cache=cache)
+        repeated = FakePart(
+            [
+                (
+                    index * 3,
+                    3,
+                    Tone(Pitch(3 + index % 2, "A"), Dynamic.from_name("piano")),
+                )
+                for index in range(1, 9)
+            ]
+        )
+        compare_samples(
+            cached.play(repeated, 20_000), uncached.play(repeated, 20_000), 15
+        )
+        # the first note starts from silence rather than another note
+        assert cache.stats().misses == 3
+        assert cache.stats().hits == 5
+
         # stereo, loop
         compare_samples(
             sampler.play(part, 20_000, channels=2),
@@ -710,6 +1159,82 @@ def test_sampler():
             ],
         )
 
+        # chords mix samples with different channel counts, one frame
+        # at a time (including the final tone)
+        chords = FakePart(
+            [
+                (0, 3, Tone(Chord(Pitch(3, "A"), Pitch(4, "A")), forte)),
+                (4, 3, Tone(Chord(Pitch(4, "A"), Pitch(3, "A")), forte)),
+            ]
+        )
+        compare_samples(
+            sampler.play(chords, 20_000, channels=1),
+            [(1.5,), (-1.5,), (1.5,), (0,), (1.5,), (-1.5,), (1.5,)],
+        )
+
+        panned = Sampler(paths, tuning=tuning, envelope=envelope, balance=-1)
+        compare_samples(
+            panned.play(chords, 20_000, channels=2),
+            [
+                (1.5, 0.5),
+                (-1.5, -0.5),
+                (1.5, 0.5),
+                (0, 0),
+                (1.5, 0.5),
+                (-1.5, -0.5),
+                (1.5, 0.5),
+            ],
+        )
+
+        # blocks can start partway through
+        assert list(
+            chain.from_iterable(
+                panned.blocks(chords, 20_000, channels=2, start_frame=2)
+            )
+        ) == list(chain.from_iterable(list(panned.play(chords, 20_000))[2:]))
+
+        # seeking skips over earlier tones but picks up the volume they
+        # left off at
+        released = AttackDecaySustainRelease(
+            DynamicRange(), attack=0.0001, decay=0.0001, release=0.0002
+        )
+        tones = FakePart(
+            [
+                (2, 3, Tone(Pitch(3, "A"), forte)),
+                (4, 3, Tone(Chord(Pitch(4, "A"), Pitch(3, "A")), forte)),
+                (12, 2, Tone(Pitch(4, "A"), Dynamic.from_name("piano"))),
+                (13, 6, Tone(Pitch(2, "A"), forte)),
+                (20, 4, Tone(Pitch(3, "A"), forte)),
+            ]
+        )
+        for seeking in (
+            panned,
+            Sampler(paths, tuning=tuning, envelope=released, loop=False),
+            Sampler(paths, tuning=tuning, envelope=released, loop=True),
+        ):
+            assert seeking.seekable
+
+            for channels in (1, 2):
+                expected = list(
+                    chain.from_iterable(
+                        seeking.blocks(tones, 20_000, channels=channels)
+                    )
+                )
+                frames = len(expected) // channels
+
+                for start in range(frames + 2):
+                    first = start * channels
+                    assert (
+                        list(
+                            chain.from_iterable(
+                                seeking.blocks(
+                                    tones, 20_000, channels=channels, start_frame=start
+                                )
+                            )
+                        )
+                        == expected[first:]
+                    )
+
     # okay, here's the deal. I want to test that concurrance is handled
     # correctly but I absolutely don't want to write the tests for that.
     # Testing that it is the same as multiple parts should be good
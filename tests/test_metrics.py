@@ -0,0 +1,112 @@
+from fractions import Fraction
+from functools import cache
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+
+def test_metrics_registry():
+    from blooper.caches import LRUCache
+    from blooper.metrics import MetricsRegistry, cache_stats
+
+    lru = LRUCache(1024)
+    lru.put("a", b"12345678")
+    lru.get("a")
+    lru.get("b")
+
+    @cache
+    def double(value: int) -> int:
+        return value * 2
+
+    double(1)
+    double(1)
+    double(2)
+
+    assert cache_stats(lru) == {"hits": 1, "misses": 1, "entries": 1, "size": 8}
+    assert cache_stats(double) == {"hits": 1, "misses": 2, "entries": 2, "size": None}
+
+    registry = MetricsRegistry()
+    registry.register_cache("lru", lru)
+    registry.register_cache("double", double)
+
+    registry.increment("frames_rendered", 100, instrument="Synthesizer")
+    registry.increment("frames_rendered", 50, instrument="Synthesizer")
+    registry.increment("frames_rendered", 10, instrument='Odd "name"')
+    registry.increment("clipped_samples", 3)
+
+    snapshot = registry.snapshot()
+    assert snapshot["caches"] == {
+        "lru": cache_stats(lru),
+        "double": cache_stats(double),
+    }
+    assert snapshot["counters"]["frames_rendered"] == [
+        {"labels": {"instrument": "Synthesizer"}, "value": 150},
+        {"labels": {"instrument": 'Odd "name"'}, "value": 10},
+    ]
+    assert snapshot["counters"]["clipped_samples"] == [{"labels": {}, "value": 3}]
+    assert snapshot["counters"]["notes_played"] == []
+
+    lines = registry.to_prometheus().splitlines()
+    assert "# TYPE blooper_frames_rendered_total counter" in lines
+    assert 'blooper_frames_rendered_total{instrument="Synthesizer"} 150' in lines
+    assert 'blooper_frames_rendered_total{instrument="Odd \\"name\\""} 10' in lines
+    assert "blooper_clipped_samples_total 3" in lines
+    assert "# TYPE blooper_cache_entries gauge" in lines
+    assert 'blooper_cache_hits_total{cache="lru"} 1' in lines
+    assert 'blooper_cache_misses_total{cache="double"} 2' in lines
+    assert 'blooper_cache_size_bytes{cache="lru"} 8' in lines
+    # sizes are only reported when known
+    assert not any(
+        line.startswith('blooper_cache_size_bytes{cache="double"}') for line in lines
+    )
+
+    registry.reset()
+    assert registry.snapshot()["counters"]["frames_rendered"] == []
+    assert registry.snapshot()["caches"]["lru"]["hits"] == 1
+
+
+def test_render_metrics():
+    from blooper.instruments import Synthesizer
+    from blooper.metrics import METRICS
+    from blooper.mixers import Mixer
+    from blooper.notes import Note, Rest
+    from blooper.parts import Part
+    from blooper.pitch import Pitch
+    from blooper.wavs import record
+
+    def counter(name: str) -> dict[tuple, int]:
+        return {
+            tuple(sorted(value["labels"].items())): value["value"]
+            for value in METRICS.snapshot()["counters"][name]
+        }
+
+    part = Part(
+        [[Note.new(Fraction(1, 4), Pitch(4, "A"))] * 3 + [Rest(Fraction(1, 4))]]
+    )
+    mixer = Mixer.even((Synthesizer("saw"), part), (Synthesizer("square"), part))
+
+    METRICS.reset()
+
+    with TemporaryDirectory() as directory_name:
+        path = Path(directory_name) / "metrics.wav"
+        record(path, mixer, sample_rate=1_000, bits_per_sample=16)
+        size = path.stat().st_size
+
+    frames = mixer.frame_count(1_000)
+    assert counter("frames_rendered") == {(("instrument", "Synthesizer"),): frames * 2}
+    assert counter("notes_played") == {(("instrument", "Synthesizer"),): 6}
+    assert counter("bytes_written") == {(): size}
+    assert counter("clipped_samples") == {}
+
+    # too loud to fit
+    METRICS.reset()
+    loud = Mixer(mixer.instruments, mixer.parts, (4, 4))
+    mixed = list(loud.mix(1_000, 1, 100))
+
+    clipped = sum(1 for (sample,) in mixed if abs(sample) == 100)
+    assert clipped
+    assert counter("clipped_samples") == {(): clipped}
+
+    # workers render parts elsewhere but frames are still counted
+    METRICS.reset()
+    assert list(mixer.mix(1_000, 1, 100, workers=2)) == list(mixer.mix(1_000, 1, 100))
+    assert counter("frames_rendered") == {(("instrument", "Synthesizer"),): frames * 4}
@@ -1,5 +1,8 @@
+from array import array
 from dataclasses import dataclass
 from fractions import Fraction
+from pathlib import Path
+from tempfile import TemporaryDirectory
 
 import pytest
 
@@ -100,3 +103,264 @@ def test_mixer():
             ).mix(1000, 2, 100)
         )
     ) == [(30, -60), (-5, -100), (0, 25), (-25, 42)]
+
+    # mixing in blocks shouldn't change the output
+    mixer = Mixer.even(
+        (FakeInstrument([(0.5, -1.1), (1.2, -1)], 1000), part),
+        (FakeInstrument([(0.1, -0.1), (-1.3, -1), (0, 0.5), (-0.5, 0.85)], 1000), part),
+    )
+    for block_size in (1, 2, 3, 100):
+        assert list(mixer.mix(1000, 2, 100, block_size=block_size)) == [
+            (30, -60),
+            (-5, -100),
+            (0, 25),
+            (-25, 42),
+        ]
+
+
+def test_instrument_blocks():
+    from blooper.instruments import Synthesizer
+    from blooper.mixers import Mixer, instrument_blocks
+    from blooper.notes import Note
+    from blooper.parts import Part
+    from blooper.pitch import Pitch
+
+    part = Part([[Note.new(Fraction(1, 4), Pitch(4, "A"))] * 4])
+
+    # instruments without render_into are read from play
+    class PlayOnly:
+        def play(self, part, sample_rate, channels=2):
+            yield from ((index, -index) for index in range(5))
+
+    assert [
+        list(block) for block in instrument_blocks(PlayOnly(), part, 1000, 2, 2)
+    ] == [[0, 0, 1, -1], [2, -2, 3, -3], [4, -4]]
+
+    synthesizer = Synthesizer("saw")
+    expected = [
+        sample
+        for frame in synthesizer.play(part, 1_000, channels=2)
+        for sample in frame
+    ]
+
+    for block_size in (1, 7, 10_000):
+        blocks = [
+            list(block)
+            for block in instrument_blocks(synthesizer, part, 1_000, 2, block_size)
+        ]
+        assert all(len(block) == block_size * 2 for block in blocks[:-1])
+        assert [sample for block in blocks for sample in block] == expected
+
+    # a mix using render_into matches one using play
+    class Wrapper:
+        def __init__(self, instrument):
+            self.instrument = instrument
+
+        def play(self, part, sample_rate, channels=2):
+            return self.instrument.play(part, sample_rate, channels=channels)
+
+    assert list(Mixer.solo(synthesizer, part).mix(1_000, 2, 1_000, block_size=3)) == (
+        list(Mixer.solo(Wrapper(synthesizer), part).mix(1_000, 2, 1_000))
+    )
+
+    # abandoned renders don't leave anything behind for later renders
+    # (which may be of an edited part) to pick up
+    blocks = instrument_blocks(synthesizer, part, 1_000, 2, 7)
+    next(blocks)
+    blocks.close()
+    assert not synthesizer.__dict__.get("_cursors")
+
+
+def test_mixer_blocks():
+    from random import Random
+
+    from blooper.mixers import Mixer
+    from blooper.notes import Note
+    from blooper.parts import Part
+    from blooper.pitch import Pitch
+
+    part = Part([[Note.new(Fraction(1, 4), Pitch(4, "A"))] * 4])
+
+    class FakeInstrument:
+        def __init__(self, frames):
+            self.frames = frames
+
+        def play(self, part, sample_rate, channels=2):
+            yield from self.frames
+
+    random = Random(1)
+    instruments = [
+        FakeInstrument(
+            [
+                (random.uniform(-1.5, 1.5), random.uniform(-1.5, 1.5))
+                for _ in range(random.randint(0, 50))
+            ]
+        )
+        for _ in range(8)
+    ]
+    # include exact halves to exercise rounding
+    instruments.append(FakeInstrument([(0.005, -0.005), (0.015, 0.025)] * 5))
+    mixer = Mixer(
+        tuple(instruments),
+        (part,) * len(instruments),
+        tuple(random.uniform(0, 0.5) for _ in instruments),
+    )
+
+    # round-then-clamp a frame at a time
+    expected = []
+    for index in range(max(len(instrument.frames) for instrument in instruments)):
+        mixed = [0.0, 0.0]
+        for instrument, volume in zip(instruments, mixer.volumes):
+            if index < len(instrument.frames):
+                for channel, sample in enumerate(instrument.frames[index]):
+                    mixed[channel] += sample * 100 * volume
+
+        expected.append(tuple(max(-100, min(100, round(sample))) for sample in mixed))
+
+    for block_size in (1, 3, 16, 1000):
+        blocks = list(mixer.blocks(1000, 2, 100, block_size=block_size, typecode="b"))
+
+        assert all(block.typecode == "b" for block in blocks)
+        assert all(len(block) == block_size * 2 for block in blocks[:-1])
+        assert [
+            (left, right)
+            for block in blocks
+            for left, right in zip(block[0::2], block[1::2])
+        ] == expected
+
+        assert list(mixer.mix(1000, 2, 100, block_size=block_size)) == expected
+
+    assert list(Mixer.solo(FakeInstrument([]), part).blocks(1000, 2, 100)) == []
+
+    # the length can't be known without playing
+    assert mixer.frame_count(1000) is None
+
+
+def test_parallel_mix():
+    from blooper.dynamics import DynamicRange, Homogeneous
+    from blooper.instruments import Synthesizer
+    from blooper.mixers import Mixer, file_blocks, render_to_file
+    from blooper.notes import Note, Rest
+    from blooper.parts import Part
+    from blooper.pitch import Chord, Pitch
+
+    parts = (
+        Part([[Note.new(Fraction(1, 4), Pitch(4, "A"))] * 4] * 2),
+        Part(
+            [
+                [
+                    Rest(Fraction(1, 4)),
+                    Note.new(Fraction(1, 2), Chord(Pitch(3, "C"), Pitch(3, "E"))),
+                ]
+            ]
+        ),
+        Part([[Note.new(Fraction(1, 8), Pitch(5, "C"))] * 8]),
+    )
+    instruments = (
+        Synthesizer("saw", balance=0.2),
+        Synthesizer("square", envelope=Homogeneous(DynamicRange())),
+        Synthesizer("triangle"),
+    )
+    mixer = Mixer.even(*zip(instruments, parts))
+
+    with TemporaryDirectory() as directory_name:
+        path = Path(directory_name) / "signal.raw"
+
+        frames = render_to_file(instruments[0], parts[0], 1_000, 2, path, 7)
+        expected = [
+            sample
+            for frame in instruments[0].play(parts[0], 1_000, channels=2)
+            for sample in frame
+        ]
+        assert frames * 2 == len(expected)
+
+        with path.open("rb") as stream:
+            blocks = list(file_blocks(stream, 2, 5))
+
+        assert all(len(block) == 10 for block in blocks[:-1])
+        assert [sample for block in blocks for sample in block] == expected
+
+    for channels in (1, 2):
+        serial = list(mixer.mix(1_000, channels, 1_000))
+        assert mixer.frame_count(1_000) == len(serial)
+
+        for block_size in (3, 4_096):
+            assert (
+                list(
+                    mixer.mix(1_000, channels, 1_000, block_size=block_size, workers=2)
+                )
+                == serial
+            )
+            assert [
+                list(block)
+                for block in mixer.blocks(1_000, channels, 1_000, block_size=block_size)
+            ] == [
+                list(block)
+                for block in mixer.blocks(
+                    1_000, channels, 1_000, block_size=block_size, workers=3
+                )
+            ]
+
+
+def test_time_sliced_mix():
+    from blooper.instruments import Synthesizer
+    from blooper.mixers import Mixer, render_to_file, split_part
+    from blooper.notes import Accent, Note, Rest
+    from blooper.parts import Part
+    from blooper.pitch import Pitch
+
+    part = Part(
+        [
+            [
+                Note.new(Fraction(1, 4), Pitch(4, "A"), accent=Accent.SLUR),
+                Note.new(Fraction(1, 4), Pitch(4, "A")),
+                Rest(Fraction(1, 2)),
+            ],
+            [Note.new(Fraction(1, 8), Pitch(4, pitch)) for pitch in "ABCDEFGA"],
+            [Note.new(Fraction(1, 1), Pitch(3, "C"))],
+            [
+                Rest(Fraction(1, 2)),
+                Note.new(Fraction(1, 2), Pitch(3, "D"), accent=Accent.SLUR),
+            ],
+            [Note.new(Fraction(1, 2), Pitch(3, "D"))],
+        ]
+    )
+    synthesizer = Synthesizer("triangle")
+
+    assert split_part(part, 1_000, 1) == []
+    assert split_part(part, 1_000, 2) == [4_000]
+    assert split_part(part, 1_000, 5) == [2_000, 4_000, 6_000, 8_000]
+    assert split_part(part, 1_000, 100) == [2_000, 4_000, 6_000, 8_000]
+    assert split_part(Part([]), 1_000, 4) == []
+
+    expected = [
+        sample
+        for frame in synthesizer.play(part, 1_000, channels=2)
+        for sample in frame
+    ]
+
+    # sections of a file can be written separately
+    with TemporaryDirectory() as directory_name:
+        path = Path(directory_name) / "signal.raw"
+        path.touch()
+
+        written = 0
+        for start, end in ((6_000, None), (2_000, 6_000), (0, 2_000)):
+            written += render_to_file(
+                synthesizer, part, 1_000, 2, path, 100, start, end
+            )
+
+        assert written * 2 == len(expected)
+        assert array("d", path.read_bytes()) == array("d", expected)
+
+    mixer = Mixer.solo(synthesizer, part)
+    for channels in (1, 2):
+        assert list(mixer.mix(1_000, channels, 1_000, workers=4)) == list(
+            mixer.mix(1_000, channels, 1_000)
+        )
+
+    # parts can be split while others aren't
+    mixer = Mixer.even((synthesizer, part), (Synthesizer("square"), part))
+    assert list(mixer.mix(1_000, 2, 1_000, block_size=100, workers=3)) == list(
+        mixer.mix(1_000, 2, 1_000)
+    )
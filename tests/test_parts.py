@@ -647,3 +647,158 @@ def test_part():
                 time=WALTZ_TIME,
             ).tones(40_000)
         )
+
+
+def test_measure_boundaries():
+    from blooper.notes import Note, Rest
+    from blooper.parts import WALTZ_TIME, Measure, Part
+    from blooper.pitch import Pitch
+
+    assert Part([]).measure_boundaries(1_000) == [0]
+
+    part = Part(
+        [
+            [Note.new(Fraction(1, 4), Pitch(4, "A"))],
+            Measure([Rest(Fraction(1, 4))] * 3, time=WALTZ_TIME),
+            Measure([Note.new(Fraction(1, 4), Pitch(4, "A"))], tempos={0: 60}),
+        ],
+        tempo=120,
+    )
+
+    # 500 samples a beat, then 1000
+    assert part.measure_boundaries(1_000) == [0, 2_000, 3_500, 6_500]
+    assert part.duration_samples(1_000) == 6_500
+    assert Part([]).duration_samples(1_000) == 0
+
+    # every tone starts within the part
+    for start, _, _ in part.tones(1_000):
+        assert 0 <= start < 6_500
+
+
+def test_tones_timing():
+    from blooper.notes import Note, Triplet
+    from blooper.parts import Measure, Part, TimeSignature
+    from blooper.pitch import Pitch
+
+    # 857 1/7 samples a beat. Tones start on the nearest sample to
+    # where they should be rather than adding up rounded durations
+    part = Part(
+        [
+            [Note.new(Fraction(1, 4), Pitch(4, "A"))] * 4,
+            [Triplet(Pitch(4, "A"), Pitch(4, "B"), Pitch(4, "C"))] * 4,
+        ]
+        * 10,
+        tempo=70,
+    )
+
+    tones = list(part.tones(1_000))
+    assert [start for start, _, _ in tones[:4]] == [0, 857, 1_714, 2_571]
+    assert [start for start, _, _ in tones[4:10]] == [
+        3_429,
+        3_714,
+        4_000,
+        4_286,
+        4_571,
+        4_857,
+    ]
+
+    # (the last 1/4 of each note is a rest)
+    assert [duration for _, duration, _ in tones[:4]] == [643, 643, 643, 643]
+
+    boundaries = part.measure_boundaries(1_000)
+    assert boundaries[-1] == 68_571
+    assert boundaries == [round(index * 60_000 * 4 / 70) for index in range(21)]
+
+    # measures can bring their own (equal) time signatures without time
+    # starting over from a rounded sample
+    measures = [
+        Measure(
+            [Note.new(Fraction(1, 4), Pitch(4, "A"))] * 4,
+            time=TimeSignature.new(4, 4),
+        )
+        for _ in range(20)
+    ]
+    assert Part(measures, tempo=70).measure_boundaries(1_000) == boundaries
+
+    # time signatures built directly (rather than through
+    # TimeSignature.new) are played with as many beats to a whole note
+    # as their lower number
+    for time, samples_per_whole in (
+        (TimeSignature(4, 4), Fraction(60_000, 70)),
+        (TimeSignature(4, Fraction(1, 4)), Fraction(60_000 * 4, 70)),
+        (TimeSignature(6, Fraction(3, 8)), Fraction(60_000 * 8, 70)),
+    ):
+        part = Part(
+            [[Note.new(Fraction(1, 8), Pitch(4, "A"))] * 8], time=time, tempo=70
+        )
+        assert [start for start, _, _ in part.tones(1_000)] == [
+            round(samples_per_whole * index / 8) for index in range(8)
+        ]
+
+
+def test_compile():
+    from blooper.notes import Accent, Dynamic, Note, Rest
+    from blooper.parts import ACCENTS, Measure, Part
+    from blooper.pitch import A440, Chord, Pitch, Tuning
+
+    forte = Dynamic.from_symbol("f")
+    measure = Measure(
+        [
+            Note.new(Fraction(1, 4), Pitch(4, "A"), accent=Accent.ACCENT),
+            Rest(Fraction(1, 4)),
+            Note.new(Fraction(1, 2), Chord(Pitch(4, "A"), Pitch(3, "A"))),
+        ],
+        dynamics={Fraction(1, 2): forte},
+    )
+    part = Part([measure], tempo=60, dynamic=Dynamic.from_symbol("p"))
+
+    table = part.compile(100, A440)
+    assert len(table) == 2
+    assert table.sample_rate == 100
+    assert list(table.starts) == [0, 200]
+    assert list(table.durations) == [75, 175]
+    assert list(table.offsets) == [0, 1, 3]
+    # (chords don't keep their pitches in any particular order)
+    assert table.frequencies[0] == 440
+    assert sorted(table.frequencies[1:]) == [220, 440]
+    assert list(table.dynamics) == [-10, 10]
+    assert list(table.accents) == [ACCENTS.index(Accent.ACCENT), -1]
+    assert [tone for _, _, tone in part.tones(100)] == list(table.tones)
+    assert list(table.events()) == [
+        (
+            start,
+            duration,
+            tone,
+            tuple(A440.pitch_to_frequency(pitch) for pitch in tone.pitches),
+        )
+        for start, duration, tone in part.tones(100)
+    ]
+
+    # tables are kept per sample rate & tuning
+    assert part.compile(100, A440) is table
+    assert part.compile(200, A440) is not table
+    assert list(part.compile(200, A440).starts) == [0, 400]
+    assert sorted(part.compile(100, Tuning(Pitch(4, "A"), 400)).frequencies) == [
+        200,
+        400,
+        400,
+    ]
+    assert part.compile(100, A440) is table
+
+    # but are thrown out when the part changes
+    measure.dynamics[Fraction(1, 2)] = Dynamic.from_symbol("ff")
+    table = part.compile(100, A440)
+    assert list(table.dynamics) == [-10, 20]
+
+    measure.notes[0] = Note.new(Fraction(1, 4), Pitch(4, "B"))
+    table = part.compile(100, A440)
+    assert table.frequencies[0] == A440.pitch_to_frequency(Pitch(4, "B"))
+    assert list(table.accents) == [-1, -1]
+
+    part.measures.append(Measure([Note.new(Fraction(1, 1), Pitch(4, "A"))]))
+    table = part.compile(100, A440)
+    assert len(table) == 3
+    assert part.compile(100, A440) is table
+
+    part.tempo = 120
+    assert list(part.compile(100, A440).starts) == [0, 100, 200]
@@ -241,6 +241,15 @@ def test_tuning():
                     pitch
                 ) == twenty_four_tet.pitch_to_frequency(pitch)
 
+                # frequencies can also be found from a pitch's position
+                assert twenty_four_tet.pitch_to_frequency(
+                    pitch
+                ) == twenty_four_tet.position_to_frequency(*ARAB_SCALE.position(pitch))
+
+    assert twelve_tet.position_to_frequency(4, 9) == 440
+    assert twelve_tet.position_to_frequency(0, 9) == 27.5
+    assert round(twelve_tet.position_to_frequency(4, 0), 4) == 261.6256
+
     # Information on actually tuning to this scale is scarce. Originally
     # looked at the  tuning on the first instrument
     # http://www.huygens-fokker.org/bpsite/instruments.html
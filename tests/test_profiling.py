@@ -0,0 +1,152 @@
+from fractions import Fraction
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Thread
+
+import pytest
+
+
+def test_profiler():
+    from blooper.profiling import Profiler, end_stage, profiled, start_stage, timed
+
+    # nothing is collected outside of a profiled render
+    assert start_stage() is None
+    end_stage("ignored", None, 10)
+    values = [1, 2, 3]
+    assert timed(values, "ignored") is values
+
+    profiler = Profiler()
+
+    def produce():
+        for size in (4, 4, 2):
+            started = start_stage()
+            assert started is not None
+            end_stage("inner", started, size)
+            yield [0.0] * size * 2
+
+    blocks = list(profiled(produce(), profiler, "outer", instrument="a", channels=2))
+    assert len(blocks) == 3
+
+    report = profiler.report()
+    assert [(stats.stage, stats.instrument) for stats in report.stages] == [
+        ("inner", "a"),
+        ("outer", "a"),
+    ]
+    assert report.instruments == ("a",)
+
+    inner = report.stage("inner")
+    outer = report.stage("outer")
+    assert (inner.calls, inner.frames) == (3, 10)
+    assert (outer.calls, outer.frames) == (3, 10)
+    assert outer.seconds >= inner.seconds
+
+    with pytest.raises(KeyError):
+        report.stage("missing")
+
+    # stats from several threads are combined
+    def signal():
+        yield from timed(iter([(0.0,)] * 100), "frames", 1)
+
+    def run():
+        for _ in profiled(signal(), profiler):
+            pass
+
+    threads = [Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    frames = profiler.report().stage("frames")
+    assert (frames.calls, frames.frames) == (400, 400)
+
+    # the active profiler doesn't leak out of the profiled iterator
+    iterator = profiled(produce(), profiler)
+    next(iterator)
+    assert start_stage() is None
+    iterator.close()
+
+    json = profiler.report().to_json()
+    assert {stats["stage"] for stats in json["stages"]} == {"inner", "outer", "frames"}
+
+    profiler.clear()
+    assert profiler.report().stages == ()
+
+
+def test_profiled_render():
+    from blooper.caches import LRUCache
+    from blooper.filetypes import UsageMetadata
+    from blooper.instruments import Sampler, Synthesizer
+    from blooper.mixers import Mixer
+    from blooper.notes import Note
+    from blooper.parts import Part
+    from blooper.pitch import A440, Chord, Pitch
+    from blooper.profiling import Profiler
+    from blooper.wavs import record
+
+    a4 = Pitch(4, "A")
+    part = Part([[Note.new(Fraction(1, 4), Chord(a4, Pitch(5, "A")))] * 4] * 2)
+    mixer = Mixer.even(
+        (Synthesizer("saw", note_cache=None), part),
+        (Synthesizer("square", note_cache=None), part),
+    )
+
+    with TemporaryDirectory() as directory_name:
+        directory = Path(directory_name)
+        expected = directory / "expected.wav"
+        path = directory / "profiled.wav"
+
+        record(expected, mixer, sample_rate=1_000)
+
+        profiler = Profiler()
+        record(path, mixer, sample_rate=1_000, profiler=profiler)
+
+        # profiling doesn't change what's rendered
+        assert path.read_bytes() == expected.read_bytes()
+
+        frames = mixer.frame_count(1_000)
+        report = profiler.report()
+
+        assert report.instruments == ("0:Synthesizer", "1:Synthesizer")
+        assert report.stage("wavs.record").frames == frames
+        assert report.stage("wavs.write").frames == frames
+        assert report.stage("wavs.encode").frames == frames
+        assert report.stage("Mixer.mix").frames == frames
+        assert report.stage("Instrument.render").frames == frames * 2
+        assert report.stage("Part.tones").calls == 2
+
+        # each tone renders two waves
+        envelopes = report.stage("Envelope.render")
+        assert envelopes.calls == 16
+        waves = report.stage("Waveform.samples")
+        assert waves.frames >= 2 * envelopes.frames
+
+        for stats in report.stages:
+            if stats.stage.startswith(("Envelope", "Waveform", "Part")):
+                assert stats.instrument is not None
+
+        assert report.stage("wavs.record").seconds >= report.stage("Mixer.mix").seconds
+
+        # samplers
+        sample = directory / "a4.wav"
+        record(
+            sample,
+            Mixer.solo(Synthesizer(), Part([[Note.new(Fraction(1), a4)]])),
+            sample_rate=1_000,
+        )
+        samples = {sample: UsageMetadata(A440.pitch_to_frequency(a4))}
+        part = Part([[Note.new(Fraction(1, 4), a4)] * 4])
+
+        for note_cache in (None, LRUCache(1024 * 1024)):
+            sampler = Sampler(samples, note_cache=note_cache)
+            profiler = Profiler()
+
+            mixed = list(
+                Mixer.solo(sampler, part).mix(1_000, 2, 1_000, profiler=profiler)
+            )
+
+            report = profiler.report()
+            assert report.instruments == ("0:Sampler",)
+            assert report.stage("Mixer.mix").frames == len(mixed)
+            assert report.stage("Sampler.compatible_samples").calls == 4
+            assert report.stage("SampleFile.load").frames > 0
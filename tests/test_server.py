@@ -0,0 +1,111 @@
+import json
+from http.client import HTTPConnection
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Thread
+
+
+def test_server():
+    from blooper.cli import build_mixer
+    from blooper.server import JobParser, make_server
+    from blooper.wavs import HEADER_SIZE, stream
+
+    class Buffer:
+        def __init__(self):
+            self.data = bytearray()
+
+        def write(self, data: bytes) -> int:
+            self.data.extend(data)
+            return len(data)
+
+    args = ["--notes", "a3", "-", "c4", "--wave", "saw", "--tempo", "240"]
+    expected = Buffer()
+    stream(expected, build_mixer(JobParser().parse_args(args)), sample_rate=1_000)
+
+    server = make_server("127.0.0.1", 0)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        connection = HTTPConnection(*server.server_address)
+
+        def request(method: str, path: str, body=None):
+            connection.request(
+                method, path, None if body is None else json.dumps(body).encode()
+            )
+            response = connection.getresponse()
+            return response.status, response.getheader("Content-Type"), response.read()
+
+        for _ in range(2):
+            status, content_type, data = request(
+                "POST", "/render", {"args": args, "sample_rate": 1_000}
+            )
+            assert status == 200
+            assert content_type == "audio/wav"
+            assert data == expected.data
+
+        # the second job reused the first job's mix
+        status, _, data = request("GET", "/status")
+        assert status == 200
+        caches = json.loads(data)["caches"]
+        assert caches["mixers"]["hits"] == 1
+        assert caches["mixers"]["misses"] == 1
+        assert {"notes", "samples", "wavetables"} <= caches.keys()
+
+        status, content_type, data = request("GET", "/metrics")
+        assert status == 200
+        assert content_type.startswith("text/plain")
+        assert b'blooper_cache_hits_total{cache="notes"}' in data
+        assert b"blooper_bytes_written_total " in data
+
+        for body in (
+            {"args": "--notes a3"},
+            {"args": ["--notes", "q9"]},
+            {"args": ["--wave", "saw"]},
+            {"args": ["--notes", "a3"], "bits_per_sample": 7},
+            {"args": ["--notes", "a3"], "channels": 3},
+            ["--notes", "a3"],
+        ):
+            status, content_type, data = request("POST", "/render", body)
+            assert status == 400
+            assert content_type == "application/json"
+            assert "error" in json.loads(data)
+
+        assert request("GET", "/render")[0] == 404
+        assert request("POST", "/status", {})[0] == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # servers can also listen on Unix sockets
+    with TemporaryDirectory() as directory_name:
+        path = Path(directory_name) / "blooper.sock"
+        server = make_server(socket_path=path)
+        thread = Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        try:
+            import socket
+
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.connect(str(path))
+                body = json.dumps({"args": args, "sample_rate": 1_000}).encode()
+                client.sendall(
+                    b"POST /render HTTP/1.1\r\nHost: local\r\nConnection: close\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                    + body
+                )
+
+                response = bytearray()
+                while chunk := client.recv(65_536):
+                    response.extend(chunk)
+
+            headers, data = bytes(response).split(b"\r\n\r\n", 1)
+            assert headers.startswith(b"HTTP/1.1 200")
+            assert data == expected.data
+            assert len(data) > HEADER_SIZE
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert not path.exists()
@@ -0,0 +1,142 @@
+from fractions import Fraction
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+
+def test_render_session():
+    from blooper.filetypes import UsageMetadata
+    from blooper.instruments import Sampler, Synthesizer
+    from blooper.mixers import Mixer
+    from blooper.notes import Dynamic, Note, Rest
+    from blooper.parts import Measure, Part
+    from blooper.pitch import A440, Pitch
+    from blooper.sessions import RenderSession
+    from blooper.wavs import HEADER_SIZE, record
+
+    quarter = Fraction(1, 4)
+
+    def measure(name: str, dynamic=None) -> Measure:
+        return Measure(
+            [
+                Note.new(quarter, Pitch(4, name), dynamic),
+                Note.new(quarter, Pitch(4, "C")),
+                Note.new(quarter, Pitch(4, "E")),
+                Rest(quarter),
+            ]
+        )
+
+    melody = Part([measure(name) for name in "ABCDEFGA"])
+    bass = Part([[Note.new(Fraction(1, 2), Pitch(3, "A")), Rest(Fraction(1, 2))]] * 8)
+    saw = Synthesizer("saw")
+    mixer = Mixer.even((saw, melody), (Synthesizer("square"), bass))
+
+    boundaries = melody.measure_boundaries(1_000)
+    block_align = 2 * 32 // 8
+
+    with TemporaryDirectory() as directory_name:
+        directory = Path(directory_name)
+        path = directory / "session.wav"
+        expected = directory / "record.wav"
+
+        def matches() -> bool:
+            record(expected, mixer, sample_rate=1_000)
+
+            return path.read_bytes() == expected.read_bytes()
+
+        with RenderSession(path, mixer, sample_rate=1_000) as session:
+            frames = session.render()
+            assert frames == [(0, (path.stat().st_size - HEADER_SIZE) // block_align)]
+            assert matches()
+
+            # nothing changed
+            assert session.render() == []
+
+            # only the edited measure (and the tone playing into it) is
+            # rendered again. Nothing carries over the following rest
+            melody.measures[3] = measure("D", Dynamic.from_name("piano"))
+            assert session.render() == [(boundaries[3] - 1_000, boundaries[4])]
+            assert matches()
+
+            # changing a pitch changes where later waves are in their
+            # cycles, so everything after it is rendered again
+            melody.measures[5] = measure("C")
+            assert session.render() == [(boundaries[5] - 1_000, frames[0][1])]
+            assert matches()
+
+            assert session.render(full=True) == frames
+            assert matches()
+
+            # parts can get longer or shorter
+            bass.measures.append(Measure([Note.new(Fraction(1), Pitch(3, "A"))]))
+            # (the last bass note now lasts until the new one)
+            ((start, end),) = session.render()
+            assert start == boundaries[-2] - 2_000
+            assert end > frames[0][1]
+            assert matches()
+
+            del bass.measures[-1]
+            del melody.measures[-1]
+            ((start, end),) = session.render()
+            assert start == boundaries[-3] - 1_000
+            assert matches()
+
+            # setting an instrument's attribute re-renders its part
+            saw.balance = 0.5
+            ((start, end),) = session.render()
+            assert start == 0
+            assert matches()
+
+            # changing volumes or instruments re-mixes everything
+            mixer = Mixer(mixer.instruments, mixer.parts, (0.25, 0.25))
+            ((start, end),) = session.render(mixer)
+            assert start == 0
+            assert matches()
+
+            mixer = Mixer(
+                (Synthesizer("sine"), mixer.instruments[1]), mixer.parts, mixer.volumes
+            )
+            ((start, end),) = session.render(mixer)
+            assert start == 0
+            assert matches()
+
+        assert not session.directory.exists()
+
+        # signals can be kept between sessions
+        signals = directory / "signals"
+        signals.mkdir()
+        with RenderSession(
+            path, mixer, sample_rate=1_000, directory=signals
+        ) as session:
+            session.render()
+
+        assert sorted(signals.iterdir()) == [signals / "0.raw", signals / "1.raw"]
+
+        # samplers only carry volumes between tones, so a new pitch only
+        # changes its own tone
+        samples = {}
+        for name in "ABCDEFG":
+            sample = directory / f"{name}.wav"
+            record(
+                sample,
+                Mixer.solo(
+                    Synthesizer("sine"), Part([[Note.new(quarter, Pitch(4, name))]])
+                ),
+                channels=1,
+                sample_rate=1_000,
+            )
+            samples[sample] = UsageMetadata(A440.pitch_to_frequency(Pitch(4, name)))
+
+        tune = Part([measure(name) for name in "ABCDEFGA"])
+        mixer = Mixer.solo(Sampler(samples), tune)
+
+        with RenderSession(path, mixer, sample_rate=1_000) as session:
+            session.render()
+            assert matches()
+
+            tune.measures[3] = measure("D", Dynamic.from_name("piano"))
+            assert session.render() == [(boundaries[3] - 1_000, boundaries[4])]
+            assert matches()
+
+            tune.measures[5] = measure("C")
+            assert session.render() == [(boundaries[5] - 1_000, boundaries[6])]
+            assert matches()
@@ -1,3 +1,6 @@
+import pytest
+
+
 def test_waves():
     from blooper.waveforms import saw_wave, sine_wave, square_wave, triangle_wave
 
@@ -113,3 +116,104 @@ def test_waveform():
     assert square.phase == 7 / 15
     assert square.sample() == -1
     assert square.phase == 8 / 15
+
+
+def test_block_waves():
+    from blooper.waveforms import (
+        saw_wave,
+        saw_waves,
+        sine_wave,
+        sine_waves,
+        square_wave,
+        square_waves,
+        triangle_wave,
+        triangle_waves,
+    )
+
+    phases = [index / 24 for index in range(-30, 60)] + [0.1234, 5.4321, -7.77]
+
+    for wave, waves in (
+        (sine_wave, sine_waves),
+        (square_wave, square_waves),
+        (saw_wave, saw_waves),
+        (triangle_wave, triangle_waves),
+    ):
+        assert list(waves(phases)) == [wave(phase) for phase in phases]
+        assert list(waves([])) == []
+
+
+def test_waveform_samples():
+    from blooper.waveforms import Waveform
+
+    sine = Waveform(400, 1600)
+    assert list(sine.samples(0)) == []
+    assert sine.phase is None
+    assert list(sine.samples(5)) == [0, 1, 0, -1, 0]
+    assert sine.phase == 0
+    assert list(sine.samples(2)) == [1, 0]
+    assert sine.phase == 1 / 2
+
+    # matches sampling one at a time, including the phase it ends on
+    for wave in ("sine", "square", "saw", "triangle", lambda phase: phase % 1):
+        for phase in (None, 0.3):
+            single = Waveform(441, 10_000, wave=wave, phase=phase)
+            block = Waveform(441, 10_000, wave=wave, phase=phase)
+
+            expected = [single.sample() for _ in range(1_000)]
+            assert list(block.samples(300)) + list(block.samples(700)) == expected
+            assert block.phase == single.phase
+            assert block.sample() == single.sample()
+
+            # skipping ends up in the same place as sampling
+            skipped = Waveform(441, 10_000, wave=wave, phase=phase)
+            skipped.skip(1_001)
+            assert skipped.phase == single.phase
+            assert list(skipped.samples(10)) == list(single.samples(10))
+
+
+def test_wavetable():
+    from blooper.caches import WAVETABLE_CACHE
+    from blooper.waveforms import Waveform, sine_wave, square_wave, wavetable
+
+    with pytest.raises(ValueError):
+        wavetable(sine_wave, 0)
+
+    values, deltas = wavetable(square_wave, 4)
+    assert list(values) == [1, 1, -1, -1, 1]
+    assert list(deltas) == [0, -2, 0, 2, 0]
+
+    # tables are only sampled once per size
+    calls = []
+
+    def ramp(phase):
+        calls.append(phase)
+        return phase
+
+    assert wavetable(ramp, 8) is wavetable(ramp, 8)
+    assert len(calls) == 8
+    assert (ramp, 8) in WAVETABLE_CACHE
+
+    wavetable(ramp, 16)
+    assert len(calls) == 24
+
+    # values between entries are interpolated
+    wave = Waveform(1, 5, wave=ramp, table_size=8)
+    assert [wave.sample() for _ in range(6)] == [0, 0.2, 0.4, 0.6, 0.8, 0]
+    assert len(calls) == 24
+
+    # the phase wraps back around to the start of the table
+    wave = Waveform(1, 8, wave=ramp, table_size=4)
+    assert list(wave.samples(9)) == [0, 0.125, 0.25, 0.375, 0.5, 0.625, 0.75, 0.375, 0]
+
+    # tables closely match the functions they sample, and don't change
+    # where the phase ends up
+    for name in ("sine", "square", "saw", "triangle"):
+        exact = Waveform(440, 44_100, wave=name, phase=0.3)
+        table = Waveform(440, 44_100, wave=name, phase=0.3, table_size=4_096)
+        errors = [
+            abs(a - b) for a, b in zip(table.samples(1_000), exact.samples(1_000))
+        ]
+
+        # (discontinuities get smoothed out a little)
+        assert sum(errors) / len(errors) < 1e-2
+        assert table.phase == exact.phase
@@ -1,4 +1,5 @@
 import struct
+from array import array
 from pathlib import Path
 from tempfile import TemporaryDirectory
 from typing import Generator, Iterable
@@ -175,8 +176,133 @@ def test_record():
         # declared size + 2 uncounted header values
         assert len(stereo.read_bytes()) == 44 + data_length
 
+        # writing in chunks shouldn't change the output
+        chunked = temp / "chunked.wav"
+        for chunk_size in (1, 3):
+            record(
+                chunked,
+                MockMixer([[1, -1], [0, 0.5]]),
+                channels=2,
+                bits_per_sample=32,
+                chunk_size=chunk_size,
+            )
+            assert chunked.read_bytes() == stereo.read_bytes()
+
+
+def test_record_blocks():
+    from fractions import Fraction
+
+    from blooper.instruments import Synthesizer
+    from blooper.mixers import Mixer
+    from blooper.notes import Note
+    from blooper.parts import Part
+    from blooper.pitch import Pitch
+    from blooper.wavs import record
+
+    part = Part([[Note.new(Fraction(1, 4), Pitch(4, "A"))] * 4])
+    mixer = Mixer.even((Synthesizer("saw"), part), (Synthesizer("square"), part))
+
+    # a mixer that can only produce individual frames
+    class FrameMixer:
+        def mix(self, sample_rate, channels, max_value):
+            return mixer.mix(sample_rate, channels, max_value)
+
+    with TemporaryDirectory() as directory_name:
+        temp = Path(directory_name)
+
+        for bits_per_sample in (16, 32, 64):
+            for channels in (1, 2):
+                expected = temp / "expected.wav"
+                record(
+                    expected,
+                    FrameMixer(),
+                    channels=channels,
+                    sample_rate=1000,
+                    bits_per_sample=bits_per_sample,
+                )
+
+                for chunk_size in (1, 7, 100_000):
+                    blocks = temp / "blocks.wav"
+                    record(
+                        blocks,
+                        mixer,
+                        channels=channels,
+                        sample_rate=1000,
+                        bits_per_sample=bits_per_sample,
+                        chunk_size=chunk_size,
+                    )
+
+                    assert blocks.read_bytes() == expected.read_bytes()
+
+
+def test_stream():
+    from fractions import Fraction
+
+    from blooper.instruments import Synthesizer
+    from blooper.mixers import Mixer
+    from blooper.notes import Note, Rest
+    from blooper.parts import Part
+    from blooper.pitch import Pitch
+    from blooper.wavs import HEADER_SIZE, UNKNOWN_SIZE, record, stream
+
+    # a pipe: can be written to but not seeked or read
+    class Pipe:
+        def __init__(self):
+            self.data = bytearray()
+
+        def write(self, data: bytes) -> int:
+            self.data.extend(data)
+            return len(data)
+
+    part = Part(
+        [
+            [Rest(Fraction(1, 4)), Note.new(Fraction(1, 4), Pitch(4, "A"))] * 2,
+            [Note.new(Fraction(1, 2), Pitch(4, "C")), Rest(Fraction(1, 2))],
+        ]
+    )
+    mixer = Mixer.even((Synthesizer("saw"), part), (Synthesizer("square"), part))
+
+    with TemporaryDirectory() as directory_name:
+        path = Path(directory_name) / "expected.wav"
+
+        for bits_per_sample in (16, 32):
+            for channels in (1, 2):
+                record(
+                    path,
+                    mixer,
+                    channels=channels,
+                    sample_rate=1000,
+                    bits_per_sample=bits_per_sample,
+                )
+                expected = path.read_bytes()
+
+                pipe = Pipe()
+                frames = stream(
+                    pipe,
+                    mixer,
+                    channels=channels,
+                    sample_rate=1000,
+                    bits_per_sample=bits_per_sample,
+                    chunk_size=7,
+                )
+                assert bytes(pipe.data) == expected
+                assert frames == (len(expected) - HEADER_SIZE) // (
+                    channels * bits_per_sample // 8
+                )
+
+    # the length can't be known without the mixer's parts
+    pipe = Pipe()
+    assert stream(pipe, MockMixer([[1], [-1], [0]]), channels=1) is None
+    assert len(pipe.data) == HEADER_SIZE + 3 * 4
+    assert pipe.data[:4] == b"RIFF"
+    assert struct.unpack("<I", pipe.data[4:8]) == (UNKNOWN_SIZE,)
+    assert pipe.data[36:40] == b"data"
+    assert struct.unpack("<I", pipe.data[40:44]) == (UNKNOWN_SIZE,)
+    assert array("i", pipe.data[44:]).tolist() == [2 ** 31 - 1, -(2 ** 31 - 1), 0]
+
 
 def test_wav_sample():
+    from blooper.caches import SAMPLE_CACHE
     from blooper.filetypes import UsageMetadata
     from blooper.wavs import WavSample, record
 
@@ -262,6 +388,78 @@ def test_wav_sample():
         with pytest.raises(ValueError):
             print(round_samples(sample.load(200, [1, 1], loop=True)))
 
+        with pytest.raises(ValueError):
+            sample.render(200, [1, 1], loop=True)
+
+        # rendering all at once matches loading
+        for sample_rate in (100, 50, 20, 25):
+            for loop in (False, True):
+                for length in (0, 1, 3, 6, 20):
+                    volumes = [0.5 + (index / 10) for index in range(length)]
+                    rendered = sample.render(sample_rate, volumes, loop=loop)
+
+                    assert isinstance(rendered, array)
+                    assert list(rendered) == [
+                        value
+                        for frame in sample.load(sample_rate, volumes, loop=loop)
+                        for value in frame
+                    ]
+
+        # decoded samples are shared between all copies of a file
+        SAMPLE_CACHE.clear()
+        copy = WavSample.from_path(path, metadata=metadata)
+        first = sample.render(50, [1, 1, 1])
+        assert SAMPLE_CACHE.stats().misses == 1
+        assert copy.render(50, [1, 1, 1]) == first
+        assert SAMPLE_CACHE.stats().hits == 1
+        assert SAMPLE_CACHE.stats().entries == 1
+
+        # loops and sample rates are cached separately
+        copy.render(50, [1, 1, 1], loop=True)
+        copy.render(25, [1, 1, 1])
+        assert SAMPLE_CACHE.stats().entries == 3
+
+        # 64-bit sums are exact
+        maximum = (2 ** 63) - 1
+        record(
+            path,
+            MockMixer([[1], [1], [-1], [1], [1]]),
+            channels=1,
+            sample_rate=4,
+            bits_per_sample=64,
+        )
+        # changing the file means it gets decoded again
+        misses = SAMPLE_CACHE.stats().misses
+        sample = WavSample.from_path(path, metadata=metadata)
+        assert list(sample.render(2, [1, 1, 1])) == [
+            1.0,
+            0 / 2 / maximum,
+            maximum / 1 / maximum,
+        ]
+        assert list(sample.render(2, [1, 1, 1, 1], loop=True)) == [
+            1.0,
+            0 / 2 / maximum,
+            2 * maximum / 2 / maximum,
+            0 / 2 / maximum,
+        ]
+        assert SAMPLE_CACHE.stats().misses == misses + 2
+
+        # the header is read again too, even if another sample decoded
+        # the changed file first
+        record(
+            path,
+            MockMixer([[0.5, -0.5], [1, 1], [0, 0.25]]),
+            channels=2,
+            sample_rate=8,
+            bits_per_sample=16,
+        )
+        changed = WavSample.from_path(path, metadata=metadata)
+        expected = changed.render(4, [1, 1])
+        assert changed.channels == 2
+        assert sample.render(4, [1, 1]) == expected
+        assert sample.channels == 2
+        assert sample.sample_rate == 8
+
         # Some invalid files (love to test for coverage)
         with pytest.raises(ValueError):
             WavSample.from_path(Path(__file__), metadata=metadata).channels